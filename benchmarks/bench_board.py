@@ -0,0 +1,69 @@
+"""
+Benchmark of the template render time of the game page.
+
+It renders "mouse_cat/game.html" as 'show_game' does, once with the board
+fragment cache emptied before every render (every position drawn for the
+first time) and once with the fragment already cached. No database is
+needed:
+
+    python benchmarks/bench_board.py [n_iterations]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ratonGato.settings')
+os.environ.setdefault('SQLITE', '1')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.cache import cache  # noqa: E402
+from django.template.loader import render_to_string  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+
+from datamodel.models import Game, GameStatus  # noqa: E402
+from logic.forms import MoveForm  # noqa: E402
+from logic.views import board_context  # noqa: E402
+
+
+def build_request(game):
+    request = RequestFactory().get('/mouse_cat/show_game')
+    request.user = game.cat_user
+    request.session = {}
+    return request
+
+
+def render(request, game):
+    context_dict = board_context(game.position)
+    context_dict.update({'game': game, 'move_form': MoveForm()})
+    return render_to_string("mouse_cat/game.html", context_dict, request)
+
+
+def main(n_iterations):
+    game = Game(id=1, cat_user=User(id=1, username='cat'),
+                mouse_user=User(id=2, username='mouse'),
+                status=GameStatus.ACTIVE, cat1=9, mouse=50)
+    request = build_request(game)
+
+    def uncached():
+        cache.clear()
+        render(request, game)
+
+    def cached():
+        render(request, game)
+
+    assert '<table id="chess_board">' in render(request, game)
+    results = [('board rendered', uncached), ('board from cache', cached)]
+    print('%d renders of "mouse_cat/game.html"' % n_iterations)
+    for name, function in results:
+        seconds = min(timeit.repeat(function, number=n_iterations, repeat=3))
+        print('%-20s %8.1f us/request' % (name, seconds / n_iterations * 1e6))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,61 @@
+"""
+Microbenchmark of the per-move validation cost.
+
+It compares the list based rules that 'Move.save' and 'Game.save' used to run
+(kept as a reference in 'datamodel.legacy_rules') with the bitboard rules in
+'datamodel.rules'. No database is needed:
+
+    python benchmarks/bench_rules.py [n_iterations]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datamodel import rules  # noqa: E402
+from datamodel.legacy_rules import legacy_validate  # noqa: E402
+
+# (cats, mouse, cat_turn, origin, target)
+SAMPLE_MOVES = [
+    ([0, 2, 4, 6], 59, True, 0, 9),
+    ([9, 2, 4, 6], 59, False, 59, 50),
+    ([9, 11, 4, 6], 50, True, 4, 13),
+    ([9, 11, 13, 6], 50, False, 50, 43),
+    ([9, 11, 13, 6], 43, True, 6, 15),
+    ([16, 11, 13, 6], 43, False, 43, 34),
+    ([16, 11, 13, 6], 34, True, 1, 8),
+    ([16, 11, 13, 6], 34, False, 34, 13),
+]
+
+
+def bitboard_validate(cats, mouse, cat_turn, origin, target):
+    position = rules.Position(tuple(cats), mouse, cat_turn)
+    return (rules.is_legal(position, origin, target),
+            rules.is_terminal(position))
+
+
+def run_all(validate):
+    for move in SAMPLE_MOVES:
+        validate(*move)
+
+
+def main(n_iterations):
+    for move in SAMPLE_MOVES:
+        assert legacy_validate(*move) == bitboard_validate(*move), move
+
+    n_moves = n_iterations * len(SAMPLE_MOVES)
+    results = {}
+    for name, validate in (('legacy lists', legacy_validate),
+                           ('bitboard', bitboard_validate)):
+        elapsed = min(timeit.repeat(lambda: run_all(validate),
+                                    number=n_iterations, repeat=5))
+        results[name] = elapsed / n_moves * 1e6
+        print('%-14s %8.3f us/move' % (name, results[name]))
+    print('speed-up       %8.2fx' % (results['legacy lists'] /
+                                     results['bitboard']))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,174 @@
+"""
+Cold storage of the moves of finished games.
+
+Finished games never change, so archive_finished packs their moves into
+two columns of the game and deletes their Move and Keyframe rows:
+Game.move_log, one byte per ply (see rules.pack_move), and
+Game.move_dates, the dates of the moves in milliseconds, as differences
+with the previous one (the first one with EPOCH) in zigzag varints, one or
+a few bytes each. Game.moves, get_move and position_at rebuild the moves of
+archived games from them, so replays work the same.
+"""
+
+import datetime
+from collections import defaultdict
+
+from django.db import transaction
+
+from datamodel import game_cache, rules
+
+EPOCH = datetime.datetime(1970, 1, 1)
+MILLISECOND = datetime.timedelta(milliseconds=1)
+
+
+def pack_dates(dates):
+    """
+    pack_dates
+    ----------
+    Input parameters:
+        dates: list of datetimes
+    ----------
+    Returns:
+        bytes with the millisecond differences of every date with the
+        previous one as zigzag varints: 7 bits a byte, the high bit set in
+        all the bytes of a number but the last one
+    """
+    packed = bytearray()
+    previous = 0
+    for date in dates:
+        milliseconds = (date - EPOCH) // MILLISECOND
+        delta = milliseconds - previous
+        previous = milliseconds
+        # Zigzag: small negative numbers stay small
+        value = delta * 2 if delta >= 0 else -delta * 2 - 1
+        while value >= 0x80:
+            packed.append(value & 0x7f | 0x80)
+            value >>= 7
+        packed.append(value)
+    return bytes(packed)
+
+
+def unpack_dates(packed):
+    """
+    unpack_dates
+    ----------
+    Input parameters:
+        packed: bytes built by pack_dates
+    ----------
+    Returns:
+        List of datetimes, to the millisecond
+    """
+    dates = []
+    milliseconds = value = shift = 0
+    for byte in packed:
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if byte & 0x80:
+            continue
+        milliseconds += value >> 1 if not value & 1 else -(value >> 1) - 1
+        dates.append(EPOCH + milliseconds * MILLISECOND)
+        value = shift = 0
+    return dates
+
+
+class ArchivedMoves(list):
+    '''
+    Moves of an archived game as unsaved Move instances, by ply, with the
+    count() and values_list() of the queryset Game.moves returns for the
+    other games
+    '''
+    def count(self):
+        return len(self)
+
+    def values_list(self, *fields, flat=False):
+        if flat:
+            return [getattr(move, fields[0]) for move in self]
+        return [tuple(getattr(move, field) for field in fields)
+                for move in self]
+
+
+def archived_moves(game):
+    """
+    archived_moves
+    ----------
+    Input parameters:
+        game: archived Game
+    ----------
+    Returns:
+        ArchivedMoves of the game. The cats move on the odd plies if they
+        move after the last one in an even number of plies, and the other
+        way round
+    """
+    from datamodel.models import Move
+
+    moves = rules.unpack_moves(bytes(game.move_log))
+    dates = unpack_dates(bytes(game.move_dates or b''))
+    cats_first = game.cat_turn == (len(moves) % 2 == 0)
+    result = ArchivedMoves()
+    for ply, (origin, target) in enumerate(moves, 1):
+        cats_move = cats_first == (ply % 2 == 1)
+        result.append(Move(
+            game=game, origin=origin, target=target, ply=ply,
+            player_id=game.cat_user_id if cats_move else game.mouse_user_id,
+            date=dates[ply - 1] if ply <= len(dates) else None))
+    return result
+
+
+def archive_finished(batch_size=100, after=0):
+    """
+    archive_finished
+    ----------
+    Input parameters:
+        batch_size: games archived per transaction
+        after: only the games with a greater ID are archived
+    ----------
+    Returns:
+        Generator yielding, after every batch, a tuple (games, moves,
+        skipped) with the games archived, the Move rows deleted and the
+        games skipped because their moves do not add up to their plies
+    ----------
+    Description:
+        Goes over the finished games not archived yet, by ID. The games of
+        every batch are packed and their Move and Keyframe rows deleted in
+        one transaction. Every game gets a new version, so the copies of
+        the game cache are replaced by the archived game.
+    """
+    from datamodel.models import Game, GameStatus, Keyframe, Move
+
+    while True:
+        with transaction.atomic():
+            games = list(Game.objects.select_related(*game_cache.USERS).
+                         filter(status=GameStatus.FINISHED,
+                                move_log__isnull=True, id__gt=after).
+                         order_by('id')[:batch_size])
+            if not games:
+                return
+            after = games[-1].id
+            moves = defaultdict(list)
+            for game_id, origin, target, date in Move.objects.filter(
+                    game_id__in=[game.id for game in games]).\
+                    order_by('game_id', 'ply').values_list(
+                        'game_id', 'origin', 'target', 'date'):
+                moves[game_id].append((origin, target, date))
+
+            archived, skipped = [], 0
+            for game in games:
+                game_moves = moves[game.id]
+                if len(game_moves) != game.ply:
+                    skipped += 1
+                    continue
+                move_log = rules.pack_moves((origin, target) for origin,
+                                            target, _ in game_moves)
+                move_dates = pack_dates([date for _, _, date in game_moves])
+                updated = Game.objects.filter(
+                    id=game.id, version=game.version).update(
+                        move_log=move_log, move_dates=move_dates,
+                        version=game.version + 1)
+                if updated:
+                    game.move_log, game.move_dates = move_log, move_dates
+                    game.version += 1
+                    game_cache.store(game)
+                    archived.append(game.id)
+            n_moves = Move.objects.filter(game_id__in=archived).delete()[0]
+            Keyframe.objects.filter(game_id__in=archived).delete()
+        yield len(archived), n_moves, skipped
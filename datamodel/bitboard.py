@@ -0,0 +1,150 @@
+"""
+Bitboard representation of the mouse & cat board.
+
+A set of cells is stored as a 64-bit integer mask where bit ``n`` stands for
+cell ``n`` (row ``n // 8``, column ``n % 8``). Per-cell move masks for each
+role are computed once at import time, so validating a move or checking the
+end of a game is reduced to a few bitwise operations.
+"""
+
+WIDTH = 8
+N_CELLS = WIDTH * WIDTH
+FULL_BOARD = (1 << N_CELLS) - 1
+
+# (row, column) increments of every piece. Cats only move forward (SE, SW),
+# the mouse moves in any diagonal direction (SE, SW, NW, NE)
+CAT_STEPS = ((1, 1), (1, -1))
+MOUSE_STEPS = CAT_STEPS + ((-1, -1), (-1, 1))
+
+
+def _targets_mask(cell, steps):
+    row, col = divmod(cell, WIDTH)
+    mask = 0
+    for d_row, d_col in steps:
+        t_row, t_col = row + d_row, col + d_col
+        if 0 <= t_row < WIDTH and 0 <= t_col < WIDTH:
+            mask |= 1 << (t_row * WIDTH + t_col)
+    return mask
+
+
+# CAT_MOVES[cell] / MOUSE_MOVES[cell]: cells reachable from 'cell' in one move
+CAT_MOVES = tuple(_targets_mask(cell, CAT_STEPS) for cell in range(N_CELLS))
+MOUSE_MOVES = tuple(_targets_mask(cell, MOUSE_STEPS)
+                    for cell in range(N_CELLS))
+
+
+def on_board(cell):
+    """
+    on_board
+    ----------
+    Input parameters:
+        cell: cell index
+    ----------
+    Returns:
+        True if the cell lies inside the board, False otherwise
+    """
+    return 0 <= cell < N_CELLS
+
+
+def cells_to_mask(cells):
+    """
+    cells_to_mask
+    ----------
+    Input parameters:
+        cells: iterable of cell indexes
+    ----------
+    Returns:
+        Bitboard with the bit of every cell in 'cells' set
+    """
+    mask = 0
+    for cell in cells:
+        mask |= 1 << cell
+    return mask
+
+
+def cat_move_is_valid(cats, mouse, origin, target):
+    """
+    cat_move_is_valid
+    ----------
+    Input parameters:
+        cats: bitboard of the cats
+        mouse: bitboard of the mouse
+        origin: cell the cat moves from
+        target: cell the cat moves to
+    ----------
+    Returns:
+        True if one of the cats can move from origin to target
+    """
+    if not (on_board(origin) and on_board(target)):
+        return False
+    if not cats & 1 << origin:
+        return False
+    return bool(CAT_MOVES[origin] & ~(cats | mouse) & 1 << target)
+
+
+def mouse_move_is_valid(cats, mouse, origin, target):
+    """
+    mouse_move_is_valid
+    ----------
+    Input parameters:
+        cats: bitboard of the cats
+        mouse: bitboard of the mouse
+        origin: cell the mouse moves from
+        target: cell the mouse moves to
+    ----------
+    Returns:
+        True if the mouse can move from origin to target
+    """
+    if not (on_board(origin) and on_board(target)):
+        return False
+    if mouse != 1 << origin:
+        return False
+    return bool(MOUSE_MOVES[origin] & ~cats & 1 << target)
+
+
+def mouse_escaped(cats, mouse_cell):
+    """
+    mouse_escaped
+    ----------
+    Input parameters:
+        cats: bitboard of the cats
+        mouse_cell: cell of the mouse
+    ----------
+    Returns:
+        True if the mouse is on the same row as the most advanced cat or
+        above it, i.e. no cat can reach it anymore
+    """
+    first_cat = (cats & -cats).bit_length() - 1
+    return mouse_cell // WIDTH <= first_cat // WIDTH
+
+
+def mouse_trapped(cats, mouse_cell):
+    """
+    mouse_trapped
+    ----------
+    Input parameters:
+        cats: bitboard of the cats
+        mouse_cell: cell of the mouse
+    ----------
+    Returns:
+        True if the mouse has no cell to move to
+    """
+    if not on_board(mouse_cell):
+        return False
+    return not MOUSE_MOVES[mouse_cell] & ~cats
+
+
+def iter_cells(mask):
+    """
+    iter_cells
+    ----------
+    Input parameters:
+        mask: bitboard
+    ----------
+    Returns:
+        Generator of the cells set in 'mask', in increasing order
+    """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
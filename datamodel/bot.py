@@ -0,0 +1,79 @@
+"""
+Computer opponent.
+
+The bot is a user named settings.BOT_USERNAME that can take either side of
+a game. It has no usable password, which no person signing up can have, so
+somebody who took the name before it was reserved (see migration 0014 and
+SignupForm) is never played for. Its moves are looked up in the tablebase,
+if it has been built, or searched by datamodel.engine. They are committed
+as any other Move, so they are validated, versioned, cached and published
+to the watchers of the game like the moves of people.
+"""
+
+from django.conf import settings
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX, make_password
+from django.contrib.auth.models import User
+
+from datamodel import engine, rules, tablebase
+from datamodel.models import GameStatus, Move
+
+
+def get_user():
+    """
+    get_user
+    ----------
+    Returns:
+        User of the bot, created (without a usable password, so nobody can
+        log in as the bot) if it is missing, or None if a person has its
+        username
+    """
+    user, _ = User.objects.get_or_create(
+        username=settings.BOT_USERNAME,
+        defaults={'password': make_password(None)})
+    if user.has_usable_password():
+        return None
+    return user
+
+
+def is_bot(user):
+    '''
+    Whether 'user' is the bot. Users of cached games have no password, so
+    the password of the bot is checked in the database
+    '''
+    if user is None or user.username != settings.BOT_USERNAME:
+        return False
+    return User.objects.filter(
+        id=user.id, password__startswith=UNUSABLE_PASSWORD_PREFIX).exists()
+
+
+def play(game):
+    """
+    play
+    ----------
+    Input parameters:
+        game: Game with the bot as one of its players
+    ----------
+    Returns:
+        The Move of the bot, or None if it is not the turn of the bot
+    ----------
+    Raises:
+        ValidationError if the move cannot be saved, as Move.save
+    """
+    if game.status != GameStatus.ACTIVE:
+        return None
+    position = game.position
+    if position.side_to_move == rules.CAT:
+        player = game.cat_user
+    else:
+        player = game.mouse_user
+    if not is_bot(player):
+        return None
+    table = tablebase.get()
+    found = table.best_move(position) if table else None
+    if found is None:
+        found = engine.best_move(position, settings.BOT_MOVE_SECONDS)
+    if found is None:
+        return None
+    origin, target = found
+    return Move.objects.create(origin=origin, target=target, game=game,
+                               player=player)
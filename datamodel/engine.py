@@ -0,0 +1,266 @@
+"""
+Computer player for either side of the mouse & cat game.
+
+best_move runs an iterative deepening alpha-beta (negamax) search over
+'datamodel.rules' within a time budget. Positions are identified by a
+Zobrist hash, updated incrementally on every move, and the results of the
+search are kept in a transposition table shared by the searches of the
+process, so the bot reuses its previous analysis on the next move.
+"""
+
+import random
+import time
+
+from datamodel import bitboard, rules
+
+# Scores are given from the point of view of the cats. A won game is worth
+# WIN minus the moves needed, so faster wins are preferred
+WIN = 100000
+# Mouse enclosed by the cats, less the cells it can still walk on
+ENCLOSED = 1000
+AREA_WEIGHT = 10
+# Moves the mouse needs to get past the cats, if it can
+DISTANCE_WEIGHT = 20
+
+MAX_DEPTH = 64
+# Scores of won or lost games are beyond this: no game is MAX_DEPTH moves
+# long, the cats only move forward
+MATE = WIN - MAX_DEPTH
+# Entries kept in the transposition table before it is cleared
+TABLE_SIZE = 1 << 20
+# Nodes searched between checks of the time budget
+CHECK_EVERY = 512
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+_keys = random.Random(0x6d6f757365)
+CAT_KEYS = tuple(_keys.getrandbits(64) for _ in range(bitboard.N_CELLS))
+MOUSE_KEYS = tuple(_keys.getrandbits(64) for _ in range(bitboard.N_CELLS))
+CAT_TURN_KEY = _keys.getrandbits(64)
+
+# ROWS_UP_TO[row]: mask of the cells of rows 0..row
+ROWS_UP_TO = tuple((1 << (row + 1) * bitboard.WIDTH) - 1
+                   for row in range(bitboard.WIDTH))
+
+
+class _Timeout(Exception):
+    pass
+
+
+def zobrist(position):
+    """
+    zobrist
+    ----------
+    Input parameters:
+        position: rules.Position
+    ----------
+    Returns:
+        64-bit Zobrist hash of the position. Cats are interchangeable, so
+        the order of position.cats does not change it
+    """
+    key = MOUSE_KEYS[position.mouse]
+    for cell in position.cats:
+        key ^= CAT_KEYS[cell]
+    if position.cat_turn:
+        key ^= CAT_TURN_KEY
+    return key
+
+
+def zobrist_move(key, position, origin, target):
+    """
+    zobrist_move
+    ----------
+    Input parameters:
+        key: Zobrist hash of 'position'
+        position: rules.Position before the move
+        origin: cell the piece moves from
+        target: cell the piece moves to
+    ----------
+    Returns:
+        Zobrist hash of the position after the move
+    """
+    keys = CAT_KEYS if position.cat_turn else MOUSE_KEYS
+    return key ^ keys[origin] ^ keys[target] ^ CAT_TURN_KEY
+
+
+def evaluate(position):
+    """
+    evaluate
+    ----------
+    Input parameters:
+        position: rules.Position that is not terminal
+    ----------
+    Returns:
+        Heuristic score for the cats. The mouse is flooded through the free
+        cells: if it can get past the most advanced cat, the fewer moves it
+        needs the worse for the cats; if it cannot, the cats are winning
+        and the smaller its area the better
+    """
+    cats = position.cats_mask
+    free = ~cats & bitboard.FULL_BOARD
+    first_cat = (cats & -cats).bit_length() - 1
+    escape = ROWS_UP_TO[first_cat // bitboard.WIDTH]
+    reach = frontier = 1 << position.mouse
+    distance = 0
+    while frontier:
+        if reach & escape:
+            return DISTANCE_WEIGHT * distance
+        following = 0
+        for cell in bitboard.iter_cells(frontier):
+            following |= bitboard.MOUSE_MOVES[cell]
+        frontier = following & free & ~reach
+        reach |= frontier
+        distance += 1
+    return ENCLOSED - AREA_WEIGHT * bin(reach).count('1')
+
+
+def _to_table(value, ply):
+    '''
+    Score of a won or lost game counted from the node 'ply' moves deep
+    instead of from the root, so the entry is right from any other root
+    '''
+    if value >= MATE:
+        return value + ply
+    if value <= -MATE:
+        return value - ply
+    return value
+
+
+def _from_table(value, ply):
+    '''
+    Score stored by _to_table, counted from the root again
+    '''
+    if value >= MATE:
+        return value - ply
+    if value <= -MATE:
+        return value + ply
+    return value
+
+
+class Search():
+    '''
+    One search for the best move of a position
+    '''
+    def __init__(self, table, deadline):
+        self.table = table
+        self.deadline = deadline
+        self.nodes = 0
+
+    def negamax(self, position, key, depth, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes % CHECK_EVERY == 0 and time.time() > self.deadline:
+            raise _Timeout()
+        sign = 1 if position.cat_turn else -1
+        winner = rules.winner(position)
+        if winner is not None:
+            score = WIN - ply if winner == rules.CAT else ply - WIN
+            return sign * score, None
+        if depth == 0:
+            return sign * evaluate(position), None
+
+        entry = self.table.get(key)
+        best_move = None
+        if entry is not None:
+            entry_depth, flag, value, best_move = entry
+            value = _from_table(value, ply)
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    return value, best_move
+                if flag == LOWER and value >= beta:
+                    return value, best_move
+                if flag == UPPER and value <= alpha:
+                    return value, best_move
+
+        moves = rules.legal_moves(position)
+        if not moves:
+            # Cats that cannot move: the game cannot go on
+            return sign * evaluate(position), None
+        if best_move in moves:
+            moves.remove(best_move)
+            moves.insert(0, best_move)
+
+        original_alpha = alpha
+        best_value = -WIN - 1
+        for origin, target in moves:
+            child = rules.apply_move(position, origin, target, check=False)
+            value = -self.negamax(child,
+                                  zobrist_move(key, position, origin, target),
+                                  depth - 1, -beta, -alpha, ply + 1)[0]
+            if value > best_value:
+                best_value, best_move = value, (origin, target)
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+
+        if best_value <= original_alpha:
+            flag = UPPER
+        elif best_value >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.table[key] = (depth, flag, _to_table(best_value, ply),
+                           best_move)
+        return best_value, best_move
+
+
+_table = {}
+
+
+def analyse(position, seconds, max_depth=MAX_DEPTH):
+    """
+    analyse
+    ----------
+    Input parameters:
+        position: rules.Position
+        seconds: time budget of the search
+        max_depth: deepest search, in moves
+    ----------
+    Returns:
+        Tuple (move, score): (origin, target) of the best move found, or
+        None if the side to move cannot move, and the score of the position
+        for the cats (see evaluate; +-WIN for won games). The search goes
+        one move deeper at a time while there is time left, and at least
+        one move deep
+    """
+    sign = 1 if position.cat_turn else -1
+    moves = rules.legal_moves(position)
+    if not moves:
+        return None, evaluate(position)
+    if len(_table) > TABLE_SIZE:
+        _table.clear()
+    key = zobrist(position)
+    search = Search(_table, time.time() + seconds)
+    move, score = moves[0], None
+    for depth in range(1, max_depth + 1):
+        try:
+            value, found = search.negamax(position, key, depth, -WIN - 1,
+                                          WIN + 1, 0)
+        except _Timeout:
+            break
+        score = sign * value
+        if found is not None:
+            move = found
+        if abs(value) >= MATE and WIN - abs(value) <= depth:
+            # Forced win or loss within the depth searched: searching
+            # deeper changes nothing. Longer ones may come from entries of
+            # deeper searches, and a shorter one may still be found
+            break
+        if time.time() > search.deadline:
+            break
+    return move, score
+
+
+def best_move(position, seconds, max_depth=MAX_DEPTH):
+    """
+    best_move
+    ----------
+    Input parameters:
+        position: rules.Position, with the side of the bot to move
+        seconds: time budget of the search
+        max_depth: deepest search, in moves
+    ----------
+    Returns:
+        (origin, target) tuple with the best move found (see analyse) or
+        None if the side to move cannot move
+    """
+    return analyse(position, seconds, max_depth)[0]
@@ -0,0 +1,147 @@
+"""
+Publish/subscribe of game updates.
+
+Every committed write of a game publishes its new version. Clients streaming
+a game (see the 'events' view) block on 'wait' instead of polling the
+database. The backend is chosen with settings.GAME_EVENTS_BACKEND:
+LocalBroker for a single process, CacheBroker when several processes serve
+the site.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+class LocalBroker():
+    '''
+    In-process broker. Subscribers are woken up as soon as a game they
+    wait for is published from the same process, so it is meant for a
+    single process serving many concurrent streams (threads or greenlets,
+    see gunicorn.conf.py). Events published by other processes are not
+    seen (cross_process = False): streams fall back to checking the
+    database every heartbeat. Several processes need CacheBroker.
+    '''
+    cross_process = False
+
+    def __init__(self, max_games=10000):
+        self.max_games = max_games
+        self.versions = OrderedDict()
+        self.condition = threading.Condition()
+
+    def publish(self, game_id, version):
+        with self.condition:
+            self.versions[game_id] = version
+            self.versions.move_to_end(game_id)
+            while len(self.versions) > self.max_games:
+                self.versions.popitem(last=False)
+            self.condition.notify_all()
+
+    def wait(self, game_id, version, timeout):
+        '''
+        Blocks until a version of the game newer than 'version' is
+        published or 'timeout' seconds go by. Returns the new version or
+        None on timeout.
+        '''
+        def newer():
+            return self.versions.get(game_id, -1) > version
+
+        with self.condition:
+            if self.condition.wait_for(newer, timeout):
+                return self.versions[game_id]
+        return None
+
+
+class CacheBroker(LocalBroker):
+    '''
+    Broker shared by every process through the game cache
+    (settings.GAME_CACHE_ALIAS). Subscribers in the publishing process are
+    woken up at once, as with LocalBroker, and the others see the new
+    version in the cache within settings.GAME_EVENTS_POLL seconds, without
+    querying the database.
+    '''
+    cross_process = True
+
+    @staticmethod
+    def _key(game_id):
+        return 'events:%d' % game_id
+
+    def publish(self, game_id, version):
+        cache = caches[settings.GAME_CACHE_ALIAS]
+        published = cache.get(self._key(game_id))
+        if published is None or published < version:
+            cache.set(self._key(game_id), version,
+                      settings.GAME_EVENTS_MAX_SECONDS)
+        super().publish(game_id, version)
+
+    def wait(self, game_id, version, timeout):
+        cache = caches[settings.GAME_CACHE_ALIAS]
+        deadline = time.time() + timeout
+        while True:
+            published = cache.get(self._key(game_id))
+            if published is not None and published > version:
+                return published
+            left = deadline - time.time()
+            if left <= 0:
+                return None
+            new_version = super().wait(game_id, version,
+                                       min(left, settings.GAME_EVENTS_POLL))
+            if new_version is not None:
+                return new_version
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """
+    get_broker
+    ----------
+    Returns:
+        The broker instance of this process, built from
+        settings.GAME_EVENTS_BACKEND the first time it is needed
+    """
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.GAME_EVENTS_BACKEND)()
+    return _broker
+
+
+def publish(game_id, version):
+    """
+    publish
+    ----------
+    Input parameters:
+        game_id: ID of the game that changed
+        version: its new version
+    ----------
+    Description:
+        Publishes the new version once the current transaction commits, so
+        subscribers never read a state that is rolled back afterwards.
+    """
+    transaction.on_commit(lambda: get_broker().publish(game_id, version))
+
+
+def wait(game_id, version, timeout=None):
+    """
+    wait
+    ----------
+    Input parameters:
+        game_id: ID of the game to wait for
+        version: last version known by the caller
+        timeout: seconds to wait, settings.GAME_EVENTS_HEARTBEAT by default
+    ----------
+    Returns:
+        The new version of the game or None if it did not change in time
+    """
+    if timeout is None:
+        timeout = settings.GAME_EVENTS_HEARTBEAT
+    return get_broker().wait(game_id, version, timeout)
@@ -0,0 +1,164 @@
+"""
+Cache of the current state of the games.
+
+Players and spectators read a game far more often than moves are played,
+so the views read games from here instead of the database. Entries are
+snapshots of the game row, plus the usernames of its players, stored by
+game and version ('game:<id>:<version>'), and 'game:<id>' holds the latest
+version cached. Every committed write of a game stores its new snapshot
+and moves the pointer forward, never back. Readers that miss the cache
+only fill it with cache.add, so a snapshot read before a write commits
+cannot replace the one the write stores. A stale snapshot cannot corrupt a
+game anyway: moves are only committed against the version they were read
+from (see Game._save_move). The cache is settings.GAME_CACHE_ALIAS.
+"""
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import transaction
+
+FIELDS = ('id', 'version', 'ply', 'cat1', 'cat2', 'cat3', 'cat4', 'mouse',
+          'cat_turn', 'status', 'move_log', 'move_dates')
+USERS = ('cat_user', 'mouse_user', 'winner')
+
+
+def _key(game_id):
+    return 'game:%d' % game_id
+
+
+def _version_key(game_id, version):
+    return 'game:%d:%d' % (game_id, version)
+
+
+def get_cache():
+    return caches[settings.GAME_CACHE_ALIAS]
+
+
+def snapshot(game):
+    """
+    snapshot
+    ----------
+    Input parameters:
+        game: Game
+    ----------
+    Returns:
+        Dictionary with the fields of the game and the (id, username) of
+        its players and winner (None if unset)
+    """
+    data = {field: getattr(game, field) for field in FIELDS}
+    for field in ('move_log', 'move_dates'):
+        if data[field] is not None:
+            # Some databases return memoryviews, which cannot be pickled
+            data[field] = bytes(data[field])
+    for field in USERS:
+        user = getattr(game, field)
+        data[field] = (user.id, user.username) if user else None
+    return data
+
+
+def restore(data):
+    """
+    restore
+    ----------
+    Input parameters:
+        data: dictionary built by snapshot
+    ----------
+    Returns:
+        Game instance with its players loaded, as if read from the database
+    """
+    from datamodel.models import Game
+
+    game = Game(**{field: data[field] for field in FIELDS})
+    for field in USERS:
+        if data[field] is not None:
+            user_id, username = data[field]
+            setattr(game, field, User(id=user_id, username=username))
+    game._state.adding = False
+    game._state.db = 'default'
+    return game
+
+
+def _set(data):
+    '''
+    Stores a snapshot just committed and points to it, unless a newer one
+    is already pointed to
+    '''
+    cache = get_cache()
+    cache.set(_version_key(data['id'], data['version']), data,
+              settings.GAME_CACHE_SECONDS)
+    latest = cache.get(_key(data['id']))
+    if latest is None or latest < data['version']:
+        cache.set(_key(data['id']), data['version'],
+                  settings.GAME_CACHE_SECONDS)
+
+
+def _add(data):
+    '''
+    Stores a snapshot read after a miss, and only points to it if nothing
+    is pointed to: a write may have committed since it was read
+    '''
+    cache = get_cache()
+    cache.add(_version_key(data['id'], data['version']), data,
+              settings.GAME_CACHE_SECONDS)
+    cache.add(_key(data['id']), data['version'], settings.GAME_CACHE_SECONDS)
+
+
+def cached(game_id):
+    """
+    cached
+    ----------
+    Input parameters:
+        game_id: ID of the game
+    ----------
+    Returns:
+        The snapshot of the latest version of the game in the cache, or
+        None if there is none
+    """
+    cache = get_cache()
+    version = cache.get(_key(game_id))
+    if version is None:
+        return None
+    return cache.get(_version_key(game_id, version))
+
+
+def store(game):
+    """
+    store
+    ----------
+    Input parameters:
+        game: Game that has just been written, or read from the database
+            because the cached copy was stale
+    ----------
+    Description:
+        Stores the snapshot of the game once the current transaction
+        commits, so states that are rolled back are never cached, and
+        makes it the latest version cached unless a newer one is.
+    """
+    data = snapshot(game)
+    transaction.on_commit(lambda: _set(data))
+
+
+def get_game(game_id):
+    """
+    get_game
+    ----------
+    Input parameters:
+        game_id: ID of the game
+    ----------
+    Returns:
+        The Game, from the cache if it is there. Otherwise it is read from
+        the database and cached
+    ----------
+    Raises:
+        Game.DoesNotExist if there is no such game
+    """
+    from datamodel.models import Game
+
+    data = cached(int(game_id))
+    if data is not None:
+        return restore(data)
+    game = Game.objects.select_related(*USERS).get(id=game_id)
+    data = snapshot(game)
+    transaction.on_commit(lambda: _add(data))
+    return game
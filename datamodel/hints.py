@@ -0,0 +1,64 @@
+"""
+Best move of a position, for the hints of the players.
+
+Hints come from the tablebase when it has been built, and from a short
+search of datamodel.engine otherwise. Either way the last HINT_CACHE_SIZE
+positions asked for are remembered by the process, so asking again for the
+hint of a position (players polling, several tabs) costs a dictionary
+lookup. Positions are read from the game, no query is needed.
+"""
+
+import functools
+
+from django.conf import settings
+
+from datamodel import engine, rules, tablebase
+
+HINT_CACHE_SIZE = 4096
+
+
+def hint(position):
+    """
+    hint
+    ----------
+    Input parameters:
+        position: rules.Position
+    ----------
+    Returns:
+        Dictionary with the best move of the side to move (origin, target;
+        None if it cannot move) and the evaluation of the position: the
+        winner with perfect play and the moves left ('winner' and 'plies',
+        None if unknown or drawn), the score for the cats ('score', see
+        engine.evaluate) and where it comes from ('source': 'tablebase'
+        or 'search')
+    """
+    return dict(_hint(position._replace(cats=tuple(sorted(position.cats)))))
+
+
+@functools.lru_cache(maxsize=HINT_CACHE_SIZE)
+def _hint(position):
+    table = tablebase.get()
+    result = table.probe(position) if table else None
+    if result is not None:
+        move = table.best_move(position)
+        if result.winner == rules.CAT:
+            score = engine.WIN - result.plies
+        elif result.winner == rules.MOUSE:
+            score = result.plies - engine.WIN
+        else:
+            score = 0
+        winner, plies, source = result.winner, result.plies, 'tablebase'
+    else:
+        move, score = engine.analyse(position, settings.HINT_SECONDS)
+        winner = plies = None
+        if score is not None and abs(score) >= engine.MATE:
+            winner = rules.CAT if score > 0 else rules.MOUSE
+            plies = engine.WIN - abs(score)
+        source = 'search'
+    origin, target = move if move else (None, None)
+    return (('origin', origin), ('target', target), ('winner', winner),
+            ('plies', plies), ('score', score), ('source', source))
+
+
+def cache_clear():
+    _hint.cache_clear()
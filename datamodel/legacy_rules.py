@@ -0,0 +1,111 @@
+"""
+List based rules that 'Move.save' and 'Game.save' ran before the bitboard
+rules of 'datamodel.rules'.
+
+They are kept, unchanged, as an independent reference: the rules benchmark
+measures against them and simulate_games checks that both agree on every
+position it plays. Cells are lists [row, column] counted from 1.
+"""
+
+WIDTH = 8
+
+
+def legacy_pos_to_list(position):
+    return [(position//WIDTH) + 1, (position % WIDTH) + 1]
+
+
+def legacy_cat_valid_move(cats, mouse, cat_turn, origin, target):
+    if not cat_turn:
+        return False
+    if origin not in cats or target in cats:
+        return False
+    if target == mouse:
+        return False
+    origin_lst = legacy_pos_to_list(origin)
+    target_lst = legacy_pos_to_list(target)
+    SE_lst = [x+1 for x in origin_lst]
+    SW_lst = [origin_lst[0]+1, origin_lst[1]-1]
+    if SE_lst == target_lst:
+        return True
+    if SW_lst == target_lst:
+        return True
+    return False
+
+
+def legacy_mouse_valid_move(cats, mouse, cat_turn, origin, target):
+    if cat_turn:
+        return False
+    if target in cats:
+        return False
+    if origin != mouse:
+        return False
+    origin_lst = legacy_pos_to_list(origin)
+    target_lst = legacy_pos_to_list(target)
+    SE_lst = [x+1 for x in origin_lst]
+    SW_lst = [origin_lst[0]+1, origin_lst[1]-1]
+    NW_lst = [x-1 for x in origin_lst]
+    NE_lst = [origin_lst[0]-1, origin_lst[1]+1]
+    if SE_lst == target_lst:
+        return True
+    if SW_lst == target_lst:
+        return True
+    if NW_lst == target_lst:
+        return True
+    if NE_lst == target_lst:
+        return True
+    return False
+
+
+def legacy_game_end(cats, mouse):
+    cats = [tuple(legacy_pos_to_list(c)) for c in cats]
+    min_cat = min(cats)
+    mouse = legacy_pos_to_list(mouse)
+    if mouse[0] <= min_cat[0]:
+        return True
+    SE_lst = tuple([x+1 for x in mouse])
+    SW_lst = tuple([mouse[0]+1, mouse[1]-1])
+    NW_lst = tuple([x-1 for x in mouse])
+    NE_lst = tuple([mouse[0]-1, mouse[1]+1])
+    possible_moves = set([SE_lst, SW_lst, NW_lst, NE_lst])
+    cats = set(cats)
+    possible_moves = possible_moves.difference(cats)
+    possible_moves = [move for move in possible_moves if
+                      (move[0] >= 1 and move[0] <= 8 and move[1] >= 1
+                       and move[1] <= 8)]
+    return len(possible_moves) == 0
+
+
+def legacy_validate(cats, mouse, cat_turn, origin, target):
+    if cat_turn:
+        ok = legacy_cat_valid_move(cats, mouse, cat_turn, origin, target)
+    else:
+        ok = legacy_mouse_valid_move(cats, mouse, cat_turn, origin, target)
+    return ok, legacy_game_end(cats, mouse)
+
+
+def legacy_legal_moves(cats, mouse, cat_turn):
+    """
+    legacy_legal_moves
+    ----------
+    Input parameters:
+        cats: list with the cells of the cats
+        mouse: cell of the mouse
+        cat_turn: True if the cats move
+    ----------
+    Returns:
+        Set of the (origin, target) moves the legacy rules accept. Only
+        diagonal neighbours on the board (the cells 7 or 9 away) can be
+        moves, so those are the only ones tried
+    """
+    if cat_turn:
+        valid, pieces = legacy_cat_valid_move, cats
+    else:
+        valid, pieces = legacy_mouse_valid_move, [mouse]
+    moves = set()
+    for origin in pieces:
+        for step in (-9, -7, 7, 9):
+            target = origin + step
+            if 0 <= target < WIDTH * WIDTH and \
+                    valid(cats, mouse, cat_turn, origin, target):
+                moves.add((origin, target))
+    return moves
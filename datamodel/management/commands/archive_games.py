@@ -0,0 +1,44 @@
+"""
+Moves the moves of the finished games to cold storage.
+
+    python manage.py archive_games [--batch-size 100]
+
+See datamodel/archive.py. It can be run at any time, for instance daily
+from cron: only finished games not archived yet are touched, and every
+batch is committed on its own.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from datamodel import archive
+
+
+class Command(BaseCommand):
+    help = 'Packs the moves of the finished games into their game and ' +\
+           'deletes their Move rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Games archived per transaction')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        n_games = n_moves = n_skipped = 0
+        start = time.perf_counter()
+        for games, moves, skipped in archive.archive_finished(
+                options['batch_size']):
+            n_games += games
+            n_moves += moves
+            n_skipped += skipped
+            if options['verbosity'] > 1:
+                self.stdout.write('%d games archived' % n_games)
+        elapsed = time.perf_counter() - start
+        self.stdout.write('%d games archived, %d moves deleted in %.1f s: '
+                          '%.0f games/s' % (n_games, n_moves, elapsed,
+                                            n_games / elapsed))
+        if n_skipped:
+            self.stderr.write('%d games skipped: their moves do not match '
+                              'their plies' % n_skipped)
@@ -0,0 +1,35 @@
+"""
+Solves every position of the game into the tablebase file.
+
+    python manage.py build_tablebase [--output path]
+
+The file (settings.TABLEBASE_PATH by default) is replaced atomically, so
+it can be rebuilt while the server runs; workers map the new file when
+they restart.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from datamodel import rules, tablebase
+
+
+class Command(BaseCommand):
+    help = 'Solves every position of the game into the tablebase file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None,
+                            help='File to write (default: TABLEBASE_PATH)')
+
+    def handle(self, *args, **options):
+        path = options['output'] or settings.TABLEBASE_PATH
+        start = time.perf_counter()
+        table = tablebase.generate()
+        tablebase.write(path, table)
+        result = tablebase.Tablebase(path).probe(rules.INITIAL_POSITION)
+        self.stdout.write('%d positions solved in %.1f s into %s' % (
+            tablebase.SIZE, time.perf_counter() - start, path))
+        self.stdout.write('The %s wins the game in %d moves' % (
+            result.winner, result.plies))
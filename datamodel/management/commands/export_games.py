@@ -0,0 +1,130 @@
+"""
+Streams the games and their moves as JSON lines, one game per line.
+
+    python manage.py export_games [--output games.jsonl] [--status 2]
+
+Every line has the ID, players (usernames), winner, status and version of
+a game, its position before the first move ('initial': cats, mouse and
+cat_turn), its moves in base64, one byte per move (see rules.pack_move),
+as replay_log sends them, and the dates of the moves in base64, to the
+millisecond, packed as archived games store them (see archive.pack_dates):
+
+    {"id": 7, "cat_user": "ana", "mouse_user": "bob", "winner": "ana",
+     "status": 2, "version": 31, "initial": {"cats": [0, 2, 4, 6],
+     "mouse": 59, "cat_turn": true}, "moves": "ACQ...", "dates": "gN..."}
+
+Games and moves are read with two server-side cursors ordered by game, so
+memory use does not grow with the tables. The moves and dates of archived
+games come from their move log. import_games loads the file.
+"""
+
+import base64
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from datamodel import archive, rules
+from datamodel.models import Game, Move
+
+GAME_FIELDS = ('id', 'cat_user__username', 'mouse_user__username',
+               'winner__username', 'status', 'version', 'cat1', 'cat2',
+               'cat3', 'cat4', 'mouse', 'cat_turn', 'move_log', 'move_dates')
+
+
+def game_record(row, moves):
+    """
+    game_record
+    ----------
+    Input parameters:
+        row: tuple with the GAME_FIELDS of a game
+        moves: list of (origin, target, date) tuples of its moves, in
+            order, if the game is not archived
+    ----------
+    Returns:
+        Dictionary written as the line of the game
+    """
+    (game_id, cat_user, mouse_user, winner, status, version, cat1, cat2,
+     cat3, cat4, mouse, cat_turn, move_log, move_dates) = row
+    if move_log is not None:
+        dates = bytes(move_dates or b'')
+        moves = rules.unpack_moves(bytes(move_log))
+    else:
+        dates = archive.pack_dates([date for _, _, date in moves])
+        moves = [(origin, target) for origin, target, _ in moves]
+    initial = rules.Position((cat1, cat2, cat3, cat4), mouse, cat_turn)
+    for origin, target in reversed(moves):
+        initial = rules.undo_move(initial, origin, target)
+    return {'id': game_id, 'cat_user': cat_user, 'mouse_user': mouse_user,
+            'winner': winner, 'status': status, 'version': version,
+            'initial': {'cats': initial.cats, 'mouse': initial.mouse,
+                        'cat_turn': initial.cat_turn},
+            'moves': base64.b64encode(rules.pack_moves(moves)).decode(
+                'ascii'),
+            'dates': base64.b64encode(dates).decode('ascii')}
+
+
+def iter_records(games, chunk_size):
+    """
+    iter_records
+    ----------
+    Input parameters:
+        games: queryset of the games to export
+        chunk_size: rows fetched at a time from every cursor
+    ----------
+    Returns:
+        Generator of the records (see game_record) of the games, by ID.
+        The moves are read in the same order and merged in, so only the
+        moves of one game are held at a time
+    """
+    rows = games.order_by('id').values_list(*GAME_FIELDS).iterator(
+        chunk_size=chunk_size)
+    moves = Move.objects.filter(game__in=games.values('id')).\
+        order_by('game_id', 'ply').values_list(
+            'game_id', 'origin', 'target', 'date').iterator(
+                chunk_size=chunk_size)
+    pending = next(moves, None)
+    for row in rows:
+        game_moves = []
+        while pending is not None and pending[0] <= row[0]:
+            if pending[0] == row[0]:
+                game_moves.append(pending[1:])
+            pending = next(moves, None)
+        yield game_record(row, game_moves)
+
+
+class Command(BaseCommand):
+    help = 'Streams the games and their moves as JSON lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-',
+                            help='File to write (default: standard output)')
+        parser.add_argument('--status', type=int, default=None,
+                            help='Only export the games in this status')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Rows fetched at a time from the database')
+
+    def handle(self, *args, **options):
+        games = Game.objects.all()
+        if options['status'] is not None:
+            games = games.filter(status=options['status'])
+        if options['output'] == '-':
+            out, log = sys.stdout, self.stderr
+        else:
+            out, log = open(options['output'], 'w'), self.stdout
+
+        n_games = n_moves = 0
+        start = time.perf_counter()
+        try:
+            for record in iter_records(games, options['chunk_size']):
+                out.write(json.dumps(record, separators=(',', ':')) + '\n')
+                n_games += 1
+                n_moves += len(base64.b64decode(record['moves']))
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        elapsed = time.perf_counter() - start
+        log.write('%d games, %d moves exported in %.1f s: %.0f games/s, '
+                  '%.0f moves/s' % (n_games, n_moves, elapsed,
+                                    n_games / elapsed, n_moves / elapsed))
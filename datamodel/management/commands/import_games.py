@@ -0,0 +1,230 @@
+"""
+Loads the games written by export_games.
+
+    python manage.py import_games games.jsonl [--batch-size 500]
+
+Lines are read one at a time and stored in batches, each with a few
+bulk_create queries (games, moves and keyframes) in one transaction, so
+memory use does not grow with the file. Games keep their IDs: those that
+already exist are skipped, so an interrupted import can be run again.
+Missing players are created without a usable password. Moves are replayed
+with the rules before being stored, and games with illegal moves are
+rejected. Moves keep their dates, to the millisecond; those of files
+without dates get the date of the import. The stats of the players are not
+updated: run rebuild_stats afterwards.
+"""
+
+import base64
+import binascii
+import json
+import sys
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+
+from datamodel import archive, rules
+from datamodel.models import Game, GameStatus, Keyframe, Move
+
+STATUSES = (GameStatus.CREATED, GameStatus.ACTIVE, GameStatus.FINISHED)
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+def parse_record(line):
+    """
+    parse_record
+    ----------
+    Input parameters:
+        line: line written by export_games
+    ----------
+    Returns:
+        Tuple (record, moves, dates, positions): the dictionary of the
+        line, the (origin, target) moves of the game, the dates of the
+        moves (None if the line has none) and the list of its positions,
+        from the initial one to the current one
+    ----------
+    Raises:
+        InvalidRecord if the line is not a game or its moves are illegal
+    """
+    try:
+        record = json.loads(line)
+        initial = record['initial']
+        position = rules.Position(tuple(initial['cats']), initial['mouse'],
+                                  bool(initial['cat_turn']))
+        moves = rules.unpack_moves(base64.b64decode(record['moves']))
+        if not isinstance(record['id'], int) or \
+                not isinstance(record['version'], int) or \
+                not record['cat_user'] or record['status'] not in STATUSES \
+                or (moves and not record['mouse_user']) or \
+                'winner' not in record:
+            raise InvalidRecord('invalid game')
+        cells = position.cats + (position.mouse,)
+        if len(cells) != 5 or not all(isinstance(cell, int) and
+                                      Game.MIN_CELL <= cell <= Game.MAX_CELL
+                                      for cell in cells):
+            raise InvalidRecord('invalid position')
+    except (ValueError, KeyError, TypeError, binascii.Error) as err:
+        raise InvalidRecord(str(err))
+    positions = [position]
+    for origin, target in moves:
+        try:
+            position = rules.apply_move(position, origin, target)
+        except ValueError:
+            # IllegalMove, or cells off the board
+            raise InvalidRecord('illegal move %d-%d' % (origin, target))
+        positions.append(position)
+    dates = record.get('dates')
+    if dates is not None:
+        try:
+            dates = archive.unpack_dates(base64.b64decode(dates))
+        except (ValueError, TypeError, OverflowError,
+                binascii.Error) as err:
+            raise InvalidRecord(str(err))
+        if len(dates) != len(moves):
+            raise InvalidRecord('invalid dates')
+    return record, moves, dates, positions
+
+
+class Command(BaseCommand):
+    help = 'Loads games and their moves from the JSON lines of export_games'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='File to read (- for the ' +
+                                          'standard input)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Games stored per transaction')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        self.user_ids = {}
+        self.n_games = self.n_moves = self.n_skipped = self.n_rejected = 0
+        if options['input'] == '-':
+            lines = sys.stdin
+        else:
+            lines = open(options['input'])
+
+        start = time.perf_counter()
+        batch = []
+        try:
+            for number, line in enumerate(lines, 1):
+                if not line.strip():
+                    continue
+                try:
+                    batch.append(parse_record(line))
+                except InvalidRecord as err:
+                    self.n_rejected += 1
+                    self.stderr.write('line %d: %s' % (number, err))
+                    continue
+                if len(batch) == options['batch_size']:
+                    self.store(batch)
+                    batch = []
+            if batch:
+                self.store(batch)
+        finally:
+            if lines is not sys.stdin:
+                lines.close()
+        self.reset_sequences()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            '%d games, %d moves imported in %.1f s: %.0f games/s, %.0f '
+            'moves/s (%d already there, %d rejected)' % (
+                self.n_games, self.n_moves, elapsed, self.n_games / elapsed,
+                self.n_moves / elapsed, self.n_skipped, self.n_rejected))
+
+    def resolve_users(self, usernames):
+        '''
+        Fills self.user_ids with the IDs of 'usernames', creating the users
+        that do not exist
+        '''
+        missing = set(usernames) - set(self.user_ids) - {None}
+        if not missing:
+            return
+        found = User.objects.filter(username__in=missing).values_list(
+            'username', 'id')
+        self.user_ids.update(found)
+        new = missing - set(self.user_ids)
+        if new:
+            password = make_password(None)
+            User.objects.bulk_create(User(username=username,
+                                          password=password)
+                                     for username in new)
+            self.user_ids.update(User.objects.filter(
+                username__in=new).values_list('username', 'id'))
+
+    def store(self, batch):
+        ids = [record['id'] for record, _, _, _ in batch]
+        existing = set(Game.objects.filter(id__in=ids).values_list(
+            'id', flat=True))
+        batch = [entry for entry in batch if entry[0]['id'] not in existing]
+        self.n_skipped += len(existing)
+        self.resolve_users(username for record, _, _, _ in batch
+                           for username in (record['cat_user'],
+                                            record['mouse_user'],
+                                            record['winner']))
+
+        games, moves, keyframes = [], [], []
+        for record, game_moves, dates, positions in batch:
+            cat_user_id = self.user_ids[record['cat_user']]
+            mouse_user_id = self.user_ids.get(record['mouse_user'])
+            game = Game(id=record['id'], cat_user_id=cat_user_id,
+                        mouse_user_id=mouse_user_id,
+                        winner_id=self.user_ids.get(record['winner']),
+                        status=record['status'], version=record['version'],
+                        ply=len(positions) - 1)
+            game._set_position(positions[-1])
+            games.append(game)
+            for ply, ((origin, target), before) in enumerate(
+                    zip(game_moves, positions), 1):
+                player = cat_user_id if before.cat_turn else mouse_user_id
+                moves.append(Move(game_id=game.id, player_id=player,
+                                  origin=origin, target=target, ply=ply,
+                                  date=dates[ply - 1] if dates else None))
+                if (ply - 1) % settings.KEYFRAME_INTERVAL == 0:
+                    cat1, cat2, cat3, cat4 = before.cats
+                    keyframes.append(Keyframe(
+                        game_id=game.id, ply=ply - 1, cat1=cat1, cat2=cat2,
+                        cat3=cat3, cat4=cat4, mouse=before.mouse,
+                        cat_turn=before.cat_turn))
+
+        with transaction.atomic():
+            Game.objects.bulk_create(games)
+            self.create_moves(moves)
+            Keyframe.objects.bulk_create(keyframes, batch_size=1000)
+        self.n_games += len(games)
+        self.n_moves += len(moves)
+
+    def create_moves(self, moves):
+        '''
+        Inserts 'moves' keeping their dates: Move.date is auto_now_add,
+        which bulk_create would otherwise set to now. Those without a date
+        get the date of the import
+        '''
+        date = Move._meta.get_field('date')
+        now = timezone.now()
+        for move in moves:
+            if move.date is None:
+                move.date = now
+        date.auto_now_add = False
+        try:
+            Move.objects.bulk_create(moves, batch_size=1000)
+        finally:
+            date.auto_now_add = True
+
+    def reset_sequences(self):
+        '''
+        Games were inserted with their IDs: the sequence of the IDs has to
+        go past them in the databases that have one
+        '''
+        statements = connection.ops.sequence_reset_sql(no_style(), [Game])
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
@@ -0,0 +1,341 @@
+"""
+Load generator that plays simultaneous games through the web views.
+
+    python manage.py loadtest --pairs 20 [--url http://localhost:8000]
+
+Every pair of players signs up, creates and joins a game and plays it with
+random legal moves, polling 'show_game' and 'game_status' every --poll
+seconds as the game page used to. Without --url the requests go through
+Django's test client in this process, against the configured database,
+and the queries of every request are counted too. With --url they are sent
+over HTTP to a running server (runserver or gunicorn).
+"""
+
+import http.cookiejar
+import json
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from datamodel import rules
+from datamodel.models import GameStatus
+
+PREFIX = '/mouse_cat/'
+PASSWORD = 'L0ad-test-pl4yer'
+GAME_ID_RE = re.compile(r'Game <b>(\d+)</b>')
+# Seconds a player waits for the other one to create or join the game
+PAIRING_TIMEOUT = 60
+# Failed requests of a player are retried RETRIES times, RETRY_SECONDS apart
+RETRIES = 10
+RETRY_SECONDS = 0.1
+
+
+def endpoint(path):
+    return path[len(PREFIX):].split('/')[0] or 'index'
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class Stats():
+    '''
+    Latency, queries and errors of the requests, by endpoint
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.failures = []
+
+    def add(self, path, seconds, n_queries, status):
+        name = endpoint(path)
+        with self.lock:
+            self.latencies[name].append(seconds)
+            if n_queries is not None:
+                self.queries[name].append(n_queries)
+            if status >= 400:
+                self.errors[name] += 1
+
+    def fail(self, message):
+        with self.lock:
+            self.failures.append(message)
+
+
+# SQLite locks whole tables between the threads of a process, so with it
+# the test client serves one request at a time
+SQLITE_LOCK = threading.Lock()
+
+
+class ClientSession():
+    '''
+    Player browsing through the test client of this process
+    '''
+    def __init__(self, stats):
+        self.stats = stats
+        self.client = Client(HTTP_HOST='localhost')
+        if connection.vendor == 'sqlite':
+            self.lock = SQLITE_LOCK
+        else:
+            self.lock = threading.Lock()
+
+    def request(self, method, path, data=None):
+        with self.lock:
+            return self._request(method, path, data)
+
+    def _request(self, method, path, data):
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            try:
+                if method == 'POST':
+                    response = self.client.post(path, data or {})
+                else:
+                    response = self.client.get(path, data or {})
+                status, content = (response.status_code,
+                                   response.content.decode())
+            except DatabaseError as err:
+                # What a server would answer with a 500 page
+                status, content = 500, str(err)
+        self.stats.add(path, time.perf_counter() - start, len(queries),
+                       status)
+        return status, content
+
+    def close(self):
+        connection.close()
+
+
+class NoRedirectHandler(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpSession():
+    '''
+    Player browsing a running server over HTTP
+    '''
+    def __init__(self, stats, url, timeout=30):
+        self.stats = stats
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies),
+            NoRedirectHandler)
+
+    def csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == 'csrftoken':
+                return cookie.value
+        return ''
+
+    def request(self, method, path, data=None):
+        url = self.url + path
+        data = dict(data or {})
+        body = None
+        if method == 'POST':
+            data['csrfmiddlewaretoken'] = self.csrf_token()
+            body = urllib.parse.urlencode(data).encode()
+        elif data:
+            url += '?' + urllib.parse.urlencode(data)
+        request = urllib.request.Request(url, data=body,
+                                         headers={'Referer': url})
+        start = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                status, content = response.status, response.read()
+        except urllib.error.HTTPError as err:
+            status, content = err.code, err.read()
+        self.stats.add(path, time.perf_counter() - start, None, status)
+        return status, content.decode('utf-8', 'replace')
+
+    def close(self):
+        pass
+
+
+def request_until_ok(session, method, path, data=None):
+    """
+    request_until_ok
+    ----------
+    Input parameters:
+        session: ClientSession or HttpSession of the player
+        method: 'GET' or 'POST'
+        path: path of the request
+        data: query or form parameters
+    ----------
+    Returns:
+        Content of the response, once the request does not fail. It is
+        retried like a player would retry an error page
+    ----------
+    Raises:
+        RuntimeError if it fails RETRIES times
+    """
+    for _ in range(RETRIES):
+        status, content = session.request(method, path, data)
+        if status < 400:
+            return content
+        time.sleep(RETRY_SECONDS)
+    raise RuntimeError('%s %s returned %d' % (method, path, status))
+
+
+class Pair():
+    '''
+    Game shared by a cat player and a mouse player
+    '''
+    def __init__(self):
+        self.game_id = None
+        self.n_moves = 0
+        self.finished = False
+        self.created = threading.Event()
+        self.joined = threading.Event()
+        self.done = threading.Event()
+
+
+def play(session, username, role, pair, max_moves, poll):
+    """
+    play
+    ----------
+    Input parameters:
+        session: ClientSession or HttpSession of the player
+        username: username the player signs up with
+        role: rules.CAT or rules.MOUSE
+        pair: Pair of the game
+        max_moves: moves played at most in the game
+        poll: seconds between polls of the game
+    ----------
+    Description:
+        Signs up, creates (cat) or joins (mouse) the game of the pair and
+        plays random legal moves until the game ends or max_moves is
+        reached.
+    """
+    # The signup page sets the CSRF cookie
+    request_until_ok(session, 'GET', PREFIX + 'signup')
+    request_until_ok(session, 'POST', PREFIX + 'signup',
+                     {'username': username, 'password': PASSWORD,
+                      'password2': PASSWORD})
+    if role == rules.CAT:
+        content = request_until_ok(session, 'GET', PREFIX + 'create_game')
+        pair.game_id = int(GAME_ID_RE.search(content).group(1))
+        pair.created.set()
+        if not pair.joined.wait(PAIRING_TIMEOUT):
+            raise RuntimeError('nobody joined game %d' % pair.game_id)
+        request_until_ok(session, 'GET', PREFIX +
+                         'select_game/play_game/%d' % pair.game_id)
+    else:
+        if not pair.created.wait(PAIRING_TIMEOUT):
+            raise RuntimeError('no game to join')
+        request_until_ok(session, 'GET', PREFIX +
+                         'select_game/join_game/%d' % pair.game_id)
+        pair.joined.set()
+
+    while not pair.done.is_set():
+        session.request('GET', PREFIX + 'show_game')
+        content = request_until_ok(session, 'GET', PREFIX + 'game_status')
+        if json.loads(content)['status'] == GameStatus.FINISHED:
+            pair.finished = True
+            break
+        state = json.loads(request_until_ok(session, 'GET',
+                                            PREFIX + 'state'))
+        position = rules.Position(tuple(state['cats']), state['mouse'],
+                                  state['cat_turn'])
+        if position.side_to_move == role:
+            moves = rules.legal_moves(position)
+            if pair.n_moves >= max_moves or not moves:
+                break
+            origin, target = random.choice(moves)
+            request_until_ok(session, 'POST', PREFIX + 'move',
+                             {'origin': origin, 'target': target})
+            pair.n_moves += 1
+        time.sleep(poll)
+    pair.done.set()
+
+
+class Command(BaseCommand):
+    help = 'Plays simultaneous games through the web views and reports ' +\
+           'the throughput, latency and queries of every endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pairs', type=int, default=10,
+                            help='Games played at the same time')
+        parser.add_argument('--moves', type=int, default=40,
+                            help='Moves played at most in every game')
+        parser.add_argument('--poll', type=float, default=1.0,
+                            help='Seconds between polls of every player')
+        parser.add_argument('--url', default=None,
+                            help='Server to load (default: test client)')
+        parser.add_argument('--keep', action='store_true',
+                            help='Do not delete the players created')
+
+    def handle(self, *args, **options):
+        stats = Stats()
+        prefix = 'load_%s_' % uuid.uuid4().hex[:8]
+        threads = []
+        pairs = [Pair() for _ in range(options['pairs'])]
+
+        def run(username, role, pair):
+            if options['url']:
+                session = HttpSession(stats, options['url'])
+            else:
+                session = ClientSession(stats)
+            try:
+                play(session, username, role, pair, options['moves'],
+                     options['poll'])
+            except Exception as err:
+                stats.fail('%s: %r' % (username, err))
+                pair.created.set()
+                pair.joined.set()
+                pair.done.set()
+            finally:
+                session.close()
+
+        start = time.perf_counter()
+        for i, pair in enumerate(pairs):
+            for role in [rules.CAT, rules.MOUSE]:
+                username = '%s%d_%s' % (prefix, i, role)
+                threads.append(threading.Thread(target=run,
+                                                args=(username, role, pair)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        if not options['keep']:
+            User.objects.filter(username__startswith=prefix).delete()
+        self.report(stats, pairs, elapsed)
+
+    def report(self, stats, pairs, elapsed):
+        n_requests = sum(len(times) for times in stats.latencies.values())
+        self.stdout.write('%d games (%d finished), %d moves, %.1f s' % (
+            len(pairs), sum(pair.finished for pair in pairs),
+            sum(pair.n_moves for pair in pairs), elapsed))
+        self.stdout.write('%d requests, %.1f requests/s' % (
+            n_requests, n_requests / elapsed))
+        self.stdout.write('%-12s %8s %8s %8s %8s %8s %8s %7s' % (
+            'endpoint', 'requests', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms',
+            'queries', 'errors'))
+        for name in sorted(stats.latencies):
+            times = stats.latencies[name]
+            queries = stats.queries[name]
+            self.stdout.write('%-12s %8d %8.1f %8.1f %8.1f %8.1f %8s %7d' % (
+                name, len(times), len(times) / elapsed,
+                percentile(times, 0.50) * 1000,
+                percentile(times, 0.95) * 1000,
+                percentile(times, 0.99) * 1000,
+                '%.1f' % (sum(queries) / len(queries)) if queries else '-',
+                stats.errors[name]))
+        for failure in stats.failures:
+            self.stderr.write(failure)
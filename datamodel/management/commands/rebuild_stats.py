@@ -0,0 +1,36 @@
+"""
+Recomputes the statistics of every player from the finished games.
+
+    python manage.py rebuild_stats [--chunk-size 2000]
+
+The stats are kept up to date as games finish (see datamodel/stats.py).
+This command is for the games that finished some other way: those that
+finished before the stats existed and those loaded by import_games. The
+games are read in one pass with a server-side cursor, and the stats are
+replaced in the same transaction, which locks the games in progress: their
+moves wait until it ends. SQLite cannot lock them, so there it has to be
+run while no games are in progress.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from datamodel import stats
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the statistics of the players from the finished games'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Rows fetched at a time from the database')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+        start = time.perf_counter()
+        n_games, n_players = stats.rebuild(options['chunk_size'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write('%d games, %d players in %.1f s: %.0f games/s' % (
+            n_games, n_players, elapsed, n_games / elapsed))
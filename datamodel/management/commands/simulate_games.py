@@ -0,0 +1,193 @@
+"""
+Plays games against itself with the rules of 'datamodel.rules', without the
+database, to measure them and check them.
+
+    python manage.py simulate_games --games 1000000 [--cat engine]
+
+Games are split in chunks played by a pool of processes, one per core by
+default. Every side plays random legal moves or the moves of the engine.
+On every position played the bitboard rules are checked against the list
+based ones the models used to run ('datamodel.legacy_rules'): same legal
+moves and same end of the game. The report has the games per second, the
+wins of every side, the distribution of the game lengths and the positions
+where the rules disagree.
+"""
+
+import multiprocessing
+import os
+import random
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from datamodel import engine, legacy_rules, rules
+
+PLAYERS = ('random', 'engine')
+# Games played in a row by a worker before reporting back
+CHUNK_SIZE = 1000
+# Disagreements kept by every chunk
+MAX_DISAGREEMENTS = 10
+# Games longer than this are cut: no game can be, cats only move forward
+MAX_PLIES = 200
+DRAW = 'draw'
+
+
+def check(position):
+    '''
+    Returns a description of how the bitboard and the legacy rules disagree
+    on 'position', or None if they agree
+    '''
+    cats = list(position.cats)
+    legacy_moves = legacy_rules.legacy_legal_moves(cats, position.mouse,
+                                                   position.cat_turn)
+    moves = set(rules.legal_moves(position))
+    if moves != legacy_moves:
+        return 'moves: rules %s, legacy %s' % (sorted(moves),
+                                               sorted(legacy_moves))
+    terminal = rules.is_terminal(position)
+    if terminal != legacy_rules.legacy_game_end(cats, position.mouse):
+        return 'end of game: rules %s, legacy %s' % (terminal, not terminal)
+    return None
+
+
+def play_chunk(args):
+    """
+    play_chunk
+    ----------
+    Input parameters:
+        args: tuple (seed, n_games, cat, mouse, seconds, verify) with the
+            seed of the chunk, the games to play, the players of the cats
+            and the mouse ('random' or 'engine'), the seconds the engine
+            thinks every move and whether to check the rules
+    ----------
+    Returns:
+        Tuple (winners, lengths, disagreements): Counter of the winners
+        (rules.CAT, rules.MOUSE or DRAW if the cats got stuck), Counter of
+        the lengths of the games in moves and list of (position, message)
+        with the disagreements found
+    """
+    seed, n_games, cat, mouse, seconds, verify = args
+    generator = random.Random(seed)
+    players = {rules.CAT: cat, rules.MOUSE: mouse}
+    winners, lengths, disagreements = Counter(), Counter(), []
+    for _ in range(n_games):
+        position = rules.INITIAL_POSITION
+        plies = 0
+        while True:
+            if verify:
+                message = check(position)
+                if message and len(disagreements) < MAX_DISAGREEMENTS:
+                    disagreements.append((tuple(position), message))
+            winner = rules.winner(position)
+            if winner is not None:
+                break
+            moves = rules.legal_moves(position)
+            if not moves or plies >= MAX_PLIES:
+                winner = DRAW
+                break
+            if players[position.side_to_move] == 'engine':
+                move = engine.best_move(position, seconds)
+            else:
+                move = generator.choice(moves)
+            position = rules.apply_move(position, *move, check=False)
+            plies += 1
+        winners[winner] += 1
+        lengths[plies] += 1
+    return winners, lengths, disagreements
+
+
+def percentile(lengths, fraction):
+    '''
+    Game length below which 'fraction' of the games are, from a Counter
+    '''
+    limit = fraction * sum(lengths.values())
+    seen = 0
+    for length in sorted(lengths):
+        seen += lengths[length]
+        if seen >= limit:
+            return length
+    return None
+
+
+class Command(BaseCommand):
+    help = 'Plays games with the rules, without the database, over all ' +\
+           'the cores and reports their speed, results and lengths'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--games', type=int, default=100000,
+                            help='Games to play')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Processes playing (default: one per core)')
+        parser.add_argument('--cat', choices=PLAYERS, default='random',
+                            help='Player of the cats')
+        parser.add_argument('--mouse', choices=PLAYERS, default='random',
+                            help='Player of the mouse')
+        parser.add_argument('--seconds', type=float, default=0.01,
+                            help='Seconds the engine thinks every move')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed of the random players')
+        parser.add_argument('--no-verify', action='store_true',
+                            help='Do not check against the legacy rules')
+
+    def handle(self, *args, **options):
+        if options['games'] < 1 or options['workers'] < 1:
+            raise CommandError('--games and --workers must be positive')
+        n_games = options['games']
+        chunks = []
+        for start in range(0, n_games, CHUNK_SIZE):
+            chunks.append(('%d:%d' % (options['seed'], start),
+                           min(CHUNK_SIZE, n_games - start), options['cat'],
+                           options['mouse'], options['seconds'],
+                           not options['no_verify']))
+
+        winners, lengths, disagreements = Counter(), Counter(), []
+        start = time.perf_counter()
+        if options['workers'] == 1:
+            results = map(play_chunk, chunks)
+            pool = None
+        else:
+            pool = multiprocessing.Pool(options['workers'])
+            results = pool.imap_unordered(play_chunk, chunks)
+        try:
+            for chunk_winners, chunk_lengths, chunk_disagreements in results:
+                winners.update(chunk_winners)
+                lengths.update(chunk_lengths)
+                disagreements.extend(chunk_disagreements)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+        elapsed = time.perf_counter() - start
+        self.report(n_games, options['workers'], elapsed, winners, lengths,
+                    disagreements)
+
+    def report(self, n_games, workers, elapsed, winners, lengths,
+               disagreements):
+        self.stdout.write('%d games in %.1f s with %d workers: %.0f games/s'
+                          % (n_games, elapsed, workers, n_games / elapsed))
+        for winner in (rules.CAT, rules.MOUSE, DRAW):
+            self.stdout.write('%-6s %9d %6.2f%%' % (
+                winner, winners[winner], 100 * winners[winner] / n_games))
+        mean = sum(length * n for length, n in lengths.items()) / n_games
+        self.stdout.write('moves: min %d, mean %.1f, p50 %d, p90 %d, p99 %d, '
+                          'max %d' % (min(lengths), mean,
+                                      percentile(lengths, 0.50),
+                                      percentile(lengths, 0.90),
+                                      percentile(lengths, 0.99),
+                                      max(lengths)))
+        for low in range(0, max(lengths) + 1, 10):
+            n = sum(lengths[length] for length in range(low, low + 10))
+            if n:
+                self.stdout.write('%3d-%-3d %9d %6.2f%% %s' % (
+                    low, low + 9, n, 100 * n / n_games,
+                    '#' * int(50 * n / n_games)))
+        if disagreements:
+            self.stderr.write('Positions where the rules disagree (at most '
+                              '%d every %d games):' % (MAX_DISAGREEMENTS,
+                                                       CHUNK_SIZE))
+            for position, message in disagreements:
+                self.stderr.write('%s: %s' % (rules.Position(*position),
+                                              message))
+        else:
+            self.stdout.write('The rules agree on every position played')
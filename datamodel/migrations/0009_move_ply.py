@@ -0,0 +1,84 @@
+from django.db import migrations, models
+
+
+NUMBER_MOVES_SQL = [
+    # The moves of every game by date, in one statement
+    'UPDATE datamodel_move SET ply = numbered.ply FROM ('
+    'SELECT id, ROW_NUMBER() OVER (PARTITION BY game_id ORDER BY date, id) '
+    'AS ply FROM datamodel_move) AS numbered '
+    'WHERE datamodel_move.id = numbered.id',
+    'UPDATE datamodel_game SET ply = counted.ply FROM ('
+    'SELECT game_id, COUNT(*) AS ply FROM datamodel_move GROUP BY game_id) '
+    'AS counted WHERE datamodel_game.id = counted.game_id',
+]
+BATCH_SIZE = 1000
+
+
+def number_moves(apps, schema_editor):
+    '''
+    Numbers the moves of every game by date. PostgreSQL does it in one
+    statement per table; other databases read the moves once, in order,
+    and write the numbers in batches of BATCH_SIZE rows.
+    '''
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in NUMBER_MOVES_SQL:
+            schema_editor.execute(statement)
+        return
+    Move = apps.get_model('datamodel', 'Move')
+    moves = Move.objects.order_by('game_id', 'date', 'id').values_list(
+        'game_id', 'id').iterator(chunk_size=BATCH_SIZE)
+    move_plies, game_plies = [], []
+    game_id = ply = None
+    for move_game_id, move_id in moves:
+        if move_game_id != game_id:
+            if game_id is not None:
+                game_plies.append((ply, game_id))
+            game_id, ply = move_game_id, 0
+        ply += 1
+        move_plies.append((ply, move_id))
+        if len(move_plies) == BATCH_SIZE:
+            _update(schema_editor, 'datamodel_move', move_plies)
+            move_plies = []
+    if game_id is not None:
+        game_plies.append((ply, game_id))
+    _update(schema_editor, 'datamodel_move', move_plies)
+    for start in range(0, len(game_plies), BATCH_SIZE):
+        _update(schema_editor, 'datamodel_game',
+                game_plies[start:start + BATCH_SIZE])
+
+
+def _update(schema_editor, table, plies):
+    '''
+    Sets the ply of the rows of 'table' from (ply, id) tuples, in one
+    batch
+    '''
+    if plies:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(
+                'UPDATE %s SET ply = %%s WHERE id = %%s' % table, plies)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datamodel', '0008_game_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='ply',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='move',
+            name='ply',
+            field=models.PositiveIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.RunPython(number_moves, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='move',
+            unique_together={('game', 'ply')},
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 2.2.28 on 2026-10-18 13:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datamodel', '0009_move_ply'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Keyframe',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ply', models.PositiveIntegerField()),
+                ('cat1', models.IntegerField()),
+                ('cat2', models.IntegerField()),
+                ('cat3', models.IntegerField()),
+                ('cat4', models.IntegerField()),
+                ('mouse', models.IntegerField()),
+                ('cat_turn', models.BooleanField()),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='datamodel.Game')),
+            ],
+            options={
+                'unique_together': {('game', 'ply')},
+            },
+        ),
+    ]
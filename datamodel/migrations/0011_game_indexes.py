@@ -0,0 +1,27 @@
+# Generated by Django 2.2.28 on 2026-10-18 13:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datamodel', '0010_keyframe'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['cat_user', 'status', '-id'], name='game_cat_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['mouse_user', 'status', '-id'], name='game_mouse_status_idx'),
+        ),
+        # Open games to join, newest first
+        migrations.RunSQL(
+            'CREATE INDEX game_open_idx ON datamodel_game (id DESC) '
+            'WHERE mouse_user_id IS NULL',
+            'DROP INDEX game_open_idx',
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-18 14:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datamodel', '0011_game_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='move_dates',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='move_log',
+            field=models.BinaryField(null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.2.28 on 2026-10-18 14:28
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('datamodel', '0012_game_move_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('games', models.PositiveIntegerField(default=0)),
+                ('wins', models.PositiveIntegerField(default=0)),
+                ('cat_wins', models.PositiveIntegerField(default=0)),
+                ('mouse_wins', models.PositiveIntegerField(default=0)),
+                ('plies', models.PositiveIntegerField(default=0)),
+                ('streak', models.PositiveIntegerField(default=0)),
+                ('best_streak', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='userstats',
+            index=models.Index(fields=['-wins', 'games', 'user'], name='stats_leaderboard_idx'),
+        ),
+    ]
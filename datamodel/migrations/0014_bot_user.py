@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import migrations
+
+
+def create_bot_user(apps, schema_editor):
+    '''
+    Reserves the username of the bot with an account nobody can log in to
+    (see datamodel/bot.py). A person who took the name before is left
+    alone, and then there is no bot.
+    '''
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    if not User.objects.filter(username=settings.BOT_USERNAME).exists():
+        User.objects.create(username=settings.BOT_USERNAME,
+                            password=make_password(None))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('datamodel', '0013_userstats'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_bot_user, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.db import migrations
+
+from datamodel import rules
+
+
+def add_keyframes(apps, schema_editor):
+    '''
+    Stores the keyframes of the games played before there were keyframes
+    (0010_keyframe), which would otherwise be rebuilt from their last
+    position undoing every move. Their positions come from undoing the
+    moves from the current one. Archived games, whose moves are in the
+    game row, and games whose moves do not add up are left as they are.
+    '''
+    Game = apps.get_model('datamodel', 'Game')
+    Move = apps.get_model('datamodel', 'Move')
+    Keyframe = apps.get_model('datamodel', 'Keyframe')
+    games = Game.objects.filter(ply__gt=0, move_log__isnull=True).exclude(
+        id__in=Keyframe.objects.values('game_id'))
+    keyframes = []
+    for game in games.iterator():
+        moves = list(Move.objects.filter(game=game).order_by('ply').
+                     values_list('origin', 'target'))
+        if len(moves) != game.ply:
+            continue
+        position = rules.Position((game.cat1, game.cat2, game.cat3,
+                                   game.cat4), game.mouse, game.cat_turn)
+        positions = [position]
+        try:
+            for origin, target in reversed(moves):
+                position = rules.undo_move(position, origin, target)
+                positions.append(position)
+        except ValueError:
+            continue
+        positions.reverse()
+        for ply in range(0, len(moves), settings.KEYFRAME_INTERVAL):
+            position = positions[ply]
+            cat1, cat2, cat3, cat4 = position.cats
+            keyframes.append(Keyframe(
+                game_id=game.id, ply=ply, cat1=cat1, cat2=cat2, cat3=cat3,
+                cat4=cat4, mouse=position.mouse,
+                cat_turn=position.cat_turn))
+        if len(keyframes) >= 1000:
+            Keyframe.objects.bulk_create(keyframes)
+            keyframes = []
+    Keyframe.objects.bulk_create(keyframes)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datamodel', '0014_bot_user'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_keyframes, migrations.RunPython.noop),
+    ]
@@ -1,13 +1,21 @@
-from django.db import models
+import random
+
+from django.conf import settings
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator, MinValueValidator
+from datamodel import archive, bitboard, events, game_cache, rules, stats
 
 
 MSG_ERROR_INVALID_CELL = "Invalid cell for a cat or the mouse|" +\
                          "Gato o ratón en posición no válida"
 MSG_ERROR_GAMESTATUS = "Game status not valid|Estado no válido"
 MSG_ERROR_MOVE = "Move not allowed|Movimiento no permitido"
+MSG_ERROR_STALE_GAME = "The game has changed, try again|" +\
+                       "La partida ha cambiado, inténtalo de nuevo"
 MSG_ERROR_NEW_COUNTER = "Insert not allowed|Inseción no permitida"
 
 
@@ -20,6 +28,109 @@ class GameStatus():
     FINISHED = 2
 
 
+class GameManager(models.Manager):
+    def claim(self, game_id, user):
+        '''
+        Joins 'user' as the mouse of the open game 'game_id' with a single
+        conditional UPDATE on mouse_user IS NULL, so when several players
+        join the same game at once exactly one of them gets it. Returns the
+        game or None if it was no longer open.
+        '''
+        with transaction.atomic():
+            claimed = self.filter(id=game_id, mouse_user=None,
+                                  status=GameStatus.CREATED).\
+                exclude(cat_user=user).\
+                update(mouse_user=user, status=GameStatus.ACTIVE,
+                       version=F('version') + 1)
+            if not claimed:
+                return None
+            game = self.select_related('cat_user', 'mouse_user').\
+                get(id=game_id)
+            game_cache.store(game)
+            events.publish(game.id, game.version)
+        return game
+
+    def quick_match(self, user, attempts=3):
+        '''
+        Joins 'user' as the mouse of the oldest open game of another player.
+        If there is none, 'user' waits as the cat of its oldest open game,
+        which is created if needed. Players who arrive together may both
+        create one: the later one then joins the game of the earlier one
+        and drops its own, with its game locked so nobody joins it
+        meanwhile. Returns the game.
+        '''
+        game = self._claim_oldest(user, attempts=attempts)
+        if game is not None:
+            return game
+        open_games = self.filter(mouse_user=None, status=GameStatus.CREATED)
+        game = open_games.filter(cat_user=user).order_by('id').first()
+        if game is not None:
+            return game
+        game = self.create(cat_user=user)
+        with transaction.atomic():
+            if open_games.select_for_update().filter(id=game.id).exists():
+                paired = self._claim_oldest(user, before=game.id,
+                                            attempts=attempts)
+                if paired is not None:
+                    game.delete()
+                    return paired
+        return game
+
+    def _claim_oldest(self, user, before=None, attempts=3):
+        '''
+        Joins 'user' as the mouse of the oldest open game of another player
+        (older than game 'before' if given) and returns it, or None if
+        there is none. On PostgreSQL it is a single UPDATE whose subquery
+        picks the game through the open games index, skipping those locked
+        by concurrent claims (FOR UPDATE SKIP LOCKED), so players arriving
+        together get different games at once. Other backends have no SKIP
+        LOCKED or no UPDATE ... RETURNING: the game is looked up and then
+        claimed, and looked up again, up to 'attempts' times, if another
+        player took it first.
+        '''
+        if connection.vendor == 'postgresql':
+            return self._claim_oldest_sql(user, before)
+        skip_locked = connection.features.has_select_for_update_skip_locked
+        games = self.filter(mouse_user=None, status=GameStatus.CREATED).\
+            exclude(cat_user=user)
+        if before is not None:
+            games = games.filter(id__lt=before)
+        for _ in range(attempts):
+            with transaction.atomic():
+                game_id = games.select_for_update(skip_locked=skip_locked).\
+                    order_by('id').values_list('id', flat=True).first()
+                if game_id is None:
+                    return None
+                game = self.claim(game_id, user)
+                if game is not None:
+                    return game
+        return None
+
+    def _claim_oldest_sql(self, user, before):
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        older = '' if before is None else 'AND id < %s '
+        params = [user.id, GameStatus.ACTIVE, GameStatus.CREATED, user.id]
+        if before is not None:
+            params.append(before)
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'UPDATE {0} SET mouse_user_id = %s, status = %s, '
+                    'version = version + 1 WHERE id = (SELECT id FROM {0} '
+                    'WHERE mouse_user_id IS NULL AND status = %s AND '
+                    'cat_user_id <> %s {1}ORDER BY id LIMIT 1 '
+                    'FOR UPDATE SKIP LOCKED) RETURNING id'.format(
+                        table, older), params)
+                row = cursor.fetchone()
+            if row is None:
+                return None
+            game = self.select_related('cat_user', 'mouse_user').\
+                get(id=row[0])
+            game_cache.store(game)
+            events.publish(game.id, game.version)
+        return game
+
+
 class Game(models.Model):
     '''
     (main author: Rafael Sanchez)
@@ -66,11 +177,76 @@ class Game(models.Model):
     # Game winner (if any)
     winner = models.ForeignKey(User, on_delete=models.CASCADE, blank=True,
                                null=True, related_name="game_winner")
+    # Increased on every write, used for optimistic concurrency control
+    version = models.PositiveIntegerField(default=0)
+    # Number of moves played so far
+    ply = models.PositiveIntegerField(default=0)
+    # Moves and move dates of finished games moved to cold storage, whose
+    # Move rows are deleted (see datamodel/archive.py)
+    move_log = models.BinaryField(null=True, editable=False)
+    move_dates = models.BinaryField(null=True, editable=False)
+
+    objects = GameManager()
+
+    class Meta:
+        # Games of a player by status, newest first (play and replay
+        # lists). Open games (mouse_user IS NULL) have a partial index
+        # created in migration 0011, which Django 2.1 cannot declare here
+        indexes = [
+            models.Index(fields=['cat_user', 'status', '-id'],
+                         name='game_cat_status_idx'),
+            models.Index(fields=['mouse_user', 'status', '-id'],
+                         name='game_mouse_status_idx'),
+        ]
+
+    @property
+    def archived(self):
+        return self.move_log is not None
 
     # Game moves
     @property
     def moves(self):
-        return Move.objects.filter(game=self).order_by('date')
+        if self.archived:
+            return archive.archived_moves(self)
+        return Move.objects.filter(game=self).order_by('ply')
+
+    def get_move(self, ply):
+        '''
+        Returns the move with number 'ply' (the first move is ply 1)
+        '''
+        if self.archived:
+            if not 1 <= ply <= self.ply:
+                raise Move.DoesNotExist()
+            return self.moves[ply - 1]
+        return Move.objects.get(game=self, ply=ply)
+
+    def position_at(self, ply):
+        '''
+        Returns the rules.Position after 'ply' moves. It starts from the
+        closest stored keyframe before 'ply' (or from the current position
+        if that is closer) so only a few moves are replayed.
+        '''
+        if ply < 0 or ply > self.ply:
+            raise ValueError(ply)
+        if self.archived:
+            position = self.position
+            moves = rules.unpack_moves(bytes(self.move_log))[ply:]
+            for origin, target in reversed(moves):
+                position = rules.undo_move(position, origin, target)
+            return position
+        keyframe = Keyframe.objects.filter(game=self, ply__lte=ply).\
+            order_by('-ply').first()
+        if keyframe is None or self.ply - ply < ply - keyframe.ply:
+            position = self.position
+            moves = self.moves.filter(ply__gt=ply).order_by('-ply')
+            for origin, target in moves.values_list('origin', 'target'):
+                position = rules.undo_move(position, origin, target)
+            return position
+        position = keyframe.position
+        moves = self.moves.filter(ply__gt=keyframe.ply, ply__lte=ply)
+        for origin, target in moves.values_list('origin', 'target'):
+            position = rules.apply_move(position, origin, target, check=False)
+        return position
 
     def __str_game_status(self):
         if self.status == 0:
@@ -83,6 +259,8 @@ class Game(models.Model):
     def __pos_is_valid(self, position):
         if not position:
             return True
+        if not bitboard.on_board(position):
+            return False
         odd_col = bool((position//Game.WIDTH) % 2)
         odd_row = bool((position % Game.WIDTH) % 2)
         return not (odd_col ^ odd_row)
@@ -114,36 +292,89 @@ class Game(models.Model):
 
         if self.__game_end():
             self.status = GameStatus.FINISHED
-        super(Game, self).save(*args, **kwargs)
+        with transaction.atomic():
+            if self._state.adding:
+                self.version += 1
+                try:
+                    super(Game, self).save(*args, **kwargs)
+                except Exception:
+                    self.version -= 1
+                    raise
+                finishing = self.status == GameStatus.FINISHED
+            else:
+                finishing = self.__update()
+                self.version += 1
+            # The stats of the players count the game once, when it
+            # finishes
+            if finishing:
+                stats.record_game(self)
+        game_cache.store(self)
+        events.publish(self.id, self.version)
+
+    def __update(self):
+        '''
+        Writes the game with a conditional UPDATE that only succeeds if
+        nobody has written it since it was read, like _save_move, and
+        raises ValidationError if the game was stale. The row is locked
+        until the end of the transaction. Returns whether this write
+        finishes the game.
+        '''
+        stored = Game.objects.select_for_update().filter(
+            id=self.pk, version=self.version)
+        status = stored.values_list('status', flat=True).first()
+        fields = {field.attname: getattr(self, field.attname)
+                  for field in self._meta.concrete_fields
+                  if not field.primary_key and field.name != 'version'}
+        if status is None or not stored.update(
+                version=F('version') + 1, **fields):
+            raise ValidationError(MSG_ERROR_STALE_GAME)
+        return (self.status == GameStatus.FINISHED and
+                status != GameStatus.FINISHED)
+
+    def _save_move(self, position):
+        '''
+        Stores 'position' with a single conditional UPDATE that only
+        succeeds if nobody has written the game since it was read. Returns
+        False (leaving the row untouched) if the game was stale.
+        '''
+        self._set_position(position)
+        if self.__game_end():
+            self.status = GameStatus.FINISHED
+        updated = Game.objects.filter(id=self.id, version=self.version).\
+            update(cat1=self.cat1, cat2=self.cat2, cat3=self.cat3,
+                   cat4=self.cat4, mouse=self.mouse, cat_turn=self.cat_turn,
+                   status=self.status, winner=self.winner,
+                   version=self.version + 1, ply=self.ply + 1)
+        if not updated:
+            return False
+        self.version += 1
+        self.ply += 1
+        if self.status == GameStatus.FINISHED:
+            stats.record_game(self)
+        game_cache.store(self)
+        events.publish(self.id, self.version)
+        return True
 
     def __game_end(self):
-        cats = self._get_cat_places()
-        cats = [tuple(self.__pos_to_list(c)) for c in cats]
-        min_cat = min(cats)
-        mouse = self.__pos_to_list(self.mouse)
-        if mouse[0] <= min_cat[0]:
+        winner = rules.winner(self.position)
+        if winner == rules.MOUSE:
             self.winner = self.mouse_user
-            return True
-        SE_lst = tuple([x+1 for x in mouse])
-        SW_lst = tuple([mouse[0]+1, mouse[1]-1])
-        NW_lst = tuple([x-1 for x in mouse])
-        NE_lst = tuple([mouse[0]-1, mouse[1]+1])
-        possible_moves = set([SE_lst, SW_lst, NW_lst, NE_lst])
-        cats = set(cats)
-        possible_moves = possible_moves.difference(cats)
-        possible_moves = [move for move in possible_moves if
-                          (move[0] >= 1 and move[0] <= 8 and move[1] >= 1
-                           and move[1] <= 8)]
-        if len(possible_moves) == 0:
+        elif winner == rules.CAT:
             self.winner = self.cat_user
-            return True
-        return False
+        return winner is not None
 
     def _get_cat_places(self):
         return [self.cat1, self.cat2, self.cat3, self.cat4]
 
-    def __pos_to_list(self, position):
-        return [(position//Game.WIDTH) + 1, (position % Game.WIDTH) + 1]
+    @property
+    def position(self):
+        return rules.Position((self.cat1, self.cat2, self.cat3, self.cat4),
+                              self.mouse, self.cat_turn)
+
+    def _set_position(self, position):
+        self.cat1, self.cat2, self.cat3, self.cat4 = position.cats
+        self.mouse = position.mouse
+        self.cat_turn = position.cat_turn
 
     def __str__(self):
         id = str(self.id)
@@ -184,112 +415,156 @@ class Move(models.Model):
     game = models.ForeignKey(Game, on_delete=models.CASCADE)
     player = models.ForeignKey(User, on_delete=models.CASCADE)
     date = models.DateTimeField(auto_now_add=True)
+    # Position of the move in the game log, starting at 1
+    ply = models.PositiveIntegerField()
 
-    def __pos_to_list(self, position):
-        return [(position//Game.WIDTH) + 1, (position % Game.WIDTH) + 1]
-
-    def __cat_valid_move(self):
-        if not self.game.cat_turn:
-            return False
-        cats = self.game._get_cat_places()
-        if self.origin not in cats or self.target in cats:
-            return False
-        if self.target == self.game.mouse:
-            return False
-        origin_lst = self.__pos_to_list(self.origin)
-        target_lst = self.__pos_to_list(self.target)
-        SE_lst = [x+1 for x in origin_lst]
-        SW_lst = [origin_lst[0]+1, origin_lst[1]-1]
-        if SE_lst == target_lst:
-            return True
-        if SW_lst == target_lst:
-            return True
-        return False
-
-    def __mouse_valid_move(self):
-        if self.game.cat_turn:
-            return False
-        cats = self.game._get_cat_places()
-        if self.target in cats:
-            return False
-        if self.origin != self.game.mouse:
-            return False
-        origin_lst = self.__pos_to_list(self.origin)
-        target_lst = self.__pos_to_list(self.target)
-        SE_lst = [x+1 for x in origin_lst]
-        SW_lst = [origin_lst[0]+1, origin_lst[1]-1]
-        NW_lst = [x-1 for x in origin_lst]
-        NE_lst = [origin_lst[0]-1, origin_lst[1]+1]
-        if SE_lst == target_lst:
-            return True
-        if SW_lst == target_lst:
-            return True
-        if NW_lst == target_lst:
-            return True
-        if NE_lst == target_lst:
-            return True
-        return False
+    class Meta:
+        unique_together = ('game', 'ply')
 
     def save(self, *args, **kwargs):
         if self.target < 0 or self.target > 63:
             raise ValidationError(MSG_ERROR_MOVE)
-        if self.player != self.game.mouse_user and\
-           self.player != self.game.cat_user:
+        if self.player == self.game.cat_user:
+            role = rules.CAT
+        elif self.player == self.game.mouse_user:
+            role = rules.MOUSE
+        else:
             raise ValidationError(MSG_ERROR_MOVE)
         if self.game.status != GameStatus.ACTIVE:
             raise ValidationError(MSG_ERROR_MOVE)
-        if self.player == self.game.cat_user and not self.__cat_valid_move():
+        previous = self.game.position
+        if role != previous.side_to_move:
             raise ValidationError(MSG_ERROR_MOVE)
-        if self.player == self.game.mouse_user and not\
-           self.__mouse_valid_move():
+        try:
+            position = rules.apply_move(previous, self.origin, self.target)
+        except rules.IllegalMove:
             raise ValidationError(MSG_ERROR_MOVE)
 
-        super(Move, self).save(*args, **kwargs)
-        if self.player == self.game.mouse_user:
-            self.game.mouse = self.target
-            self.game.cat_turn = True
-        else:
-            if self.origin == self.game.cat1:
-                self.game.cat1 = self.target
-            elif self.origin == self.game.cat2:
-                self.game.cat2 = self.target
-            elif self.origin == self.game.cat3:
-                self.game.cat3 = self.target
-            else:
-                self.game.cat4 = self.target
-            self.game.cat_turn = False
-        self.game.save()
+        with transaction.atomic():
+            saved = self.game._save_move(position)
+            if saved:
+                self.ply = self.game.ply
+                super(Move, self).save(*args, **kwargs)
+                if (self.ply - 1) % settings.KEYFRAME_INTERVAL == 0:
+                    Keyframe.objects.create_from_position(
+                        self.game, self.ply - 1, previous)
+        if not saved:
+            # The copy of the game was stale, cached ones too
+            self.game.refresh_from_db()
+            game_cache.store(self.game)
+            raise ValidationError(MSG_ERROR_STALE_GAME)
 
     def __str__(self):
         return '['+str(self.player)+'] - Origen: '+str(self.origin)\
                 + ' - Destino: '+str(self.target)
 
 
+class KeyframeManager(models.Manager):
+    def create_from_position(self, game, ply, position):
+        cat1, cat2, cat3, cat4 = position.cats
+        return self.create(game=game, ply=ply, cat1=cat1, cat2=cat2,
+                           cat3=cat3, cat4=cat4, mouse=position.mouse,
+                           cat_turn=position.cat_turn)
+
+
+class Keyframe(models.Model):
+    '''
+    Snapshot of the board of a game after 'ply' moves. One is stored every
+    settings.KEYFRAME_INTERVAL moves, so any position of the game can be
+    rebuilt replaying a few moves.
+    '''
+    game = models.ForeignKey(Game, on_delete=models.CASCADE)
+    ply = models.PositiveIntegerField()
+    cat1 = models.IntegerField()
+    cat2 = models.IntegerField()
+    cat3 = models.IntegerField()
+    cat4 = models.IntegerField()
+    mouse = models.IntegerField()
+    cat_turn = models.BooleanField()
+    objects = KeyframeManager()
+
+    class Meta:
+        unique_together = ('game', 'ply')
+
+    @property
+    def position(self):
+        return rules.Position((self.cat1, self.cat2, self.cat3, self.cat4),
+                              self.mouse, self.cat_turn)
+
+
+class UserStats(models.Model):
+    '''
+    Results of the finished games of a player, updated as its games finish
+    (see datamodel/stats.py)
+    '''
+    user = models.OneToOneField(User, on_delete=models.CASCADE,
+                                primary_key=True, related_name='stats')
+    games = models.PositiveIntegerField(default=0)
+    wins = models.PositiveIntegerField(default=0)
+    cat_wins = models.PositiveIntegerField(default=0)
+    mouse_wins = models.PositiveIntegerField(default=0)
+    # Moves of all its games, for their average length
+    plies = models.PositiveIntegerField(default=0)
+    # Games won in a row, up to the last one, and the longest such run
+    streak = models.PositiveIntegerField(default=0)
+    best_streak = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        # Leaderboard, read in this order (see stats.LEADERBOARD_ORDER)
+        indexes = [
+            models.Index(fields=['-wins', 'games', 'user'],
+                         name='stats_leaderboard_idx'),
+        ]
+
+    @property
+    def average_length(self):
+        return self.plies / self.games if self.games else 0
+
+    def add(self, role, won, plies):
+        '''
+        Adds a game played as 'role' to these stats, without saving them
+        '''
+        self.games += 1
+        self.plies += plies
+        if won:
+            self.wins += 1
+            if role == rules.CAT:
+                self.cat_wins += 1
+            else:
+                self.mouse_wins += 1
+            self.streak += 1
+            self.best_streak = max(self.best_streak, self.streak)
+        else:
+            self.streak = 0
+
+
 class CounterManager(models.Manager):
     '''
     (author: Rafael Sanchez)
+    The counter is spread over settings.COUNTER_SHARDS rows (the row id
+    is the shard number). Increments hit a random shard with a single
+    UPDATE and the current value is the sum of every shard.
     '''
-    def init_counter(self):
-        counter = Counter()
-        super(Counter, counter).save()
+    def init_counter(self, shard=1, value=0):
+        counter = Counter(id=shard, value=value)
+        super(Counter, counter).save(force_insert=True)
         return counter
 
-    def inc(self):
-        objs = self.get_queryset()
-        if len(objs) == 0:
-            counter = self.init_counter()
-        else:
-            counter = objs[0]
-        val = self.get_current_value()
-        counter.value = val+1
-        super(Counter, counter).save()
-        return val+1
+    def inc(self, fetch=True):
+        shard = random.randint(1, settings.COUNTER_SHARDS)
+        if not self.filter(id=shard).update(value=F('value') + 1):
+            try:
+                with transaction.atomic():
+                    self.init_counter(shard, value=1)
+            except IntegrityError:
+                # Another worker created the shard in the meantime
+                self.filter(id=shard).update(value=F('value') + 1)
+        if fetch:
+            return self.get_current_value()
 
     def get_current_value(self):
-        objs = super().get_queryset()
-        if len(objs) == 0:
-            return 0
-        return objs[0].value
+        return super().get_queryset().aggregate(
+            total=Coalesce(Sum('value'), 0))['total']
 
 
 class Counter(models.Model):
@@ -0,0 +1,229 @@
+"""
+Mouse & cat rules on plain immutable values.
+
+Nothing in this module touches Django, so simulators, replays, analytics and
+tests can validate and play positions without model instances or a database.
+'Game' and 'Move' delegate their rule checks here.
+"""
+
+from collections import namedtuple
+
+from datamodel import bitboard
+
+CAT = 'cat'
+MOUSE = 'mouse'
+
+
+class IllegalMove(ValueError):
+    '''
+    Raised when applying a move that the rules do not allow
+    '''
+    pass
+
+
+class Position(namedtuple('Position', ['cats', 'mouse', 'cat_turn'])):
+    '''
+    Immutable board position.
+        cats: tuple with the cell of every cat, in slot order (cat1..cat4)
+        mouse: cell of the mouse
+        cat_turn: True if cats move next, False if the mouse does
+    '''
+    __slots__ = ()
+
+    @property
+    def cats_mask(self):
+        return bitboard.cells_to_mask(self.cats)
+
+    @property
+    def mouse_mask(self):
+        return 1 << self.mouse
+
+    @property
+    def side_to_move(self):
+        return CAT if self.cat_turn else MOUSE
+
+
+INITIAL_POSITION = Position((0, 2, 4, 6), 59, True)
+
+
+def legal_moves(position):
+    """
+    legal_moves
+    ----------
+    Input parameters:
+        position: Position
+    ----------
+    Returns:
+        List of (origin, target) tuples the side to move can play
+    """
+    cats = position.cats_mask
+    if position.cat_turn:
+        free = ~(cats | position.mouse_mask)
+        return [(origin, target)
+                for origin in bitboard.iter_cells(cats)
+                for target in bitboard.iter_cells(
+                    bitboard.CAT_MOVES[origin] & free)]
+    origin = position.mouse
+    if not bitboard.on_board(origin):
+        return []
+    return [(origin, target)
+            for target in bitboard.iter_cells(
+                bitboard.MOUSE_MOVES[origin] & ~cats)]
+
+
+def is_legal(position, origin, target):
+    """
+    is_legal
+    ----------
+    Input parameters:
+        position: Position
+        origin: cell the piece moves from
+        target: cell the piece moves to
+    ----------
+    Returns:
+        True if the side to move can move a piece from origin to target
+    """
+    if position.cat_turn:
+        return bitboard.cat_move_is_valid(position.cats_mask,
+                                          position.mouse_mask,
+                                          origin, target)
+    return bitboard.mouse_move_is_valid(position.cats_mask,
+                                        position.mouse_mask,
+                                        origin, target)
+
+
+def apply_move(position, origin, target, check=True):
+    """
+    apply_move
+    ----------
+    Input parameters:
+        position: Position
+        origin: cell the piece moves from
+        target: cell the piece moves to
+        check: validate the move first. Replays of moves that were already
+            validated when played can skip it
+    ----------
+    Returns:
+        New Position after the move, with the turn passed to the other side
+    ----------
+    Raises:
+        IllegalMove if the move is not legal in 'position'
+    """
+    if check and not is_legal(position, origin, target):
+        raise IllegalMove((origin, target))
+    if position.mouse == origin:
+        return Position(position.cats, target, True)
+    cats = list(position.cats)
+    cats[cats.index(origin)] = target
+    return Position(tuple(cats), position.mouse, False)
+
+
+def winner(position):
+    """
+    winner
+    ----------
+    Input parameters:
+        position: Position
+    ----------
+    Returns:
+        MOUSE if the mouse has escaped, CAT if the mouse cannot move and
+        None if the game goes on
+    """
+    cats = position.cats_mask
+    if bitboard.mouse_escaped(cats, position.mouse):
+        return MOUSE
+    if bitboard.mouse_trapped(cats, position.mouse):
+        return CAT
+    return None
+
+
+def is_terminal(position):
+    """
+    is_terminal
+    ----------
+    Input parameters:
+        position: Position
+    ----------
+    Returns:
+        True if the game is over in 'position'
+    """
+    return winner(position) is not None
+
+
+def undo_move(position, origin, target):
+    """
+    undo_move
+    ----------
+    Input parameters:
+        position: Position reached after playing the move
+        origin: cell the piece moved from
+        target: cell the piece moved to
+    ----------
+    Returns:
+        Position before the move. Whether the mouse or a cat moved is told
+        by the piece standing on 'target'
+    """
+    if position.mouse == target:
+        return Position(position.cats, origin, False)
+    cats = list(position.cats)
+    cats[cats.index(target)] = origin
+    return Position(tuple(cats), position.mouse, True)
+
+
+def pack_move(origin, target):
+    """
+    pack_move
+    ----------
+    Input parameters:
+        origin: cell the piece moves from
+        target: cell the piece moves to (one diagonal step away)
+    ----------
+    Returns:
+        The move as one byte: origin in the 6 high bits and the index of
+        the direction (SE, SW, NW, NE) in the 2 low bits
+    """
+    row, col = divmod(origin, bitboard.WIDTH)
+    t_row, t_col = divmod(target, bitboard.WIDTH)
+    direction = bitboard.MOUSE_STEPS.index((t_row - row, t_col - col))
+    return origin << 2 | direction
+
+
+def unpack_move(packed):
+    """
+    unpack_move
+    ----------
+    Input parameters:
+        packed: byte built by pack_move
+    ----------
+    Returns:
+        (origin, target) tuple
+    """
+    origin = packed >> 2
+    d_row, d_col = bitboard.MOUSE_STEPS[packed & 3]
+    return origin, origin + d_row * bitboard.WIDTH + d_col
+
+
+def pack_moves(moves):
+    """
+    pack_moves
+    ----------
+    Input parameters:
+        moves: iterable of (origin, target) tuples
+    ----------
+    Returns:
+        bytes with one packed move per ply
+    """
+    return bytes(pack_move(origin, target) for origin, target in moves)
+
+
+def unpack_moves(packed):
+    """
+    unpack_moves
+    ----------
+    Input parameters:
+        packed: bytes built by pack_moves
+    ----------
+    Returns:
+        List of (origin, target) tuples
+    """
+    return [unpack_move(byte) for byte in packed]
@@ -0,0 +1,146 @@
+"""
+Statistics of the players, kept up to date as games finish.
+
+Every UserStats row holds the finished games of a player, its wins as the
+cats and as the mouse, the plies of its games (for the average length) and
+its current and best runs of wins. record_game updates the rows of both
+players with a single UPDATE each, in the transaction that finishes the
+game, so the stats never scan the games. The leaderboard reads the rows in
+the order of their index (most wins, then fewest games), without the
+computer player (datamodel/bot.py), which plays everyone. rebuild
+recomputes every row from the finished games in one pass, for instance
+after import_games, which does not update them; moves wait while it runs.
+"""
+
+from django.conf import settings
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from datamodel import rules
+
+LEADERBOARD_ORDER = ('-wins', 'games', 'user_id')
+
+
+def _results(cat_user_id, mouse_user_id, winner_id):
+    '''
+    Yields (user_id, role, won) for every player of a finished game
+    '''
+    for user_id, role in ((cat_user_id, rules.CAT),
+                          (mouse_user_id, rules.MOUSE)):
+        if user_id is not None:
+            yield user_id, role, user_id == winner_id
+
+
+def _add(user_id, role, won, plies):
+    '''
+    Adds a game to the stats of 'user_id' with one UPDATE, creating its row
+    if it has none
+    '''
+    from datamodel.models import UserStats
+
+    wins = 1 if won else 0
+    changes = {'games': F('games') + 1, 'plies': F('plies') + plies,
+               'wins': F('wins') + wins}
+    if role == rules.CAT:
+        changes['cat_wins'] = F('cat_wins') + wins
+    else:
+        changes['mouse_wins'] = F('mouse_wins') + wins
+    if won:
+        changes['streak'] = F('streak') + 1
+        changes['best_streak'] = Greatest('best_streak', F('streak') + 1)
+    else:
+        changes['streak'] = 0
+    stats = UserStats.objects.filter(user_id=user_id)
+    if stats.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            row = UserStats(user_id=user_id)
+            row.add(role, won, plies)
+            row.save(force_insert=True)
+    except IntegrityError:
+        # Another game of the player finished in the meantime
+        stats.update(**changes)
+
+
+def record_game(game):
+    """
+    record_game
+    ----------
+    Input parameters:
+        game: Game that has just finished
+    ----------
+    Description:
+        Adds the game to the stats of its players. It has to be called once
+        per game, in the transaction that finishes it.
+    """
+    for user_id, role, won in _results(game.cat_user_id, game.mouse_user_id,
+                                       game.winner_id):
+        _add(user_id, role, won, game.ply)
+
+
+def leaderboard(limit):
+    """
+    leaderboard
+    ----------
+    Input parameters:
+        limit: number of players
+    ----------
+    Returns:
+        List of the UserStats of the 'limit' best players, with their users.
+        The computer player is left out, as bot.is_bot tells it apart
+    """
+    from datamodel.models import UserStats
+
+    return list(UserStats.objects.select_related('user').exclude(
+        user__username=settings.BOT_USERNAME,
+        user__password__startswith=UNUSABLE_PASSWORD_PREFIX).order_by(
+            *LEADERBOARD_ORDER)[:limit])
+
+
+def rebuild(chunk_size=2000):
+    """
+    rebuild
+    ----------
+    Input parameters:
+        chunk_size: games fetched at a time
+    ----------
+    Returns:
+        Tuple (games, players) with the finished games read and the stats
+        rows written
+    ----------
+    Description:
+        Reads the finished games once, by ID, with a server-side cursor,
+        adds them up in memory (one row per player) and replaces every
+        UserStats row. Runs of wins follow the order of the IDs, which is
+        the order the games were created in. It all happens in one
+        transaction that first locks the games not finished yet, so no game
+        finishes between the reading of the games and the writing of the
+        stats: moves wait for the rebuild to end. Where the database cannot
+        lock rows (SQLite) it has to be run while no games are in progress,
+        or the games finishing meanwhile may be lost from the stats.
+    """
+    from datamodel.models import Game, GameStatus, UserStats
+
+    stats = {}
+    n_games = 0
+    with transaction.atomic():
+        # Locks the games in progress until the stats are written
+        list(Game.objects.select_for_update().exclude(
+            status=GameStatus.FINISHED).values_list('id', flat=True))
+        games = Game.objects.filter(status=GameStatus.FINISHED).\
+            order_by('id').values_list('cat_user_id', 'mouse_user_id',
+                                       'winner_id', 'ply').\
+            iterator(chunk_size=chunk_size)
+        for cat_user_id, mouse_user_id, winner_id, ply in games:
+            n_games += 1
+            for user_id, role, won in _results(cat_user_id, mouse_user_id,
+                                               winner_id):
+                if user_id not in stats:
+                    stats[user_id] = UserStats(user_id=user_id)
+                stats[user_id].add(role, won, ply)
+        UserStats.objects.all().delete()
+        UserStats.objects.bulk_create(stats.values(), batch_size=1000)
+    return n_games, len(stats)
@@ -0,0 +1,280 @@
+"""
+Perfect-play tablebase of the mouse & cat game.
+
+Pieces only move diagonally, so they never leave the 32 dark cells they
+start on, and the 4 cats are interchangeable: there are C(32, 4) sets of
+cats * 32 mouse cells * 2 sides to move = 2,301,440 positions. generate()
+solves all of them and build_tablebase stores them in a binary file, one
+byte per position, which get() memory-maps: workers share the pages of the
+file and every lookup is a single index operation.
+
+Cats only move forward, so no position can repeat. Positions are solved
+backwards from the sets of cats closest to the last row: the moves of the
+cats lead to sets already solved, and the moves of the mouse to positions
+of the same set with the cats to move, which are solved first.
+
+Every byte is 0 for draws (the cats cannot move and the mouse can) and for
+positions that cannot happen (the mouse on a cat), or 1 + 2 * plies + won
+for the side to move, 'plies' being the moves left to the end of the game
+with perfect play: the winner ends it as soon as it can and the loser
+delays it as much as it can.
+"""
+
+import itertools
+import mmap
+import os
+from collections import namedtuple
+
+from django.conf import settings
+
+from datamodel import bitboard, rules
+
+MAGIC = b'MOUSECAT-TB1\n'
+DARK_CELLS = tuple(cell for cell in range(bitboard.N_CELLS)
+                   if (cell // bitboard.WIDTH + cell) % 2 == 0)
+N_DARK = len(DARK_CELLS)
+DARK_INDEX = dict((cell, i) for i, cell in enumerate(DARK_CELLS))
+N_CATS = 4
+
+
+def _binomial(n, k):
+    result = 1
+    for i in range(k):
+        result = result * (n - i) // (i + 1)
+    return result
+
+
+# BINOMIAL[n][k]: n choose k, to rank the sets of cats
+BINOMIAL = tuple(tuple(_binomial(n, k) for k in range(N_CATS + 1))
+                 for n in range(N_DARK))
+N_CAT_SETS = _binomial(N_DARK, N_CATS)
+SIZE = N_CAT_SETS * N_DARK * 2
+
+DRAW = 0
+
+Result = namedtuple('Result', ['winner', 'plies'])
+
+
+def _rank(darks):
+    '''
+    Index of a set of cats (sorted dark cell indexes) among all of them
+    '''
+    return sum(BINOMIAL[dark][i + 1] for i, dark in enumerate(darks))
+
+
+def _offset(rank, mouse_dark, cat_turn):
+    return (rank * N_DARK + mouse_dark) * 2 + cat_turn
+
+
+def index(position):
+    """
+    index
+    ----------
+    Input parameters:
+        position: rules.Position
+    ----------
+    Returns:
+        Offset of the position in the tablebase, or None if a piece is off
+        the dark cells or two pieces share a cell. The offsets of those
+        hold draws, which such positions must not get
+    """
+    try:
+        darks = sorted(DARK_INDEX[cell] for cell in position.cats)
+        mouse_dark = DARK_INDEX[position.mouse]
+    except KeyError:
+        return None
+    if len(set(darks)) != N_CATS or mouse_dark in darks:
+        return None
+    return _offset(_rank(darks), mouse_dark, int(position.cat_turn))
+
+
+def decode(code, side_to_move):
+    """
+    decode
+    ----------
+    Input parameters:
+        code: byte of a position in the tablebase
+        side_to_move: rules.CAT or rules.MOUSE
+    ----------
+    Returns:
+        Result (winner, plies) with the winner (None for draws) and the
+        moves left with perfect play (None for draws)
+    """
+    if code == DRAW:
+        return Result(None, None)
+    other = rules.MOUSE if side_to_move == rules.CAT else rules.CAT
+    plies, won = divmod(code - 1, 2)
+    return Result(side_to_move if won else other, plies)
+
+
+def _combine(codes):
+    '''
+    Code of a position from the codes of the positions its moves lead to.
+    Odd codes are lost by the side to move there, so they are won here
+    '''
+    lost = [code for code in codes if code & 1]
+    if lost:
+        # Two more plies than the quickest win after the move
+        return min(lost) + 3
+    if DRAW in codes or not codes:
+        return DRAW
+    return max(codes) + 1
+
+
+def generate():
+    """
+    generate
+    ----------
+    Returns:
+        bytearray with the code of every position, indexed by index()
+    """
+    table = bytearray(SIZE)
+    # Every move of a cat takes it a row down, so sets of cats are solved
+    # by decreasing sum of rows
+    cat_sets = sorted(itertools.combinations(range(N_DARK), N_CATS),
+                      key=lambda darks: -sum(dark // 4 for dark in darks))
+    for darks in cat_sets:
+        cells = [DARK_CELLS[dark] for dark in darks]
+        cats = bitboard.cells_to_mask(cells)
+        rank = _rank(darks)
+        # Moves of the cats, regardless of the mouse: (target, rank after)
+        cat_moves = []
+        for i, cell in enumerate(cells):
+            for target in bitboard.iter_cells(bitboard.CAT_MOVES[cell] &
+                                              ~cats):
+                moved = list(darks)
+                moved[i] = DARK_INDEX[target]
+                cat_moves.append((target, _rank(sorted(moved))))
+
+        mouse_turn = []
+        for mouse_dark, mouse in enumerate(DARK_CELLS):
+            if cats >> mouse & 1:
+                continue
+            if bitboard.mouse_escaped(cats, mouse):
+                table[_offset(rank, mouse_dark, 0)] = 2
+                table[_offset(rank, mouse_dark, 1)] = 1
+            elif bitboard.mouse_trapped(cats, mouse):
+                table[_offset(rank, mouse_dark, 0)] = 1
+                table[_offset(rank, mouse_dark, 1)] = 2
+            else:
+                table[_offset(rank, mouse_dark, 1)] = _combine([
+                    table[_offset(after, mouse_dark, 0)]
+                    for target, after in cat_moves if target != mouse])
+                mouse_turn.append((mouse_dark, mouse))
+        for mouse_dark, mouse in mouse_turn:
+            table[_offset(rank, mouse_dark, 0)] = _combine([
+                table[_offset(rank, DARK_INDEX[target], 1)]
+                for target in bitboard.iter_cells(
+                    bitboard.MOUSE_MOVES[mouse] & ~cats)])
+    return table
+
+
+def write(path, table):
+    """
+    write
+    ----------
+    Input parameters:
+        path: file to write
+        table: result of generate()
+    ----------
+    Description:
+        The file is written next to 'path' and renamed over it, so the
+        workers that have the old one mapped keep reading a whole file.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as tmp:
+        tmp.write(MAGIC)
+        tmp.write(table)
+    os.replace(tmp_path, path)
+
+
+class Tablebase():
+    '''
+    Tablebase file mapped in memory
+    '''
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as tb_file:
+            self.data = mmap.mmap(tb_file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        if (len(self.data) != len(MAGIC) + SIZE or
+                self.data[:len(MAGIC)] != MAGIC):
+            self.data.close()
+            raise ValueError('%s is not a tablebase' % path)
+
+    def code(self, position):
+        offset = index(position)
+        if offset is None:
+            return None
+        return self.data[len(MAGIC) + offset]
+
+    def probe(self, position):
+        """
+        probe
+        ----------
+        Input parameters:
+            position: rules.Position
+        ----------
+        Returns:
+            Result (winner, plies) of the position with perfect play, or
+            None if the position is not in the tablebase
+        """
+        code = self.code(position)
+        if code is None:
+            return None
+        return decode(code, position.side_to_move)
+
+    def best_move(self, position):
+        """
+        best_move
+        ----------
+        Input parameters:
+            position: rules.Position
+        ----------
+        Returns:
+            (origin, target) of a perfect move: the quickest win, a draw or
+            the slowest loss, in that order. None if there are no legal
+            moves or the position is not in the tablebase
+        """
+        if self.code(position) is None:
+            return None
+        best, best_score = None, None
+        for origin, target in rules.legal_moves(position):
+            code = self.code(rules.apply_move(position, origin, target,
+                                              check=False))
+            # Higher is better for the side moving now
+            if code == DRAW:
+                score = 0
+            elif code & 1:
+                score = 1000 - code
+            else:
+                score = code - 1000
+            if best_score is None or score > best_score:
+                best, best_score = (origin, target), score
+        return best
+
+    def close(self):
+        self.data.close()
+
+
+_tablebase = None
+
+
+def get():
+    """
+    get
+    ----------
+    Returns:
+        Tablebase in settings.TABLEBASE_PATH, mapped the first time it is
+        needed in the process, or None if the file is not there
+    """
+    global _tablebase
+    path = settings.TABLEBASE_PATH
+    if _tablebase is None or _tablebase.path != path:
+        if not os.path.exists(path):
+            return None
+        _tablebase = Tablebase(path)
+    return _tablebase
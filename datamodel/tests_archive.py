@@ -0,0 +1,113 @@
+"""
+Tests of the archival of finished games
+"""
+
+import datetime
+
+from django.test import SimpleTestCase, TransactionTestCase
+
+from . import archive, game_cache, rules, tests
+from .models import Game, GameStatus, Keyframe, Move
+
+
+class PackDatesTests(SimpleTestCase):
+    def test1(self):
+        """ Dates are kept to the millisecond, whatever their order """
+        start = datetime.datetime(2019, 12, 12, 1, 9, 30, 123456)
+        dates = [start, start + datetime.timedelta(seconds=2),
+                 start + datetime.timedelta(days=90),
+                 start + datetime.timedelta(days=90, milliseconds=-1500),
+                 start + datetime.timedelta(days=90, milliseconds=-1500)]
+        packed = archive.pack_dates(dates)
+        self.assertEqual(archive.unpack_dates(packed),
+                         [date.replace(microsecond=date.microsecond //
+                                       1000 * 1000) for date in dates])
+        # The first date takes a few bytes, the others one or two
+        self.assertLess(len(packed), 20)
+        self.assertEqual(archive.unpack_dates(b''), [])
+
+
+class ArchiveTests(TransactionTestCase):
+    def setUp(self):
+        game_cache.get_cache().clear()
+        self.cat_user = tests.BaseModelTest.get_or_create_user('archive_cat')
+        self.mouse_user = tests.BaseModelTest.get_or_create_user(
+            'archive_mouse')
+        self.finished = Game.objects.create(cat_user=self.cat_user,
+                                            mouse_user=self.mouse_user)
+        self.play(self.finished)
+        self.active = Game.objects.create(cat_user=self.cat_user,
+                                          mouse_user=self.mouse_user)
+        Move.objects.create(game=self.active, player=self.cat_user,
+                            origin=0, target=9)
+
+    def play(self, game):
+        while game.status == GameStatus.ACTIVE:
+            origin, target = rules.legal_moves(game.position)[-1]
+            player = game.cat_user if game.cat_turn else game.mouse_user
+            Move.objects.create(game=game, player=player, origin=origin,
+                                target=target)
+
+    def archive(self, batch_size=100):
+        return [batch for batch in archive.archive_finished(batch_size)]
+
+    def test1(self):
+        """ Finished games keep their moves without Move rows """
+        moves = list(self.finished.moves.values_list('ply', 'origin',
+                                                     'target', 'player_id'))
+        dates = list(self.finished.moves.values_list('date', flat=True))
+        positions = [self.finished.position_at(ply)
+                     for ply in range(self.finished.ply + 1)]
+        self.assertGreater(Keyframe.objects.filter(
+            game=self.finished).count(), 1)
+
+        self.assertEqual(self.archive(), [(1, len(moves), 0)])
+        self.assertFalse(Move.objects.filter(game=self.finished).exists())
+        self.assertFalse(Keyframe.objects.filter(
+            game=self.finished).exists())
+
+        game = Game.objects.get(id=self.finished.id)
+        self.assertTrue(game.archived)
+        self.assertEqual(len(bytes(game.move_log)), game.ply)
+        with self.assertNumQueries(0):
+            self.assertEqual(game.moves.count(), len(moves))
+            self.assertEqual(game.moves.values_list(
+                'ply', 'origin', 'target', 'player_id'), moves)
+            for archived, date in zip(game.moves, dates):
+                self.assertLess(abs(archived.date - date),
+                                datetime.timedelta(milliseconds=1))
+            self.assertEqual(game.get_move(3).origin, moves[2][1])
+            self.assertEqual([game.position_at(ply)
+                              for ply in range(game.ply + 1)], positions)
+        with self.assertRaises(Move.DoesNotExist):
+            game.get_move(game.ply + 1)
+
+    def test2(self):
+        """ Only finished games are archived, and only once """
+        self.archive()
+        self.assertEqual(Move.objects.filter(game=self.active).count(), 1)
+        self.assertFalse(Game.objects.get(id=self.active.id).archived)
+        self.assertEqual(self.archive(), [])
+
+    def test3(self):
+        """ Archival goes in batches and replaces the cached games """
+        version = game_cache.get_game(self.finished.id).version
+        self.assertIsNone(game_cache.cached(self.finished.id)['move_log'])
+        second = Game.objects.create(cat_user=self.mouse_user,
+                                     mouse_user=self.cat_user)
+        self.play(second)
+        batches = self.archive(batch_size=1)
+        self.assertEqual([games for games, _, _ in batches], [1, 1])
+        self.assertEqual(game_cache.cached(self.finished.id)['version'],
+                         version + 1)
+        cached = game_cache.get_game(self.finished.id)
+        self.assertTrue(cached.archived)
+        self.assertEqual(cached.version, version + 1)
+        self.assertEqual(cached.moves.count(), cached.ply)
+
+    def test4(self):
+        """ Games whose moves do not add up to their plies are skipped """
+        Game.objects.filter(id=self.finished.id).update(
+            ply=self.finished.ply + 1)
+        self.assertEqual(self.archive(), [(0, 0, 1)])
+        self.assertFalse(Game.objects.get(id=self.finished.id).archived)
@@ -0,0 +1,231 @@
+"""
+Tests of the management commands
+"""
+
+import base64
+import datetime
+import json
+import os
+import re
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+from . import legacy_rules, rules, tests
+from .models import Game, GameStatus, Keyframe, Move, UserStats
+
+
+class LoadTestCommandTests(TransactionTestCase):
+    def test1(self):
+        """ Pairs of players play through the views and get a report """
+        users = list(User.objects.values_list('id', flat=True))
+        out, err = StringIO(), StringIO()
+        call_command('loadtest', pairs=2, moves=6, poll=0, stdout=out,
+                     stderr=err)
+        report = out.getvalue()
+        self.assertEqual(err.getvalue(), '')
+        self.assertIn('2 games', report)
+        for name in ['signup', 'create_game', 'select_game', 'show_game',
+                     'game_status', 'move']:
+            self.assertRegex(report, r'\n%s +\d+' % name)
+        # The players are deleted with their games
+        self.assertEqual(list(User.objects.values_list('id', flat=True)),
+                         users)
+        self.assertFalse(Game.objects.exists())
+
+
+class SimulateGamesCommandTests(SimpleTestCase):
+    def test1(self):
+        """ Games are played by a pool of workers and summed up """
+        out, err = StringIO(), StringIO()
+        call_command('simulate_games', games=1500, workers=2, stdout=out,
+                     stderr=err)
+        report = out.getvalue()
+        self.assertEqual(err.getvalue(), '')
+        self.assertIn('1500 games', report)
+        wins = re.findall(r'^(cat|mouse|draw) +(\d+)', report, re.M)
+        self.assertEqual(sum(int(n) for _, n in wins), 1500)
+        self.assertIn('moves: min', report)
+        self.assertIn('The rules agree on every position played', report)
+
+    def test2(self):
+        """ Positions where the legacy rules disagree are reported """
+        out, err = StringIO(), StringIO()
+        with mock.patch.object(legacy_rules, 'legacy_game_end',
+                               return_value=True):
+            call_command('simulate_games', games=3, workers=1, stdout=out,
+                         stderr=err)
+        self.assertIn('Positions where the rules disagree', err.getvalue())
+        self.assertIn('end of game: rules False, legacy True',
+                      err.getvalue())
+        self.assertNotIn('agree on every position', out.getvalue())
+
+
+class ExportImportCommandTests(TestCase):
+    def setUp(self):
+        self.cat_user = tests.BaseModelTest.get_or_create_user('export_cat')
+        self.mouse_user = tests.BaseModelTest.get_or_create_user(
+            'export_mouse')
+        finished = Game.objects.create(cat_user=self.cat_user,
+                                       mouse_user=self.mouse_user)
+        self.play(finished, 100)
+        active = Game.objects.create(cat_user=self.mouse_user,
+                                     mouse_user=self.cat_user)
+        self.play(active, 11)
+        Game.objects.create(cat_user=self.cat_user)
+        # Dates far from those of an import, a minute apart
+        for move in Move.objects.all():
+            Move.objects.filter(id=move.id).update(
+                date=datetime.datetime(2019, 3, 1, 12, 0, 0, 123456) +
+                datetime.timedelta(minutes=move.ply, microseconds=move.id))
+        self.path = os.path.join(tempfile.mkdtemp(), 'games.jsonl')
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        os.rmdir(os.path.dirname(self.path))
+
+    def play(self, game, n_moves):
+        for _ in range(n_moves):
+            moves = rules.legal_moves(game.position)
+            if game.status != GameStatus.ACTIVE or not moves:
+                return
+            origin, target = moves[-1]
+            player = game.cat_user if game.cat_turn else game.mouse_user
+            Move.objects.create(game=game, player=player, origin=origin,
+                                target=target)
+
+    def snapshot(self):
+        games = list(Game.objects.order_by('id').values_list(
+            'id', 'cat_user__username', 'mouse_user__username',
+            'winner__username', 'status', 'version', 'ply', 'cat1', 'cat2',
+            'cat3', 'cat4', 'mouse', 'cat_turn'))
+        moves = [move[:-1] + (move[-1].replace(
+                     microsecond=move[-1].microsecond // 1000 * 1000),)
+                 for move in Move.objects.order_by('game_id', 'ply').
+                 values_list('game_id', 'ply', 'origin', 'target',
+                             'player__username', 'date')]
+        keyframes = list(Keyframe.objects.order_by('game_id', 'ply').
+                         values_list('game_id', 'ply', 'cat1', 'cat2', 'cat3',
+                                     'cat4', 'mouse', 'cat_turn'))
+        return games, moves, keyframes
+
+    def test1(self):
+        """ Games exported and imported again are the same """
+        before = self.snapshot()
+        self.assertEqual(before[0][0][4], GameStatus.FINISHED)
+        out = StringIO()
+        call_command('export_games', output=self.path, stdout=out)
+        self.assertIn('3 games', out.getvalue())
+
+        Game.objects.all().delete()
+        User.objects.all().delete()
+        out = StringIO()
+        call_command('import_games', self.path, batch_size=2, stdout=out)
+        self.assertIn('3 games', out.getvalue())
+        self.assertEqual(self.snapshot(), before)
+        self.assertFalse(User.objects.get(
+            username='export_cat').has_usable_password())
+
+        game = Game.objects.get(id=before[0][0][0])
+        position = rules.INITIAL_POSITION
+        for origin, target in game.moves.values_list('origin',
+                                                     'target')[:11]:
+            position = rules.apply_move(position, origin, target)
+        self.assertEqual(game.position_at(11), position)
+
+    def test2(self):
+        """ Games already there are skipped and broken lines rejected """
+        call_command('export_games', output=self.path, stdout=StringIO())
+        with open(self.path) as games_file:
+            record = json.loads(games_file.readline())
+        broken = dict(record, id=record['id'] + 100, moves='AAAA')
+        with open(self.path, 'a') as games_file:
+            games_file.write('not json\n')
+            games_file.write(json.dumps(broken) + '\n')
+
+        out, err = StringIO(), StringIO()
+        call_command('import_games', self.path, stdout=out, stderr=err)
+        self.assertIn('0 games', out.getvalue())
+        self.assertIn('3 already there, 2 rejected', out.getvalue())
+        self.assertIn('line 4:', err.getvalue())
+        self.assertIn('line 5: illegal move', err.getvalue())
+        self.assertEqual(Game.objects.count(), 3)
+
+    def test3(self):
+        """ Export reads the games and the moves with one query each """
+        with self.assertNumQueries(2):
+            call_command('export_games', output=self.path, chunk_size=1,
+                         stdout=StringIO())
+        with open(self.path) as games_file:
+            records = [json.loads(line) for line in games_file]
+        self.assertEqual([record['id'] for record in records],
+                         sorted(Game.objects.values_list('id', flat=True)))
+        for record in records:
+            game = Game.objects.get(id=record['id'])
+            self.assertEqual(record['initial'], {'cats': [0, 2, 4, 6],
+                                                 'mouse': 59,
+                                                 'cat_turn': True})
+            self.assertEqual(
+                rules.unpack_moves(base64.b64decode(record['moves'])),
+                list(game.moves.values_list('origin', 'target')))
+
+    def test4(self):
+        """ Archived games are exported with the moves of their log """
+        call_command('export_games', output=self.path, stdout=StringIO())
+        with open(self.path) as games_file:
+            before = [json.loads(line) for line in games_file]
+        out = StringIO()
+        call_command('archive_games', batch_size=1, stdout=out)
+        self.assertIn('1 games archived', out.getvalue())
+        self.assertEqual(Move.objects.filter(game_id=before[0]['id']).count(),
+                         0)
+
+        call_command('export_games', output=self.path, stdout=StringIO())
+        with open(self.path) as games_file:
+            after = [json.loads(line) for line in games_file]
+        self.assertEqual([dict(record, version=0) for record in after],
+                         [dict(record, version=0) for record in before])
+        self.assertEqual(after[0]['version'], before[0]['version'] + 1)
+
+    def test5(self):
+        """ Moves of files without dates get the date of the import """
+        call_command('export_games', output=self.path, stdout=StringIO())
+        with open(self.path) as games_file:
+            records = [json.loads(line) for line in games_file]
+        with open(self.path, 'w') as games_file:
+            for record in records:
+                del record['dates']
+                games_file.write(json.dumps(record) + '\n')
+            broken = dict(records[0], id=records[0]['id'] + 100, dates='AAAA')
+            games_file.write(json.dumps(broken) + '\n')
+
+        Game.objects.all().delete()
+        start = datetime.datetime.now()
+        out, err = StringIO(), StringIO()
+        call_command('import_games', self.path, stdout=out, stderr=err)
+        self.assertIn('3 games', out.getvalue())
+        self.assertIn('line 4: invalid dates', err.getvalue())
+        self.assertTrue(Move.objects.exists())
+        self.assertFalse(Move.objects.filter(date__lt=start).exists())
+
+
+class RebuildStatsCommandTests(TestCase):
+    def test1(self):
+        """ Stats are recomputed from the finished games """
+        cat_user = tests.BaseModelTest.get_or_create_user('rebuild_cat')
+        mouse_user = tests.BaseModelTest.get_or_create_user('rebuild_mouse')
+        game = Game.objects.create(cat_user=cat_user, mouse_user=mouse_user)
+        Game.objects.filter(id=game.id).update(status=GameStatus.FINISHED,
+                                               winner=mouse_user, ply=30)
+        self.assertFalse(UserStats.objects.exists())
+        out = StringIO()
+        call_command('rebuild_stats', stdout=out)
+        self.assertIn('1 games, 2 players', out.getvalue())
+        mouse = UserStats.objects.get(user=mouse_user)
+        self.assertEqual((mouse.games, mouse.mouse_wins, mouse.plies),
+                         (1, 1, 30))
@@ -0,0 +1,171 @@
+"""
+Concurrency tests of the move commit
+"""
+
+import threading
+from unittest import mock
+
+from django.core.exceptions import ValidationError
+from django.db import OperationalError, connection
+from django.test import TransactionTestCase
+
+from . import tests
+from .models import MSG_ERROR_STALE_GAME, Game, GameManager, GameStatus, \
+    Move
+
+
+class ConcurrentMoveTests(TransactionTestCase):
+    def setUp(self):
+        self.cat_user = tests.BaseModelTest.get_or_create_user('cat_user')
+        self.mouse_user = tests.BaseModelTest.get_or_create_user('mouse_user')
+        self.game = Game.objects.create(cat_user=self.cat_user,
+                                        mouse_user=self.mouse_user,
+                                        status=GameStatus.ACTIVE)
+
+    def test1(self):
+        """ A move against a stale copy of the game is rejected """
+        stale = Game.objects.get(id=self.game.id)
+        Move.objects.create(game=self.game, player=self.cat_user,
+                            origin=0, target=9)
+
+        with self.assertRaisesRegex(ValidationError, MSG_ERROR_STALE_GAME):
+            Move.objects.create(game=stale, player=self.cat_user,
+                                origin=2, target=11)
+        # The rejected game copy is reloaded with the committed state
+        self.assertEqual(stale.cat1, 9)
+        self.assertFalse(stale.cat_turn)
+        self.assertEqual(self.game.moves.count(), 1)
+
+    def test2(self):
+        """ Parallel moves on the same game: only one of them is committed """
+        candidates = [(0, 9), (2, 9), (2, 11), (4, 11), (4, 13), (6, 13)]
+        barrier = threading.Barrier(len(candidates))
+        results = []
+
+        def play(origin, target):
+            game = Game.objects.get(id=self.game.id)
+            barrier.wait()
+            try:
+                Move.objects.create(game=game, player=self.cat_user,
+                                    origin=origin, target=target)
+                results.append(True)
+            except (ValidationError, OperationalError):
+                results.append(False)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=play, args=move)
+                   for move in candidates]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        game = Game.objects.get(id=self.game.id)
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(game.moves.count(), 1)
+        self.assertFalse(game.cat_turn)
+        move = game.moves[0]
+        self.assertIn(move.target, game._get_cat_places())
+        self.assertNotIn(move.origin, game._get_cat_places())
+
+    def test3(self):
+        """ Saving a stale copy of the game does not undo a move """
+        stale = Game.objects.get(id=self.game.id)
+        Move.objects.create(game=self.game, player=self.cat_user,
+                            origin=0, target=9)
+
+        stale.status = GameStatus.FINISHED
+        with self.assertRaisesRegex(ValidationError, MSG_ERROR_STALE_GAME):
+            stale.save()
+        self.assertEqual(stale.version, self.game.version - 1)
+        game = Game.objects.get(id=self.game.id)
+        self.assertEqual((game.cat1, game.cat_turn, game.status,
+                          game.version),
+                         (9, False, GameStatus.ACTIVE, self.game.version))
+        game.save()
+        self.assertEqual(Game.objects.get(id=game.id).version,
+                         self.game.version + 1)
+
+
+class ConcurrentClaimTests(TransactionTestCase):
+    def setUp(self):
+        self.cat_user = tests.BaseModelTest.get_or_create_user('cat_user')
+        self.users = [tests.BaseModelTest.get_or_create_user('mouse_%d' % i)
+                      for i in range(6)]
+
+    def run_in_parallel(self, function):
+        barrier = threading.Barrier(len(self.users))
+        results = []
+
+        def run(user):
+            barrier.wait()
+            try:
+                results.append(function(user))
+            except OperationalError:
+                results.append(None)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=[user])
+                   for user in self.users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test1(self):
+        """ Parallel joins of the same game: only one player gets it """
+        game = Game.objects.create(cat_user=self.cat_user)
+        results = self.run_in_parallel(
+            lambda user: Game.objects.claim(game.id, user))
+
+        claimed = [result for result in results if result is not None]
+        self.assertEqual(len(claimed), 1)
+        game = Game.objects.get(id=game.id)
+        self.assertEqual(game.mouse_user, claimed[0].mouse_user)
+        self.assertEqual(game.status, GameStatus.ACTIVE)
+
+    def test2(self):
+        """ Claiming a game that is not open """
+        game = Game.objects.create(cat_user=self.cat_user)
+        self.assertIsNone(Game.objects.claim(game.id, self.cat_user))
+        self.assertIsNotNone(Game.objects.claim(game.id, self.users[0]))
+        self.assertIsNone(Game.objects.claim(game.id, self.users[1]))
+        self.assertEqual(Game.objects.get(id=game.id).mouse_user,
+                         self.users[0])
+
+    def test3(self):
+        """ Parallel quick matches never pair two players with one game """
+        for _ in range(3):
+            Game.objects.create(cat_user=self.cat_user)
+        results = self.run_in_parallel(Game.objects.quick_match)
+
+        joined = [game for game in results
+                  if game is not None and game.mouse_user_id is not None]
+        self.assertTrue(joined)
+        self.assertEqual(len(joined), len({game.id for game in joined}))
+        for game in joined:
+            self.assertEqual(Game.objects.get(id=game.id).mouse_user,
+                             game.mouse_user)
+
+    def test4(self):
+        """ Two players waiting at once are paired with each other """
+        claim_oldest = GameManager._claim_oldest
+        waiting = []
+
+        def arrive_together(manager, user, **kwargs):
+            if not waiting:
+                # The other player creates its game meanwhile
+                waiting.append(Game.objects.create(cat_user=self.cat_user))
+                return None
+            return claim_oldest(manager, user, **kwargs)
+
+        with mock.patch.object(GameManager, '_claim_oldest',
+                               arrive_together):
+            game = Game.objects.quick_match(self.users[0])
+        self.assertEqual(game.id, waiting[0].id)
+        self.assertEqual(Game.objects.get(id=game.id).mouse_user,
+                         self.users[0])
+        self.assertFalse(Game.objects.filter(cat_user=self.users[0]).exists())
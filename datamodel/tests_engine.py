@@ -0,0 +1,129 @@
+"""
+Tests of the computer opponent
+"""
+
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+
+from . import bot, engine, game_cache, rules, tests, tests_tablebase
+from .models import Game, GameStatus, Move
+
+
+class EngineTests(SimpleTestCase):
+    def test1(self):
+        """ The Zobrist hash is updated incrementally on every move """
+        position = rules.INITIAL_POSITION
+        key = engine.zobrist(position)
+        for _ in range(6):
+            origin, target = rules.legal_moves(position)[0]
+            key = engine.zobrist_move(key, position, origin, target)
+            position = rules.apply_move(position, origin, target)
+            self.assertEqual(key, engine.zobrist(position))
+
+    def test2(self):
+        """ The order of the cats does not change the hash """
+        position = rules.Position((0, 2, 4, 6), 59, False)
+        shuffled = rules.Position((6, 0, 4, 2), 59, False)
+        self.assertEqual(engine.zobrist(position), engine.zobrist(shuffled))
+        self.assertNotEqual(engine.zobrist(position),
+                            engine.zobrist(position._replace(cat_turn=True)))
+
+    def test3(self):
+        """ The cats trap the mouse when they can """
+        position = rules.Position((50, 41, 32, 34), 57, True)
+        self.assertEqual(engine.best_move(position, 1), (41, 48))
+
+    def test4(self):
+        """ The mouse gets past the cats when it can """
+        position = rules.Position((11, 13, 15, 25), 18, False)
+        origin, target = engine.best_move(position, 1)
+        after = rules.apply_move(position, origin, target)
+        self.assertEqual(rules.winner(after), rules.MOUSE)
+
+    def test5(self):
+        """ The search ends within its time budget with a legal move """
+        start = time.time()
+        move = engine.best_move(rules.INITIAL_POSITION, 0.2)
+        self.assertLess(time.time() - start, 0.5)
+        self.assertIn(move, rules.legal_moves(rules.INITIAL_POSITION))
+
+    def test6(self):
+        """ There is no move for a side that cannot move """
+        position = rules.Position((57, 59, 61, 63), 2, True)
+        self.assertIsNone(engine.best_move(position, 1))
+
+
+class EngineTablebaseTests(tests_tablebase.TablebaseTestCase):
+    def test1(self):
+        """ The search finds the moves to the end the tablebase foretells,
+        with the transposition table of the searches before """
+        engine._table.clear()
+        for position, result in self.won_positions(150, 16):
+            move, score = engine.analyse(position, 5)
+            self.assertEqual((rules.CAT if score > 0 else rules.MOUSE,
+                              engine.WIN - abs(score)), result, position)
+
+
+class BotTests(TestCase):
+    def setUp(self):
+        self.user = tests.BaseModelTest.get_or_create_user('bot_opponent')
+
+    def test1(self):
+        """ The bot user is created once, without a usable password """
+        computer = bot.get_user()
+        self.assertEqual(bot.get_user(), computer)
+        self.assertFalse(computer.has_usable_password())
+        self.assertTrue(bot.is_bot(computer))
+        self.assertFalse(bot.is_bot(self.user))
+
+    def test2(self):
+        """ The bot only plays its own turns """
+        game = Game.objects.create(cat_user=self.user,
+                                   mouse_user=bot.get_user())
+        self.assertIsNone(bot.play(game))
+        game = Game.objects.create(cat_user=bot.get_user(),
+                                   mouse_user=self.user)
+        move = bot.play(game)
+        self.assertEqual(move.player, bot.get_user())
+        self.assertEqual(Move.objects.filter(game=game).count(), 1)
+        self.assertFalse(game.cat_turn)
+
+    def test3(self):
+        """ The bot plays a whole game through Move, and wins as the cats """
+        game = Game.objects.create(cat_user=bot.get_user(),
+                                   mouse_user=self.user)
+        with self.settings(BOT_MOVE_SECONDS=0.05):
+            while bot.play(game):
+                moves = rules.legal_moves(game.position)
+                if game.status == GameStatus.FINISHED or not moves:
+                    break
+                origin, target = moves[0]
+                Move.objects.create(origin=origin, target=target, game=game,
+                                    player=self.user)
+        game.refresh_from_db()
+        self.assertEqual(game.status, GameStatus.FINISHED)
+        self.assertEqual(game.winner, bot.get_user())
+        self.assertEqual(Move.objects.filter(game=game).count(), game.ply)
+
+    def test4(self):
+        """ A person with the name of the bot is never played for """
+        User.objects.filter(username=settings.BOT_USERNAME).delete()
+        person = User.objects.create_user(username=settings.BOT_USERNAME,
+                                          password='computer_password')
+        self.assertIsNone(bot.get_user())
+        self.assertFalse(bot.is_bot(person))
+        game = Game.objects.create(cat_user=person, mouse_user=self.user)
+        self.assertIsNone(bot.play(game))
+        self.assertEqual(game.ply, 0)
+
+    def test5(self):
+        """ The bot is recognised in the games read from the cache """
+        game = Game.objects.create(cat_user=bot.get_user(),
+                                   mouse_user=self.user)
+        cached = game_cache.restore(game_cache.snapshot(game))
+        self.assertTrue(bot.is_bot(cached.cat_user))
+        self.assertFalse(bot.is_bot(cached.mouse_user))
+        self.assertEqual(bot.play(cached).player, bot.get_user())
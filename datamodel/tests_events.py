@@ -0,0 +1,42 @@
+"""
+Tests of the publish/subscribe of game updates
+"""
+
+import threading
+import time
+
+from django.test import SimpleTestCase
+
+from . import events, game_cache
+
+
+class BrokerTests(SimpleTestCase):
+    def setUp(self):
+        game_cache.get_cache().clear()
+
+    def publish_later(self, broker, game_id, version, seconds=0.1):
+        timer = threading.Timer(seconds, broker.publish, (game_id, version))
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+    def test1(self):
+        """ Waiters are woken up by the versions published after theirs """
+        broker = events.LocalBroker()
+        self.publish_later(broker, 1, 5)
+        self.assertEqual(broker.wait(1, 4, 5), 5)
+        self.assertIsNone(broker.wait(1, 5, 0.05))
+        self.assertIsNone(broker.wait(2, 0, 0.05))
+
+    def test2(self):
+        """ The cache broker wakes up waiters of other processes """
+        with self.settings(GAME_EVENTS_POLL=0.05):
+            publisher, waiter = events.CacheBroker(), events.CacheBroker()
+            self.publish_later(publisher, 1, 5)
+            start = time.time()
+            self.assertEqual(waiter.wait(1, 4, 5), 5)
+            self.assertLess(time.time() - start, 1)
+            self.assertEqual(waiter.wait(1, 3, 5), 5)
+            self.assertIsNone(waiter.wait(1, 5, 0.1))
+            # Older versions published late change nothing
+            publisher.publish(1, 4)
+            self.assertEqual(waiter.wait(1, 4, 0.1), 5)
@@ -0,0 +1,125 @@
+"""
+Tests of the game state cache
+"""
+
+from unittest import mock
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.test import TransactionTestCase
+
+from . import game_cache, tests
+from .models import MSG_ERROR_STALE_GAME, Game, GameStatus, Move
+
+
+class GameCacheTests(TransactionTestCase):
+    def setUp(self):
+        game_cache.get_cache().clear()
+        self.cat_user = tests.BaseModelTest.get_or_create_user('cat_user')
+        self.mouse_user = tests.BaseModelTest.get_or_create_user('mouse_user')
+        self.game = Game.objects.create(cat_user=self.cat_user,
+                                        mouse_user=self.mouse_user,
+                                        status=GameStatus.ACTIVE)
+
+    def test1(self):
+        """ Cached games are read without queries, players included """
+        with self.assertNumQueries(0):
+            game = game_cache.get_game(self.game.id)
+            self.assertEqual(game.version, self.game.version)
+            self.assertEqual(game.position, self.game.position)
+            self.assertEqual(game.cat_user, self.cat_user)
+            self.assertEqual(game.mouse_user.username,
+                             self.mouse_user.username)
+            self.assertIsNone(game.winner)
+
+    def test2(self):
+        """ Missing games are read from the database and cached """
+        game_cache.get_cache().clear()
+        with self.assertNumQueries(1):
+            game_cache.get_game(self.game.id)
+        with self.assertNumQueries(0):
+            game_cache.get_game(self.game.id)
+        with self.assertRaises(Game.DoesNotExist):
+            game_cache.get_game(self.game.id + 1)
+
+    def test3(self):
+        """ Committed moves overwrite the cached state """
+        game = game_cache.get_game(self.game.id)
+        Move.objects.create(game=game, player=self.cat_user,
+                            origin=0, target=9)
+        cached = game_cache.get_game(self.game.id)
+        self.assertEqual(cached.version, game.version)
+        self.assertEqual(cached.ply, 1)
+        self.assertEqual(cached.cat1, 9)
+        self.assertFalse(cached.cat_turn)
+
+        # Moves can be played on the cached copy
+        Move.objects.create(game=cached, player=self.mouse_user,
+                            origin=59, target=50)
+        game = Game.objects.get(id=self.game.id)
+        self.assertEqual(game.mouse, 50)
+        self.assertEqual(game_cache.get_game(game.id).version, game.version)
+
+    def test4(self):
+        """ Older states and rolled back states are never cached """
+        old = game_cache.snapshot(self.game)
+        Move.objects.create(game=self.game, player=self.cat_user,
+                            origin=0, target=9)
+        game_cache._set(old)
+        self.assertEqual(game_cache.get_game(self.game.id).cat1, 9)
+
+        try:
+            with transaction.atomic():
+                Move.objects.create(game=self.game, player=self.mouse_user,
+                                    origin=59, target=50)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(game_cache.get_game(self.game.id).mouse, 59)
+
+    def test5(self):
+        """ A stale cached copy cannot commit a move and is refreshed """
+        Game.objects.filter(id=self.game.id).update(cat1=9, cat_turn=False,
+                                                    version=100)
+        stale = game_cache.get_game(self.game.id)
+        with self.assertRaisesRegex(ValidationError, MSG_ERROR_STALE_GAME):
+            Move.objects.create(game=stale, player=self.cat_user,
+                                origin=2, target=11)
+        game = game_cache.get_game(self.game.id)
+        self.assertEqual(game.version, 100)
+        self.assertFalse(game.cat_turn)
+
+    def test6(self):
+        """ A game read before a move commits does not replace it """
+        game_cache.get_cache().clear()
+        fills = []
+        with mock.patch.object(game_cache.transaction, 'on_commit',
+                               side_effect=fills.append):
+            # A reader misses the cache and reads the game
+            stale = game_cache.get_game(self.game.id)
+        self.assertEqual(len(fills), 1)
+
+        # A move commits and is cached just before the reader writes
+        cache = game_cache.get_cache()
+        moved = []
+
+        def move_first(write):
+            def wrapped(*args, **kwargs):
+                if not moved:
+                    moved.append(True)
+                    Move.objects.create(
+                        game=Game.objects.get(id=self.game.id),
+                        player=self.cat_user, origin=0, target=9)
+                return write(*args, **kwargs)
+            return wrapped
+        with mock.patch.object(cache, 'set', move_first(cache.set)), \
+                mock.patch.object(cache, 'add', move_first(cache.add)):
+            fills[0]()
+        self.assertEqual(len(moved), 1)
+        cached = game_cache.get_game(self.game.id)
+        self.assertEqual(cached.version, stale.version + 1)
+        self.assertEqual(cached.cat1, 9)
+
+        # Neither does an older write stored late
+        game_cache._set(game_cache.snapshot(stale))
+        self.assertEqual(game_cache.get_game(self.game.id).cat1, 9)
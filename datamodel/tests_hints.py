@@ -0,0 +1,25 @@
+"""
+Tests of the hints
+"""
+
+from unittest import mock
+
+from . import engine, hints, tablebase, tests_tablebase
+
+
+class HintTests(tests_tablebase.TablebaseTestCase):
+    def tearDown(self):
+        hints.cache_clear()
+        super().tearDown()
+
+    def test1(self):
+        """ Hints searched without the tablebase foretell what it does """
+        hints.cache_clear()
+        engine._table.clear()
+        with mock.patch.object(tablebase, 'get', return_value=None), \
+                self.settings(HINT_SECONDS=5):
+            for position, result in self.won_positions(100, 12):
+                hint = hints.hint(position)
+                self.assertEqual(hint['source'], 'search')
+                self.assertEqual((hint['winner'], hint['plies']), result,
+                                 position)
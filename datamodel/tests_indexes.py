@@ -0,0 +1,101 @@
+"""
+Query plan regression tests of the game lookups.
+
+The games table is seeded with QUERY_PLAN_GAMES games (one million by
+default) with raw SQL, then the plans of the lobby, play/replay and select
+queries are checked to use indexes instead of scanning the table.
+"""
+
+import os
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Q
+from django.test import TestCase
+
+from .models import Game, GameStatus
+
+N_GAMES = int(os.getenv('QUERY_PLAN_GAMES', 1000000))
+N_USERS = 1000
+PAGE = 11
+
+# One game out of 100 is open, 5 are active and the rest are finished.
+# Every player creates runs of 100 consecutive games, so all of them have
+# games in every status
+SEED_SQL = {
+    'sqlite': """
+        WITH RECURSIVE seq(n) AS (
+            SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < %(n_games)d)
+        INSERT INTO datamodel_game
+            (cat1, cat2, cat3, cat4, mouse, cat_turn, status, version, ply,
+             cat_user_id, mouse_user_id, winner_id)
+        SELECT 0, 2, 4, 6, 59, 1,
+               CASE WHEN n %% 100 = 0 THEN 0
+                    WHEN n %% 100 < 6 THEN 1 ELSE 2 END,
+               1, 0,
+               %(first_user)d + n / 100 %% %(n_users)d,
+               CASE WHEN n %% 100 = 0 THEN NULL
+                    ELSE %(first_user)d + (n * 7 + 1) %% %(n_users)d END,
+               NULL
+        FROM seq""",
+    'postgresql': """
+        INSERT INTO datamodel_game
+            (cat1, cat2, cat3, cat4, mouse, cat_turn, status, version, ply,
+             cat_user_id, mouse_user_id, winner_id)
+        SELECT 0, 2, 4, 6, 59, TRUE,
+               CASE WHEN n %% 100 = 0 THEN 0
+                    WHEN n %% 100 < 6 THEN 1 ELSE 2 END,
+               1, 0,
+               %(first_user)d + n / 100 %% %(n_users)d,
+               CASE WHEN n %% 100 = 0 THEN NULL
+                    ELSE %(first_user)d + (n * 7 + 1) %% %(n_users)d END,
+               NULL
+        FROM generate_series(1, %(n_games)d) AS n""",
+}
+
+
+class GameQueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.bulk_create([User(username='plan_user_%d' % i)
+                                  for i in range(N_USERS)])
+        users = User.objects.filter(username__startswith='plan_user_')
+        first_user = users.order_by('id').first().id
+        cls.user = users.order_by('id')[N_USERS // 2]
+        with connection.cursor() as cursor:
+            cursor.execute(SEED_SQL[connection.vendor] % {
+                'n_games': N_GAMES, 'n_users': N_USERS,
+                'first_user': first_user})
+            cursor.execute('ANALYZE')
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        if connection.vendor == 'postgresql':
+            self.assertNotIn('Seq Scan on datamodel_game', plan)
+            self.assertIn('Index', plan)
+        else:
+            for line in plan.splitlines():
+                if 'datamodel_game' in line:
+                    self.assertIn('USING', line, plan)
+
+    def test1(self):
+        """ Lobby: open games of other players, newest first """
+        games = Game.objects.filter(mouse_user=None).\
+            exclude(cat_user=self.user).order_by('-id')[:PAGE]
+        self.assertUsesIndex(games)
+        self.assertEqual(len(games), PAGE)
+
+    def test2(self):
+        """ Play and replay: games of a player by status """
+        for status in [GameStatus.ACTIVE, GameStatus.FINISHED]:
+            games = Game.objects.filter(Q(cat_user=self.user) |
+                                        Q(mouse_user=self.user))
+            games = games.filter(status=status).order_by('-id')[:PAGE]
+            self.assertUsesIndex(games)
+            self.assertTrue(len(games))
+
+    def test3(self):
+        """ Select: a game by id and status """
+        games = Game.objects.filter(id=N_GAMES // 2,
+                                    status=GameStatus.FINISHED)
+        self.assertUsesIndex(games)
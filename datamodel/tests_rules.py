@@ -0,0 +1,84 @@
+"""
+Tests of the ORM-free rules module
+"""
+
+from django.test import SimpleTestCase
+
+from . import rules
+from .rules import INITIAL_POSITION, Position
+
+
+class RulesTests(SimpleTestCase):
+    def test1(self):
+        """ Legal moves of the initial position """
+        self.assertEqual(sorted(rules.legal_moves(INITIAL_POSITION)),
+                         [(0, 9), (2, 9), (2, 11), (4, 11), (4, 13),
+                          (6, 13), (6, 15)])
+        mouse_turn = INITIAL_POSITION._replace(cat_turn=False)
+        self.assertEqual(sorted(rules.legal_moves(mouse_turn)),
+                         [(59, 50), (59, 52)])
+
+    def test2(self):
+        """ Applying a move returns a new position and passes the turn """
+        position = rules.apply_move(INITIAL_POSITION, 2, 11)
+        self.assertEqual(position, Position((0, 11, 4, 6), 59, False))
+        self.assertEqual(INITIAL_POSITION.cats, (0, 2, 4, 6))
+        position = rules.apply_move(position, 59, 50)
+        self.assertEqual(position, Position((0, 11, 4, 6), 50, True))
+
+    def test3(self):
+        """ Illegal moves """
+        illegal = [
+            (INITIAL_POSITION, 1, 10),    # no cat in origin
+            (INITIAL_POSITION, 0, 1),     # not diagonal
+            (INITIAL_POSITION, 9, 0),     # cats cannot move back
+            (INITIAL_POSITION, 59, 50),   # not the mouse turn
+            (Position((7, 2, 4, 6), 59, True), 7, 16),  # wraps the edge
+            (Position((0, 2, 4, 6), 9, True), 0, 9),  # onto the mouse
+            (Position((0, 2, 4, 6), 59, False), 59, 66),
+        ]
+        for position, origin, target in illegal:
+            self.assertFalse(rules.is_legal(position, origin, target))
+            with self.assertRaises(rules.IllegalMove):
+                rules.apply_move(position, origin, target)
+
+    def test4(self):
+        """ Terminal positions """
+        self.assertIsNone(rules.winner(INITIAL_POSITION))
+        self.assertEqual(rules.winner(Position((11, 9, 25, 27), 18, False)),
+                         rules.CAT)
+        self.assertEqual(rules.winner(Position((0, 2, 16, 18), 9, True)),
+                         rules.CAT)
+        self.assertEqual(rules.winner(Position((9, 13, 25, 27), 2, True)),
+                         rules.MOUSE)
+        self.assertTrue(rules.is_terminal(Position((16, 18, 20, 22), 11,
+                                                   True)))
+
+    def test5(self):
+        """ Every legal move keeps the position consistent """
+        frontier = [INITIAL_POSITION]
+        for _ in range(6):
+            following = []
+            for position in frontier:
+                for origin, target in rules.legal_moves(position):
+                    new = rules.apply_move(position, origin, target)
+                    self.assertNotEqual(new.cat_turn, position.cat_turn)
+                    self.assertNotIn(new.mouse, new.cats)
+                    self.assertEqual(len(set(new.cats)), 4)
+                    if not rules.is_terminal(new):
+                        following.append(new)
+            frontier = following[:50]
+
+    def test6(self):
+        """ Packed moves and undo """
+        position = INITIAL_POSITION
+        log = []
+        for _ in range(12):
+            move = rules.legal_moves(position)[-1]
+            log.append(move)
+            new = rules.apply_move(position, *move)
+            self.assertEqual(rules.undo_move(new, *move), position)
+            position = new
+        packed = rules.pack_moves(log)
+        self.assertEqual(len(packed), len(log))
+        self.assertEqual(rules.unpack_moves(packed), log)
@@ -0,0 +1,111 @@
+"""
+Tests of the statistics of the players
+"""
+
+from django.test import TestCase
+
+from . import bot, rules, stats, tests
+from .models import Game, GameStatus, Move, UserStats
+
+
+class StatsTests(TestCase):
+    def setUp(self):
+        self.users = [tests.BaseModelTest.get_or_create_user('stats_%d' % i)
+                      for i in range(3)]
+
+    def play(self, cat_user, mouse_user):
+        game = Game.objects.create(cat_user=cat_user, mouse_user=mouse_user)
+        while game.status == GameStatus.ACTIVE:
+            origin, target = rules.legal_moves(game.position)[-1]
+            player = game.cat_user if game.cat_turn else game.mouse_user
+            Move.objects.create(game=game, player=player, origin=origin,
+                                target=target)
+        return game
+
+    def finish(self, cat_user, mouse_user, winner, ply=20):
+        game = Game.objects.create(cat_user=cat_user, mouse_user=mouse_user)
+        game.status = GameStatus.FINISHED
+        game.winner = winner
+        game.ply = ply
+        game.save()
+        return game
+
+    def snapshot(self):
+        return list(UserStats.objects.order_by('user_id').values_list(
+            'user_id', 'games', 'wins', 'cat_wins', 'mouse_wins', 'plies',
+            'streak', 'best_streak'))
+
+    def test1(self):
+        """ The last move of a game adds it to the stats of its players """
+        game = self.play(self.users[0], self.users[1])
+        cat_won = game.winner == self.users[0]
+        cat = UserStats.objects.get(user=self.users[0])
+        mouse = UserStats.objects.get(user=self.users[1])
+        self.assertEqual((cat.games, cat.wins, cat.cat_wins, cat.mouse_wins,
+                          cat.plies, cat.streak),
+                         (1, int(cat_won), int(cat_won), 0, game.ply,
+                          int(cat_won)))
+        self.assertEqual((mouse.games, mouse.wins, mouse.cat_wins,
+                          mouse.mouse_wins, mouse.average_length),
+                         (1, int(not cat_won), 0, int(not cat_won),
+                          game.ply))
+
+    def test2(self):
+        """ Games are counted once, even if saved again """
+        game = self.finish(self.users[0], self.users[1], self.users[0])
+        game.save()
+        Game.objects.get(id=game.id).save()
+        self.assertEqual(UserStats.objects.get(user=self.users[0]).games, 1)
+        active = Game.objects.create(cat_user=self.users[0],
+                                     mouse_user=self.users[1])
+        active.save()
+        self.assertEqual(UserStats.objects.get(user=self.users[1]).games, 1)
+
+    def test3(self):
+        """ Runs of wins end with a loss and the best one is kept """
+        for winner in [0, 0, 0, 1, 0]:
+            self.finish(self.users[0], self.users[1], self.users[winner])
+        winner = UserStats.objects.get(user=self.users[0])
+        self.assertEqual((winner.wins, winner.cat_wins, winner.streak,
+                          winner.best_streak), (4, 4, 1, 3))
+        loser = UserStats.objects.get(user=self.users[1])
+        self.assertEqual((loser.wins, loser.mouse_wins, loser.streak,
+                          loser.best_streak), (1, 1, 0, 1))
+
+    def test4(self):
+        """ Rebuilding gives the same stats as updating them """
+        self.play(self.users[0], self.users[1])
+        self.play(self.users[1], self.users[2])
+        for winner in [2, 0, 2, 2]:
+            self.finish(self.users[2], self.users[0], self.users[winner],
+                        ply=winner + 10)
+        Game.objects.create(cat_user=self.users[1])
+        before = self.snapshot()
+        self.assertEqual(stats.rebuild(chunk_size=2), (6, 3))
+        self.assertEqual(self.snapshot(), before)
+
+    def test5(self):
+        """ The leaderboard has the most wins first, then fewest games """
+        for winner in [0, 1, 0, 1]:
+            self.finish(self.users[0], self.users[1], self.users[winner])
+        self.finish(self.users[2], self.users[1], self.users[2])
+        self.finish(self.users[2], self.users[1], self.users[2])
+        board = stats.leaderboard(10)
+        self.assertEqual([row.user for row in board],
+                         [self.users[2], self.users[0], self.users[1]])
+        self.assertEqual([row.user for row in stats.leaderboard(1)],
+                         [self.users[2]])
+
+    def test6(self):
+        """ The computer player is not on the leaderboard """
+        computer = bot.get_user()
+        for winner in [computer, computer, self.users[0]]:
+            self.finish(computer, self.users[0], winner)
+        self.assertEqual(UserStats.objects.get(user=computer).wins, 2)
+        self.assertEqual([row.user for row in stats.leaderboard(10)],
+                         [self.users[0]])
+        # Somebody who took the name before it was reserved is
+        computer.set_password('not_a_computer')
+        computer.save()
+        self.assertEqual([row.user for row in stats.leaderboard(10)],
+                         [computer, self.users[0]])
@@ -0,0 +1,152 @@
+"""
+Tests of the tablebase
+"""
+
+import os
+import random
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from . import bot, engine, rules, tablebase, tests
+from .models import Game
+
+
+class TablebaseTestCase(SimpleTestCase):
+    '''
+    Builds a tablebase once for the tests of the class
+    '''
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.mkdtemp()
+        cls.path = os.path.join(cls.directory, 'mouse_cat.tb')
+        call_command('build_tablebase', output=cls.path, stdout=StringIO())
+        cls.table = tablebase.Tablebase(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.table.close()
+        shutil.rmtree(cls.directory)
+        super().tearDownClass()
+
+    def random_positions(self, n):
+        generator = random.Random(n)
+        while n:
+            cells = generator.sample(tablebase.DARK_CELLS, 5)
+            position = rules.Position(tuple(cells[:4]), cells[4],
+                                      generator.random() < 0.5)
+            yield position
+            n -= 1
+
+    def won_positions(self, n, max_plies):
+        '''
+        Yields n positions with a forced win in at most max_plies, and
+        their result
+        '''
+        for position in self.random_positions(50 * n):
+            result = self.table.probe(position)
+            if result.winner is not None and 0 < result.plies <= max_plies \
+                    and rules.legal_moves(position):
+                yield position, result
+                n -= 1
+                if not n:
+                    return
+
+
+class TablebaseTests(TablebaseTestCase):
+    def test1(self):
+        """ Every position has its own offset, whatever the order of cats """
+        offsets = set()
+        for position in self.random_positions(2000):
+            offset = tablebase.index(position)
+            shuffled = position._replace(cats=position.cats[::-1])
+            self.assertEqual(offset, tablebase.index(shuffled))
+            self.assertTrue(0 <= offset < tablebase.SIZE)
+            offsets.add((frozenset(position.cats), position.mouse,
+                         position.cat_turn, offset))
+        self.assertEqual(len(offsets),
+                         len(set(entry[3] for entry in offsets)))
+        self.assertIsNone(tablebase.index(rules.Position((0, 2, 4, 6), 58,
+                                                         True)))
+        self.assertIsNone(tablebase.index(rules.Position((0, 0, 4, 6), 59,
+                                                         True)))
+        self.assertIsNone(tablebase.index(rules.Position((0, 2, 4, 6), 4,
+                                                         False)))
+        self.assertIsNone(self.table.probe(rules.Position((0, 2, 4, 6), 4,
+                                                          False)))
+
+    def test2(self):
+        """ Every result follows from the results after its moves """
+        for position in self.random_positions(2000):
+            result = self.table.probe(position)
+            winner = rules.winner(position)
+            if winner is not None:
+                self.assertEqual(result, (winner, 0))
+                continue
+            moves = rules.legal_moves(position)
+            after = [self.table.probe(rules.apply_move(position, *move))
+                     for move in moves]
+            side = position.side_to_move
+            wins = [r.plies for r in after if r.winner == side]
+            if wins:
+                self.assertEqual(result, (side, min(wins) + 1))
+            elif not moves or (None, None) in after:
+                self.assertEqual(result, (None, None))
+            else:
+                self.assertEqual(result.winner, after[0].winner)
+                self.assertEqual(result.plies,
+                                 max(r.plies for r in after) + 1)
+
+    def test3(self):
+        """ Perfect cats beat the searching mouse in the moves foretold """
+        position = rules.INITIAL_POSITION
+        result = self.table.probe(position)
+        self.assertEqual(result.winner, rules.CAT)
+        plies = 0
+        while not rules.is_terminal(position):
+            if position.cat_turn:
+                move = self.table.best_move(position)
+            else:
+                move = engine.best_move(position, 0.02)
+            position = rules.apply_move(position, *move)
+            plies += 1
+        self.assertEqual(rules.winner(position), rules.CAT)
+        self.assertLessEqual(plies, result.plies)
+
+    def test4(self):
+        """ The mouse takes the quickest way out """
+        position = rules.Position((11, 13, 15, 25), 18, False)
+        self.assertEqual(self.table.probe(position), (rules.MOUSE, 1))
+        self.assertEqual(self.table.best_move(position), (18, 9))
+
+    def test5(self):
+        """ The tablebase is only mapped if the file is there and whole """
+        with self.settings(TABLEBASE_PATH=self.path + '.missing'):
+            self.assertIsNone(tablebase.get())
+        with self.settings(TABLEBASE_PATH=self.path):
+            self.assertEqual(tablebase.get().probe(rules.INITIAL_POSITION),
+                             self.table.probe(rules.INITIAL_POSITION))
+        broken = os.path.join(self.directory, 'broken.tb')
+        with open(broken, 'wb') as broken_file:
+            broken_file.write(tablebase.MAGIC + b'\0' * 10)
+        with self.assertRaises(ValueError):
+            tablebase.Tablebase(broken)
+
+
+class TablebaseBotTests(TestCase):
+    def test1(self):
+        """ The bot plays the moves of the tablebase when there is one """
+        user = tests.BaseModelTest.get_or_create_user('tablebase_user')
+        game = Game.objects.create(cat_user=bot.get_user(), mouse_user=user)
+        table = mock.Mock()
+        table.best_move.return_value = (6, 15)
+        with mock.patch.object(tablebase, 'get', return_value=table), \
+                mock.patch.object(engine, 'best_move') as search:
+            move = bot.play(game)
+        self.assertEqual((move.origin, move.target), (6, 15))
+        self.assertFalse(search.called)
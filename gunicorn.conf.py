@@ -0,0 +1,25 @@
+"""
+Gunicorn settings (see Procfile).
+
+Game update streams (/mouse_cat/events) keep a request open while a player
+waits for the other one, so workers are gevent workers by default: every
+request is a greenlet, and a waiting stream costs no thread. psycopg2 is
+made cooperative in every worker, so queries do not block the others.
+Streams served by the same process are woken up by the events broker as
+soon as a move is committed; with several workers the cache broker wakes up
+the others (see datamodel/events.py). GUNICORN_WORKER_CLASS=gthread serves
+GUNICORN_THREADS requests at once per worker instead.
+"""
+
+import os
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent')
+workers = int(os.getenv('WEB_CONCURRENCY', 1))
+threads = int(os.getenv('GUNICORN_THREADS', 32))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
@@ -1,4 +1,5 @@
 from django import forms
+from django.conf import settings
 from django.contrib.auth.models import User
 from datamodel.models import Move, Game
 from django.core.validators import MaxValueValidator, MinValueValidator
@@ -34,6 +35,13 @@ class SignupForm(forms.ModelForm):
         model = User
         fields = ('username', 'password')
 
+    def clean_username(self):
+        # The name of the computer opponent is reserved
+        username = self.cleaned_data['username']
+        if username.lower() == settings.BOT_USERNAME.lower():
+            raise forms.ValidationError('This username is not available')
+        return username
+
 
 class MoveForm(forms.ModelForm):
     """
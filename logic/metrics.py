@@ -0,0 +1,167 @@
+"""
+In-process request metrics, by URL name.
+
+MetricsMiddleware records the latency, number of queries and database time
+of every request here. Each process keeps its own metrics since it started:
+cumulative histograms, exported in the Prometheus text format, and the
+latencies of the last requests of every view, to compute percentiles.
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+# Latencies kept per view for the percentiles
+RECENT_REQUESTS = 1000
+
+
+class Histogram():
+    '''
+    Cumulative histogram with fixed buckets, as Prometheus defines them
+    '''
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        '''
+        Returns a list of (upper bound, observations <= bound) tuples, the
+        last one with bound '+Inf'
+        '''
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class ViewMetrics():
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.db_time = Histogram(LATENCY_BUCKETS)
+        self.recent = deque(maxlen=RECENT_REQUESTS)
+
+    def observe(self, status, seconds, n_queries, db_seconds):
+        self.requests += 1
+        if status >= 400:
+            self.errors += 1
+        self.latency.observe(seconds)
+        self.queries.observe(n_queries)
+        self.db_time.observe(db_seconds)
+        self.recent.append(seconds)
+
+    def percentile(self, fraction):
+        if not self.recent:
+            return None
+        values = sorted(self.recent)
+        return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class Registry():
+    '''
+    Metrics of every view of the process
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.views = OrderedDict()
+
+    def observe(self, view, status, seconds, n_queries, db_seconds):
+        with self.lock:
+            if view not in self.views:
+                self.views[view] = ViewMetrics()
+            self.views[view].observe(status, seconds, n_queries, db_seconds)
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.views.clear()
+
+    def as_dict(self):
+        """
+        as_dict
+        ----------
+        Returns:
+            Dictionary with the uptime of the metrics and, for every view,
+            requests, errors, mean and percentile latencies (ms), mean
+            queries and mean database time (ms)
+        """
+        with self.lock:
+            views = {}
+            for name, view in self.views.items():
+                views[name] = {
+                    'requests': view.requests,
+                    'errors': view.errors,
+                    'latency_ms': {
+                        'mean': view.latency.sum / view.requests * 1000,
+                        'p50': view.percentile(0.50) * 1000,
+                        'p95': view.percentile(0.95) * 1000,
+                        'p99': view.percentile(0.99) * 1000,
+                    },
+                    'queries': view.queries.sum / view.requests,
+                    'db_ms': view.db_time.sum / view.requests * 1000,
+                }
+            return {'seconds': time.time() - self.started, 'views': views}
+
+    def prometheus(self):
+        """
+        prometheus
+        ----------
+        Returns:
+            The metrics in the Prometheus text exposition format
+        """
+        lines = []
+
+        def histogram(name, doc, attr):
+            lines.append('# HELP %s %s' % (name, doc))
+            lines.append('# TYPE %s histogram' % name)
+            for view_name, view in self.views.items():
+                values = getattr(view, attr)
+                for bound, count in values.cumulative():
+                    lines.append('%s_bucket{view="%s",le="%s"} %d' % (
+                        name, view_name, bound, count))
+                lines.append('%s_sum{view="%s"} %s' % (name, view_name,
+                                                       values.sum))
+                lines.append('%s_count{view="%s"} %d' % (name, view_name,
+                                                         values.count))
+
+        def counter(name, doc, attr):
+            lines.append('# HELP %s %s' % (name, doc))
+            lines.append('# TYPE %s counter' % name)
+            for view_name, view in self.views.items():
+                lines.append('%s{view="%s"} %d' % (name, view_name,
+                                                   getattr(view, attr)))
+
+        with self.lock:
+            counter('mouse_cat_requests_total', 'Requests served.',
+                    'requests')
+            counter('mouse_cat_request_errors_total',
+                    'Requests answered with a 4xx or 5xx status.', 'errors')
+            histogram('mouse_cat_request_seconds', 'Request latency.',
+                      'latency')
+            histogram('mouse_cat_request_queries',
+                      'Database queries per request.', 'queries')
+            histogram('mouse_cat_request_db_seconds',
+                      'Database time per request.', 'db_time')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
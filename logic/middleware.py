@@ -0,0 +1,143 @@
+"""
+Middleware of the mouse & cat application.
+"""
+
+import cProfile
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.db import connection
+
+from logic import metrics, profiling
+
+
+class EphemeralStore():
+    '''
+    Small per-browser store for values that change on almost every request
+    but are not worth a session write: request counters and replay cursors.
+    It is kept in a signed cookie, so clients cannot forge its values, and
+    the cookie is only sent back when a value actually changes.
+    '''
+    def __init__(self, data=None):
+        self._data = data or {}
+        self.modified = False
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        if self._data.get(key, self) != value:
+            self._data[key] = value
+            self.modified = True
+
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+    def pop(self, key, default=None):
+        if key in self._data:
+            self.modified = True
+        return self._data.pop(key, default)
+
+    def dumps(self):
+        return signing.dumps(self._data, salt=settings.EPHEMERAL_COOKIE_NAME,
+                             compress=True)
+
+    @classmethod
+    def loads(cls, value):
+        try:
+            return cls(signing.loads(value,
+                                     salt=settings.EPHEMERAL_COOKIE_NAME,
+                                     max_age=settings.EPHEMERAL_COOKIE_AGE))
+        except signing.BadSignature:
+            return cls()
+
+
+class EphemeralStoreMiddleware():
+    '''
+    Sets request.ephemeral (an EphemeralStore) and stores it back in its
+    cookie when a view changed it.
+    '''
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        cookie = request.COOKIES.get(settings.EPHEMERAL_COOKIE_NAME)
+        request.ephemeral = (EphemeralStore.loads(cookie) if cookie
+                             else EphemeralStore())
+        response = self.get_response(request)
+        if request.ephemeral.modified:
+            response.set_cookie(settings.EPHEMERAL_COOKIE_NAME,
+                                request.ephemeral.dumps(),
+                                max_age=settings.EPHEMERAL_COOKIE_AGE,
+                                httponly=True, samesite='Lax')
+        return response
+
+
+class QueryRecorder():
+    '''
+    Database execute wrapper counting the queries of a request and the
+    time spent in them
+    '''
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+
+
+class MetricsMiddleware():
+    '''
+    Records the latency, queries and database time of every request in
+    logic.metrics, by URL name. It should be the first middleware, so the
+    time and queries of the others are included.
+    '''
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        view = match.url_name if match and match.url_name else 'unresolved'
+        metrics.registry.observe(view, response.status_code,
+                                 time.perf_counter() - start,
+                                 recorder.count, recorder.seconds)
+        return response
+
+
+class ProfilingMiddleware():
+    '''
+    Runs a request under cProfile when a staff user asks for it with the
+    X-Profile header or the 'profile' query parameter. The profile is
+    stored with logic.profiling and its name returned in the X-Profile-Id
+    header. Other requests only pay for checking the flag. It must come
+    after AuthenticationMiddleware.
+    '''
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not (request.META.get('HTTP_X_PROFILE') or
+                'profile' in request.GET) or not request.user.is_staff:
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        response = profiler.runcall(self.get_response, request)
+        seconds = time.perf_counter() - start
+        match = getattr(request, 'resolver_match', None)
+        view = match.url_name if match and match.url_name else 'unresolved'
+        response['X-Profile-Id'] = profiling.save(profiler, view, seconds)
+        return response
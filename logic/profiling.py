@@ -0,0 +1,103 @@
+"""
+Storage of the request profiles taken by ProfilingMiddleware.
+
+Every profile is a pstats file (cProfile.Profile.dump_stats) in
+settings.PROFILE_DIR, named after the time, view and duration of the
+request. They can be read with pstats or turned into flame graphs with
+tools such as snakeviz or flameprof. Only the last settings.PROFILE_KEEP
+profiles are kept.
+"""
+
+import io
+import os
+import pstats
+import re
+import time
+
+from django.conf import settings
+
+NAME_RE = re.compile(r'^(?P<created>\d+)-(?P<view>[\w-]+)-(?P<ms>\d+)ms'
+                     r'\.prof$')
+
+
+def path_of(name):
+    """
+    path_of
+    ----------
+    Input parameters:
+        name: name of a profile
+    ----------
+    Returns:
+        Path of the profile file, or None if 'name' is not a valid name
+    """
+    if not NAME_RE.match(name):
+        return None
+    return os.path.join(settings.PROFILE_DIR, name)
+
+
+def save(profiler, view, seconds):
+    """
+    save
+    ----------
+    Input parameters:
+        profiler: cProfile.Profile with the stats of a request
+        view: URL name of the request
+        seconds: duration of the request
+    ----------
+    Returns:
+        Name of the stored profile
+    """
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    name = '%d-%s-%dms.prof' % (time.time() * 1000,
+                                re.sub(r'[^\w-]', '_', view), seconds * 1000)
+    profiler.dump_stats(os.path.join(settings.PROFILE_DIR, name))
+    for old in list_profiles()[settings.PROFILE_KEEP:]:
+        try:
+            os.remove(path_of(old['name']))
+        except OSError:
+            pass
+    return name
+
+
+def list_profiles():
+    """
+    list_profiles
+    ----------
+    Returns:
+        List of dictionaries (name, view, ms, created, size) with the stored
+        profiles, newest first
+    """
+    try:
+        names = os.listdir(settings.PROFILE_DIR)
+    except FileNotFoundError:
+        return []
+    profiles = []
+    for name in names:
+        match = NAME_RE.match(name)
+        if match:
+            profiles.append({
+                'name': name,
+                'view': match.group('view'),
+                'ms': int(match.group('ms')),
+                'created': int(match.group('created')) / 1000,
+                'size': os.path.getsize(path_of(name)),
+            })
+    profiles.sort(key=lambda profile: profile['name'], reverse=True)
+    return profiles
+
+
+def as_text(name, limit=50):
+    """
+    as_text
+    ----------
+    Input parameters:
+        name: name of a stored profile
+        limit: functions listed
+    ----------
+    Returns:
+        pstats report of the profile, by cumulative time
+    """
+    out = io.StringIO()
+    stats = pstats.Stats(path_of(name), stream=out)
+    stats.sort_stats('cumulative').print_stats(limit)
+    return out.getvalue()
@@ -1,20 +1,42 @@
 """
 """
 
+from django.apps import apps
+from django.conf import settings as django_settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
 from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from datamodel import tests
-from datamodel.models import Game, GameStatus, Move, Counter
+import base64
+import importlib
+import os
+import tempfile
+from unittest import mock
+
+from datamodel import bot, constants, engine, hints, rules, tablebase, tests
+from datamodel.models import Game, GameStatus, Keyframe, Move, Counter
 from decimal import Decimal
 import json
 import re
-from . import tests_services
+from . import metrics, tests_services, views
 from logic.tests_services import BaseModelTest as BMTest
 from . import forms
+from ratonGato import settings
 
 GAME_STATUS_SERVICE = "game_status"
 GET_MOVE_SERVICE = "get_move"
+REPLAY_LOG_SERVICE = "replay_log"
+BOARD_SERVICE = "board"
+STATE_SERVICE = "state"
+HINT_SERVICE = "hint"
+EVENTS_SERVICE = "events"
+LEADERBOARD_SERVICE = "leaderboard"
 
 
 class AdditionalMoveTest(tests.BaseModelTest):
@@ -50,6 +72,26 @@ class AdditionalMoveTest(tests.BaseModelTest):
                     target=9)
         self.assertEqual(str(move), "[cat_user_test] - Origen: 0 - Destino: 9")
 
+    def test3(self):
+        """ Moves played before there were plies are numbered by date """
+        play_game(self.game, 6)
+        other = Game.objects.create(cat_user=self.users[1],
+                                    mouse_user=self.users[0],
+                                    status=GameStatus.ACTIVE)
+        play_game(other, 3)
+        before = list(Move.objects.order_by("id").values_list("id", "ply"))
+        Move.objects.update(ply=F("ply") + 100)
+        Game.objects.update(ply=0)
+        migration = importlib.import_module(
+            "datamodel.migrations.0009_move_ply")
+        with mock.patch.object(migration, "BATCH_SIZE", 4):
+            migration.number_moves(apps, mock.Mock(connection=connection))
+        self.assertEqual(
+            list(Move.objects.order_by("id").values_list("id", "ply")),
+            before)
+        self.assertEqual(Game.objects.get(id=self.game.id).ply, 6)
+        self.assertEqual(Game.objects.get(id=other.id).ply, 3)
+
 
 class AdditionalGameTest(tests.BaseModelTest):
     def setUp(self):
@@ -151,6 +193,482 @@ class AdditionalGetMoveServiceTests(tests_services.PlayGameBaseServiceTests):
         self.assertEqual(response.status_code, 404)
 
 
+class ReplayLogServiceTests(tests_services.PlayGameBaseServiceTests):
+    def setUp(self):
+        super().setUp()
+
+        self.game = Game.objects.create(cat_user=self.user1,
+                                        mouse_user=self.user2,
+                                        status=GameStatus.ACTIVE)
+        self.moves = [
+            {"player": self.user1, "origin": 0, "target": 9},
+            {"player": self.user2, "origin": 59, "target": 50},
+            {"player": self.user1, "origin": 2, "target": 11},
+        ]
+
+        for move in self.moves:
+            Move.objects.create(game=self.game,
+                                player=move["player"],
+                                origin=move["origin"],
+                                target=move["target"])
+        self.game.status = GameStatus.FINISHED
+        self.game.winner = self.user1
+        self.game.save()
+
+    def tearDown(self):
+        super().tearDown()
+
+    def test1(self):
+        """ Whole move log of a finished game in a single request """
+        self.loginTestUser(self.client1, self.user1)
+        response = self.client1.get(reverse(REPLAY_LOG_SERVICE,
+                                            args=[self.game.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('max-age', response['Cache-Control'])
+        data = json.loads(self.decode(response.content))
+        self.assertEqual(data["initial"], {"cats": [0, 2, 4, 6],
+                                           "mouse": 59})
+        self.assertEqual(data["winner"], self.user1.username)
+        moves = rules.unpack_moves(base64.b64decode(data["moves"]))
+        self.assertEqual(moves, [(move["origin"], move["target"])
+                                 for move in self.moves])
+
+    def test2(self):
+        """ Games that are not finished cannot be replayed """
+        game = Game.objects.create(cat_user=self.user1,
+                                   mouse_user=self.user2,
+                                   status=GameStatus.ACTIVE)
+        self.loginTestUser(self.client1, self.user1)
+        response = self.client1.get(reverse(REPLAY_LOG_SERVICE,
+                                            args=[game.id]))
+        self.assertEqual(response.status_code, 404)
+
+    def test3(self):
+        """ Only the players of a game can replay it """
+        outsider = tests.BaseModelTest.get_or_create_user("replay_outsider")
+        self.loginTestUser(self.client1, outsider)
+        response = self.client1.get(reverse(REPLAY_LOG_SERVICE,
+                                            args=[self.game.id]))
+        self.assertEqual(response.status_code, 404)
+        self.loginTestUser(self.client2, self.user2)
+        response = self.client2.get(reverse(REPLAY_LOG_SERVICE,
+                                            args=[self.game.id]))
+        self.assertEqual(response.status_code, 200)
+        outsider.delete()
+
+
+def play_game(game, n_moves):
+    """ Plays 'n_moves' legal moves that do not end the game, returns the
+        positions reached """
+    positions = [game.position]
+    for _ in range(n_moves):
+        origin, target = [move for move in rules.legal_moves(game.position)
+                          if not rules.is_terminal(rules.apply_move(
+                              game.position, *move))][0]
+        player = game.cat_user if game.cat_turn else game.mouse_user
+        Move.objects.create(game=game, player=player, origin=origin,
+                            target=target)
+        positions.append(game.position)
+    return positions
+
+
+class KeyframeTests(tests.BaseModelTest):
+    def setUp(self):
+        super().setUp()
+        self.game = Game.objects.create(cat_user=self.users[0],
+                                        mouse_user=self.users[1],
+                                        status=GameStatus.ACTIVE)
+        self.positions = play_game(self.game, 20)
+
+    def test1(self):
+        """ Keyframes are stored every KEYFRAME_INTERVAL moves """
+        self.assertEqual(list(Keyframe.objects.filter(game=self.game).
+                              values_list('ply', flat=True).order_by('ply')),
+                         [0, 8, 16])
+
+    def test2(self):
+        """ Board of every ply of the game """
+        for ply, position in enumerate(self.positions):
+            self.assertEqual(self.game.position_at(ply), position)
+        with self.assertRaises(ValueError):
+            self.game.position_at(len(self.positions))
+
+    def test3(self):
+        """ Boards of games without keyframes are rebuilt from the end """
+        Keyframe.objects.filter(game=self.game).delete()
+        for ply, position in enumerate(self.positions):
+            self.assertEqual(self.game.position_at(ply), position)
+
+    def test4(self):
+        """ Keyframes of the games played before there were any """
+        migration = importlib.import_module(
+            "datamodel.migrations.0015_backfill_keyframes")
+        keyframes = list(Keyframe.objects.filter(game=self.game).order_by(
+            "ply").values_list("ply", "cat1", "cat2", "cat3", "cat4",
+                               "mouse", "cat_turn"))
+        Keyframe.objects.filter(game=self.game).delete()
+        migration.add_keyframes(apps, None)
+        self.assertEqual(list(Keyframe.objects.filter(
+            game=self.game).order_by("ply").values_list(
+                "ply", "cat1", "cat2", "cat3", "cat4", "mouse", "cat_turn")),
+            keyframes)
+        # Games that have them are left alone
+        migration.add_keyframes(apps, None)
+        self.assertEqual(Keyframe.objects.filter(game=self.game).count(),
+                         len(keyframes))
+
+
+class BoardServiceTests(tests_services.PlayGameBaseServiceTests):
+    def setUp(self):
+        super().setUp()
+        self.game = Game.objects.create(cat_user=self.user1,
+                                        mouse_user=self.user2,
+                                        status=GameStatus.ACTIVE)
+        self.positions = play_game(self.game, 10)
+
+    def tearDown(self):
+        super().tearDown()
+
+    def test1(self):
+        """ Board at an arbitrary ply """
+        self.loginTestUser(self.client1, self.user1)
+        for ply in [7, 0, 10, 3]:
+            response = self.client1.get(reverse(BOARD_SERVICE,
+                                                args=[self.game.id, ply]))
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(self.decode(response.content))
+            position = self.positions[ply]
+            self.assertEqual(data["cats"], list(position.cats))
+            self.assertEqual(data["mouse"], position.mouse)
+            self.assertEqual(data["cat_turn"], position.cat_turn)
+            self.assertEqual(data["n_plies"], 10)
+
+    def test2(self):
+        """ Plies beyond the end of the game """
+        self.loginTestUser(self.client1, self.user1)
+        response = self.client1.get(reverse(BOARD_SERVICE,
+                                            args=[self.game.id, 11]))
+        self.assertEqual(response.status_code, 404)
+
+    def test3(self):
+        """ Only the players of a game can see its boards """
+        outsider = tests.BaseModelTest.get_or_create_user("board_outsider")
+        self.loginTestUser(self.client1, outsider)
+        response = self.client1.get(reverse(BOARD_SERVICE,
+                                            args=[self.game.id, 3]))
+        self.assertEqual(response.status_code, 404)
+        outsider.delete()
+
+
+class BoardFragmentCacheTests(tests_services.PlayGameBaseServiceTests):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.game = Game.objects.create(cat_user=self.user1,
+                                        mouse_user=self.user2,
+                                        status=GameStatus.ACTIVE)
+
+    def tearDown(self):
+        super().tearDown()
+
+    def show_game(self):
+        response = self.client1.get(
+            reverse(tests_services.SHOW_GAME_SERVICE))
+        self.assertEqual(response.status_code, 200)
+        return self.decode(response.content)
+
+    def test1(self):
+        """ The board is cached by position, whoever looks at it """
+        self.set_game_in_session(self.client1, self.user1, self.game.id)
+        key = make_template_fragment_key('board', ['0.2.4.6-59'])
+        content = self.show_game()
+        self.assertIn('id="chess_board"', content)
+        self.assertIn('id="chess_board"', cache.get(key))
+
+        Move.objects.create(game=self.game, player=self.user1,
+                            origin=0, target=9)
+        content = self.show_game()
+        # The cats are in the key by cell, not in the order of the game
+        key = make_template_fragment_key('board', ['2.4.6.9-59'])
+        self.assertIsNotNone(cache.get(key))
+        cell = re.search(r'id="cell_9".*?</td>', content, re.S).group(0)
+        self.assertIn('cat-drag', cell)
+        self.assertEqual(views.board_context(rules.Position(
+            (6, 9, 2, 4), 59, False))['board_key'], '2.4.6.9-59')
+
+        # The mouse gets the board the cat cached
+        self.set_game_in_session(self.client2, self.user2, self.game.id)
+        with mock.patch('logic.views.board_cells') as board_cells:
+            response = self.client2.get(
+                reverse(tests_services.SHOW_GAME_SERVICE))
+        board_cells.assert_not_called()
+        self.assertIn('cat-drag', re.search(
+            r'id="cell_9".*?</td>', self.decode(response.content),
+            re.S).group(0))
+
+    def test2(self):
+        """ Cached boards are served without building the cells """
+        self.set_game_in_session(self.client1, self.user1, self.game.id)
+        first = self.show_game()
+        with mock.patch('logic.views.board_cells') as board_cells:
+            second = self.show_game()
+        board_cells.assert_not_called()
+        board = re.compile(r'<table id="chess_board">.*?</table>', re.S)
+        self.assertEqual(board.search(first).group(0),
+                         board.search(second).group(0))
+
+
+class StateServiceTests(tests_services.PlayGameBaseServiceTests):
+    def setUp(self):
+        super().setUp()
+        self.game = Game.objects.create(cat_user=self.user1,
+                                        mouse_user=self.user2,
+                                        status=GameStatus.ACTIVE)
+
+    def tearDown(self):
+        super().tearDown()
+
+    def test1(self):
+        """ Game state as JSON """
+        self.set_game_in_session(self.client2, self.user2, self.game.id)
+        response = self.client2.get(reverse(STATE_SERVICE))
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(self.decode(response.content))
+        self.assertEqual(data["cats"], [0, 2, 4, 6])
+        self.assertEqual(data["mouse"], 59)
+        self.assertTrue(data["cat_turn"])
+        self.assertEqual(data["status"], GameStatus.ACTIVE)
+        self.assertEqual(data["version"], self.game.version)
+        self.assertEqual(data["mouse_user"], self.user2.username)
+        self.assertIsNone(data["winner"])
+
+    def test2(self):
+        """ Conditional GET: 304 until the game changes """
+        self.set_game_in_session(self.client2, self.user2, self.game.id)
+        response = self.client2.get(reverse(STATE_SERVICE))
+        etag = response["ETag"]
+        response = self.client2.get(reverse(STATE_SERVICE),
+                                    HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+        Move.objects.create(game=self.game, player=self.user1,
+                            origin=0, target=9)
+        response = self.client2.get(reverse(STATE_SERVICE),
+                                    HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        data = json.loads(self.decode(response.content))
+        self.assertEqual(data["cats"], [9, 2, 4, 6])
+        self.assertFalse(data["cat_turn"])
+
+    def test3(self):
+        """ No game selected """
+        self.set_game_in_session(self.client2, self.user2, None)
+        response = self.client2.get(reverse(STATE_SERVICE))
+        self.assertEqual(response.status_code, 404)
+
+    def test4(self):
+        """ Polling reads the game from the cache, not the database """
+        self.set_game_in_session(self.client2, self.user2, self.game.id)
+        self.client2.get(reverse(STATE_SERVICE))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client2.get(reverse(STATE_SERVICE))
+        self.assertEqual(response.status_code, 200)
+        for query in queries.captured_queries:
+            self.assertNotIn('datamodel_game', query['sql'])
+
+
+@override_settings(HINT_SECONDS=0.01)
+class HintServiceTests(tests_services.PlayGameBaseServiceTests):
+    def setUp(self):
+        super().setUp()
+        hints.cache_clear()
+        self.game = Game.objects.create(cat_user=self.user1,
+                                        mouse_user=self.user2,
+                                        status=GameStatus.ACTIVE)
+
+    def tearDown(self):
+        super().tearDown()
+
+    def test1(self):
+        """ Legal move for the player to move, without reading moves """
+        Move.objects.create(game=self.game, player=self.user1,
+                            origin=0, target=9)
+        self.set_game_in_session(self.client2, self.user2, self.game.id)
+        with mock.patch.object(tablebase, 'get', return_value=None), \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client2.get(reverse(HINT_SERVICE))
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(self.decode(response.content))
+        self.assertIn((data["origin"], data["target"]),
+                      rules.legal_moves(rules.Position((9, 2, 4, 6), 59,
+                                                       False)))
+        self.assertEqual(data["source"], "search")
+        self.assertIsInstance(data["score"], int)
+        for query in queries.captured_queries:
+            self.assertNotIn("datamodel_move", query["sql"])
+
+    def test2(self):
+        """ Hints of a position are computed once """
+        self.set_game_in_session(self.client1, self.user1, self.game.id)
+        with mock.patch.object(tablebase, 'get', return_value=None), \
+                mock.patch.object(engine, 'analyse',
+                                  return_value=((0, 9), 12)) as analyse:
+            first = self.client1.get(reverse(HINT_SERVICE))
+            second = self.client1.get(reverse(HINT_SERVICE))
+        self.assertEqual(analyse.call_count, 1)
+        self.assertEqual(first.content, second.content)
+
+    def test3(self):
+        """ Perfect moves come from the tablebase when there is one """
+        table = mock.Mock()
+        table.probe.return_value = tablebase.Result(rules.CAT, 41)
+        table.best_move.return_value = (6, 15)
+        self.set_game_in_session(self.client1, self.user1, self.game.id)
+        with mock.patch.object(tablebase, 'get', return_value=table):
+            response = self.client1.get(reverse(HINT_SERVICE))
+        data = json.loads(self.decode(response.content))
+        self.assertEqual(data, {"origin": 6, "target": 15, "winner": "cat",
+                                "plies": 41, "score": engine.WIN - 41,
+                                "source": "tablebase"})
+
+    def test4(self):
+        """ No hints out of turn or without a game """
+        self.set_game_in_session(self.client2, self.user2, self.game.id)
+        response = self.client2.get(reverse(HINT_SERVICE))
+        self.assertEqual(response.status_code, 404)
+
+        self.loginTestUser(self.client1, self.user1)
+        response = self.client1.get(reverse(HINT_SERVICE))
+        self.assertEqual(response.status_code, 404)
+
+
+class EventsServiceTests(tests_services.PlayGameBaseServiceTests):
+    def setUp(self):
+        super().setUp()
+        self.game = Game.objects.create(cat_user=self.user1,
+                                        mouse_user=self.user2,
+                                        status=GameStatus.ACTIVE)
+
+    def tearDown(self):
+        super().tearDown()
+
+    @classmethod
+    def parse_event(cls, chunk):
+        fields = dict(line.split(': ', 1)
+                      for line in cls.decode(chunk).strip().split('\n'))
+        return fields["event"], json.loads(fields["data"])
+
+    def test1(self):
+        """ State on connection and after every committed move """
+        self.set_game_in_session(self.client2, self.user2, self.game.id)
+        response = self.client2.get(reverse(EVENTS_SERVICE))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = iter(response.streaming_content)
+
+        event, data = self.parse_event(next(stream))
+        self.assertEqual(event, "state")
+        self.assertEqual(data["version"], self.game.version)
+        self.assertTrue(data["cat_turn"])
+
+        Move.objects.create(game=self.game, player=self.user1,
+                            origin=0, target=9)
+        event, data = self.parse_event(next(stream))
+        self.assertEqual(data["version"], self.game.version)
+        self.assertEqual(data["cats"], [9, 2, 4, 6])
+        self.assertFalse(data["cat_turn"])
+        response.close()
+
+    def test2(self):
+        """ The stream ends with the state of a finished game """
+        self.game.status = GameStatus.FINISHED
+        self.game.save()
+        self.set_game_in_session(self.client2, self.user2, self.game.id)
+        response = self.client2.get(reverse(EVENTS_SERVICE),
+                                    HTTP_LAST_EVENT_ID=str(self.game.version))
+        chunks = list(response.streaming_content)
+        self.assertEqual(len(chunks), 1)
+        event, data = self.parse_event(chunks[0])
+        self.assertEqual(data["status"], GameStatus.FINISHED)
+
+    def test3(self):
+        """ The stream ends on the turn of the user """
+        self.set_game_in_session(self.client1, self.user1, self.game.id)
+        response = self.client1.get(reverse(EVENTS_SERVICE))
+        chunks = list(response.streaming_content)
+        self.assertEqual(len(chunks), 1)
+        event, data = self.parse_event(chunks[0])
+        self.assertTrue(data["cat_turn"])
+
+        self.set_game_in_session(self.client2, self.user2, self.game.id)
+        response = self.client2.get(reverse(EVENTS_SERVICE))
+        stream = iter(response.streaming_content)
+        self.parse_event(next(stream))
+        Move.objects.create(game=self.game, player=self.user1,
+                            origin=0, target=9)
+        event, data = self.parse_event(next(stream))
+        self.assertFalse(data["cat_turn"])
+        with self.assertRaises(StopIteration):
+            next(stream)
+
+
+class LeaderboardServiceTests(tests_services.GameRequiredBaseServiceTests):
+    def setUp(self):
+        super().setUp()
+        for winner in [self.user1, self.user1, self.user2]:
+            game = Game.objects.create(cat_user=self.user1,
+                                       mouse_user=self.user2,
+                                       status=GameStatus.ACTIVE)
+            game.status = GameStatus.FINISHED
+            game.winner = winner
+            game.save()
+
+    def tearDown(self):
+        super().tearDown()
+
+    def test1(self):
+        """ Only for logged users """
+        response = self.client1.get(reverse(LEADERBOARD_SERVICE))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response["Location"].startswith(settings.LOGIN_URL))
+
+    def test2(self):
+        """ Best players first, without reading the games """
+        self.loginTestUser(self.client2, self.user2)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client2.get(reverse(LEADERBOARD_SERVICE))
+        self.assertEqual(response.status_code, 200)
+        for query in queries.captured_queries:
+            self.assertNotIn("datamodel_game", query["sql"])
+        data = json.loads(self.decode(response.content))
+        self.assertEqual([(player["rank"], player["username"],
+                           player["wins"]) for player in data["players"]],
+                         [(1, self.user1.username, 2),
+                          (2, self.user2.username, 1)])
+        self.assertEqual(data["players"][0]["cat_wins"], 2)
+        self.assertEqual(data["players"][0]["streak"], 0)
+        self.assertEqual(data["players"][0]["best_streak"], 2)
+        self.assertEqual(data["user"]["username"], self.user2.username)
+        self.assertEqual(data["user"]["mouse_wins"], 1)
+
+    def test3(self):
+        """ Number of players asked for, and players without stats """
+        user = tests.BaseModelTest.get_or_create_user("leaderboard_new")
+        self.loginTestUser(self.client1, user)
+        response = self.client1.get(reverse(LEADERBOARD_SERVICE),
+                                    {"limit": 1})
+        data = json.loads(self.decode(response.content))
+        self.assertEqual(len(data["players"]), 1)
+        self.assertIsNone(data["user"])
+        for limit in [0, settings.LEADERBOARD_SIZE + 1, "x"]:
+            response = self.client1.get(reverse(LEADERBOARD_SERVICE),
+                                        {"limit": limit})
+            self.assertEqual(response.status_code, 404)
+        user.delete()
+
+
 class MoveServiceTests(tests_services.PlayGameBaseServiceTests):
     def setUp(self):
         super().setUp()
@@ -356,6 +874,356 @@ class SelectGameServiceTests(tests_services.GameRequiredBaseServiceTests):
             self.assertIn('Game: '+str(game.id), self.decode(response.content))
 
 
+class QuickMatchServiceTests(tests_services.GameRequiredBaseServiceTests):
+    def setUp(self):
+        super().setUp()
+
+    def tearDown(self):
+        super().tearDown()
+
+    def test1(self):
+        """ Quick match joins the oldest open game of another player """
+        Game.objects.create(cat_user=self.user2)
+        oldest = Game.objects.create(cat_user=self.user1)
+        newest = Game.objects.create(cat_user=self.user1)
+
+        self.loginTestUser(self.client2, self.user2)
+        response = self.client2.get(reverse('quick_match'))
+        self.assertRedirects(response, reverse('show_game'),
+                             fetch_redirect_response=False)
+        self.assertEqual(self.client2.session.get(
+            constants.GAME_SELECTED_SESSION_ID), oldest.id)
+        oldest = Game.objects.get(id=oldest.id)
+        self.assertEqual(oldest.mouse_user, self.user2)
+        self.assertEqual(oldest.status, GameStatus.ACTIVE)
+        self.assertIsNone(Game.objects.get(id=newest.id).mouse_user)
+
+    def test2(self):
+        """ Without open games the player waits in a game of its own """
+        self.loginTestUser(self.client1, self.user1)
+        response = self.client1.get(reverse('quick_match'))
+        self.assertEqual(response.status_code, 200)
+        game = Game.objects.get(cat_user=self.user1)
+        self.assertIsNone(game.mouse_user)
+
+        # Asking again does not create another game
+        self.client1.get(reverse('quick_match'))
+        self.assertEqual(Game.objects.filter(cat_user=self.user1).count(), 1)
+
+        self.loginTestUser(self.client2, self.user2)
+        self.client2.get(reverse('quick_match'))
+        self.assertEqual(Game.objects.get(id=game.id).mouse_user, self.user2)
+
+    def test3(self):
+        """ Joining a game that is already taken """
+        game = Game.objects.create(cat_user=self.user1)
+        user3 = User.objects.create_user(username='quick_match_user3',
+                                         password='quick_match_user3')
+        Game.objects.claim(game.id, user3)
+
+        self.loginTestUser(self.client2, self.user2)
+        response = self.client2.get(reverse(
+            tests_services.SELECT_GAME_SERVICE, args=['join_game', game.id]))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Game.objects.get(id=game.id).mouse_user, user3)
+
+
+@override_settings(BOT_MOVE_SECONDS=0.05)
+class ComputerServiceTests(tests_services.GameRequiredBaseServiceTests):
+    def setUp(self):
+        super().setUp()
+
+    def tearDown(self):
+        super().tearDown()
+
+    def test1(self):
+        """ The computer answers the moves of the cat """
+        self.loginTestUser(self.client1, self.user1)
+        response = self.client1.get(reverse('play_computer'), {'role': 'cat'})
+        self.assertRedirects(response, reverse('show_game'),
+                             fetch_redirect_response=False)
+        game = Game.objects.get(cat_user=self.user1)
+        self.assertEqual(game.mouse_user, bot.get_user())
+        self.assertEqual(self.client1.session.get(
+            constants.GAME_SELECTED_SESSION_ID), game.id)
+
+        self.client1.post(reverse(tests_services.MOVE_SERVICE),
+                          {'origin': 0, 'target': 9})
+        game.refresh_from_db()
+        self.assertEqual(game.ply, 2)
+        self.assertTrue(game.cat_turn)
+        self.assertEqual(Move.objects.filter(game=game).last().player,
+                         bot.get_user())
+
+    def test2(self):
+        """ Playing the mouse, the computer opens the game """
+        self.loginTestUser(self.client1, self.user1)
+        self.client1.get(reverse('play_computer'), {'role': 'mouse'})
+        game = Game.objects.get(mouse_user=self.user1)
+        self.assertEqual(game.cat_user, bot.get_user())
+        self.assertEqual(game.ply, 1)
+        self.assertFalse(game.cat_turn)
+
+        origin = game.mouse
+        target = rules.legal_moves(game.position)[0][1]
+        self.client1.post(reverse(tests_services.MOVE_SERVICE),
+                          {'origin': origin, 'target': target})
+        game.refresh_from_db()
+        self.assertEqual(game.ply, 3)
+        self.assertFalse(game.cat_turn)
+
+    def test3(self):
+        """ Nobody can sign up as the computer, nor be played for """
+        form = forms.SignupForm({"username": settings.BOT_USERNAME.upper(),
+                                 "password": "a", "password2": "a"})
+        self.assertIn("username", form.errors)
+        self.assertTrue(forms.SignupForm({"username": "not_a_computer",
+                                          "password": "a",
+                                          "password2": "a"}).is_valid())
+
+        User.objects.filter(username=settings.BOT_USERNAME).delete()
+        User.objects.create_user(username=settings.BOT_USERNAME,
+                                 password="computer_password")
+        self.loginTestUser(self.client1, self.user1)
+        response = self.client1.get(reverse('play_computer'))
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Game.objects.filter(cat_user=self.user1).exists())
+
+
+class PaginationServiceTests(tests_services.GameRequiredBaseServiceTests):
+    def setUp(self):
+        super().setUp()
+
+    def tearDown(self):
+        super().tearDown()
+
+    def list_games(self, client, action, **params):
+        response = client.get(reverse(tests_services.SELECT_GAME_SERVICE,
+                                      args=[action]), params)
+        self.assertEqual(response.status_code, 200)
+        return [int(game_id) for game_id in
+                re.findall(r"Game: (\d+)", self.decode(response.content))]
+
+    def test1(self):
+        """ Keyset pagination of the games to play """
+        n_games = settings.GAMES_PER_PAGE + 3
+        games = [Game.objects.create(cat_user=self.user1,
+                                     mouse_user=self.user2).id
+                 for _ in range(n_games)]
+        games.reverse()
+        self.loginTestUser(self.client1, self.user1)
+
+        page1 = self.list_games(self.client1, 'play_game')
+        self.assertEqual(page1, games[:settings.GAMES_PER_PAGE])
+        page2 = self.list_games(self.client1, 'play_game',
+                                before=page1[-1])
+        self.assertEqual(page2, games[settings.GAMES_PER_PAGE:])
+        self.assertEqual(self.list_games(self.client1, 'play_game',
+                                         after=page2[0]), page1)
+
+    def test2(self):
+        """ Role filters """
+        as_cat = Game.objects.create(cat_user=self.user1,
+                                     mouse_user=self.user2)
+        as_mouse = Game.objects.create(cat_user=self.user2,
+                                       mouse_user=self.user1)
+        self.loginTestUser(self.client1, self.user1)
+        self.assertEqual(self.list_games(self.client1, 'play_game'),
+                         [as_mouse.id, as_cat.id])
+        self.assertEqual(self.list_games(self.client1, 'play_game',
+                                         filter=1, cat='on'),
+                         [as_cat.id])
+        self.assertEqual(self.list_games(self.client1, 'play_game',
+                                         filter=1, mouse='on'),
+                         [as_mouse.id])
+        self.assertEqual(self.list_games(self.client1, 'play_game',
+                                         filter=1), [])
+
+    def test3(self):
+        """ The number of queries does not depend on the number of games """
+        self.loginTestUser(self.client1, self.user1)
+        n_queries = []
+        for _ in range(2):
+            for _ in range(settings.GAMES_PER_PAGE):
+                Game.objects.create(cat_user=self.user1,
+                                    mouse_user=self.user2)
+            with CaptureQueriesContext(connection) as queries:
+                self.list_games(self.client1, 'play_game')
+            n_queries.append(len(queries))
+        self.assertEqual(n_queries[0], n_queries[1])
+
+
+class SessionWriteTests(tests_services.PlayGameBaseServiceTests):
+    def setUp(self):
+        super().setUp()
+        self.game = Game.objects.create(cat_user=self.user1,
+                                        mouse_user=self.user2,
+                                        status=GameStatus.ACTIVE)
+        play_game(self.game, 3)
+        self.set_game_in_session(self.client1, self.user1, self.game.id)
+
+    def tearDown(self):
+        super().tearDown()
+
+    def assertNoSessionWrites(self, queries):
+        for query in queries.captured_queries:
+            sql = query['sql'].upper()
+            if 'DJANGO_SESSION' in sql:
+                self.assertTrue(sql.startswith('SELECT'), query['sql'])
+
+    def test1(self):
+        """ Polling and replaying do not write the session """
+        with CaptureQueriesContext(connection) as queries:
+            self.client1.get(reverse(STATE_SERVICE))
+            self.client1.get(reverse(GAME_STATUS_SERVICE))
+            for shift in [1, 1, -1, 1]:
+                response = self.client1.post(reverse(GET_MOVE_SERVICE),
+                                             {'shift': shift})
+                self.assertEqual(response.status_code, 200)
+        self.assertNoSessionWrites(queries)
+        data = json.loads(self.decode(response.content))
+        self.assertEqual((data['origin'], data['target']),
+                         self.game.moves.values_list(
+                             'origin', 'target')[1])
+
+    def test2(self):
+        """ Counted requests keep the counter out of the session """
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(3):
+                response = self.client1.get(reverse(GET_MOVE_SERVICE))
+                self.assertEqual(response.status_code, 404)
+        self.assertNoSessionWrites(queries)
+        response = self.client1.get(reverse(tests_services.COUNTER_SERVICE))
+        self.assertIn('Counter session: <b>3</b>',
+                      self.decode(response.content))
+
+    def test3(self):
+        """ Forged counters are ignored """
+        self.client1.get(reverse(GET_MOVE_SERVICE))
+        name = settings.EPHEMERAL_COOKIE_NAME
+        self.client1.cookies[name] = self.client1.cookies[name].value + 'x'
+        response = self.client1.get(reverse(tests_services.COUNTER_SERVICE))
+        self.assertIn('Counter session: <b>0</b>',
+                      self.decode(response.content))
+
+
+class MetricsServiceTests(tests_services.PlayGameBaseServiceTests):
+    def setUp(self):
+        super().setUp()
+        metrics.registry.reset()
+        self.game = Game.objects.create(cat_user=self.user1,
+                                        mouse_user=self.user2,
+                                        status=GameStatus.ACTIVE)
+        self.staff = User.objects.create_user(username='metrics_staff',
+                                              password='metrics_staff',
+                                              is_staff=True)
+
+    def tearDown(self):
+        self.staff.delete()
+        super().tearDown()
+
+    def test1(self):
+        """ Latency, queries and errors by view, for staff only """
+        self.set_game_in_session(self.client1, self.user1, self.game.id)
+        for _ in range(3):
+            self.client1.get(reverse(STATE_SERVICE))
+        self.client1.post(reverse(tests_services.MOVE_SERVICE),
+                          {'origin': 0, 'target': 9})
+        self.client1.get(reverse(GET_MOVE_SERVICE))
+        response = self.client1.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 404)
+
+        self.loginTestUser(self.client2, self.staff)
+        data = json.loads(self.decode(self.client2.get(
+            reverse('metrics')).content))
+        views = data['views']
+        self.assertEqual(views['state']['requests'], 3)
+        self.assertEqual(views['state']['errors'], 0)
+        self.assertEqual(views['get_move']['errors'], 1)
+        self.assertGreater(views['move']['queries'], 0)
+        self.assertGreater(views['move']['db_ms'], 0)
+        latency = views['move']['latency_ms']
+        self.assertTrue(0 < latency['p50'] <= latency['p99'])
+
+    def test2(self):
+        """ Prometheus text format, with the token of the scraper """
+        self.set_game_in_session(self.client1, self.user1, self.game.id)
+        self.client1.get(reverse(STATE_SERVICE))
+        with mock.patch.object(settings, 'METRICS_TOKEN', 'scrape-token'):
+            response = self.client.get(reverse('prometheus_metrics'),
+                                       HTTP_AUTHORIZATION='Bearer wrong')
+            self.assertEqual(response.status_code, 404)
+            response = self.client.get(
+                reverse('prometheus_metrics'),
+                HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(response.status_code, 200)
+        text = self.decode(response.content)
+        self.assertIn('mouse_cat_requests_total{view="state"} 1', text)
+        self.assertIn('# TYPE mouse_cat_request_seconds histogram', text)
+        self.assertIn('mouse_cat_request_seconds_bucket{view="state",'
+                      'le="+Inf"} 1', text)
+        self.assertRegex(text, r'mouse_cat_request_queries_count'
+                               r'\{view="state"\} 1')
+
+
+class ProfilingServiceTests(tests_services.PlayGameBaseServiceTests):
+    def setUp(self):
+        super().setUp()
+        self.profile_dir = tempfile.TemporaryDirectory()
+        self.patch = mock.patch.object(django_settings, 'PROFILE_DIR',
+                                       self.profile_dir.name)
+        self.patch.start()
+        self.staff = User.objects.create_user(username='profile_staff',
+                                              password='profile_staff',
+                                              is_staff=True)
+
+    def tearDown(self):
+        self.patch.stop()
+        self.profile_dir.cleanup()
+        self.staff.delete()
+        super().tearDown()
+
+    def test1(self):
+        """ Staff requests with the flag are profiled and listed """
+        self.loginTestUser(self.client1, self.staff)
+        response = self.client1.get(reverse(
+            tests_services.SELECT_GAME_SERVICE, args=['join_game']),
+            {'profile': 1})
+        name = response['X-Profile-Id']
+        response = self.client1.get(reverse(STATE_SERVICE),
+                                    HTTP_X_PROFILE='1')
+        self.assertIn('X-Profile-Id', response)
+
+        profiles = json.loads(self.decode(self.client1.get(
+            reverse('profiles')).content))['profiles']
+        self.assertEqual(len(profiles), 2)
+        self.assertEqual(profiles[1]['name'], name)
+        self.assertEqual(profiles[1]['view'], 'select_game')
+
+        response = self.client1.get(reverse('profile', args=[name]),
+                                    {'format': 'text'})
+        self.assertIn('function calls', self.decode(response.content))
+        response = self.client1.get(reverse('profile', args=[name]))
+        self.assertEqual(b''.join(response.streaming_content),
+                         open(os.path.join(self.profile_dir.name, name),
+                              'rb').read())
+
+    def test2(self):
+        """ Other requests are not profiled """
+        self.loginTestUser(self.client1, self.user1)
+        response = self.client1.get(reverse(STATE_SERVICE), {'profile': 1})
+        self.assertNotIn('X-Profile-Id', response)
+        self.loginTestUser(self.client2, self.staff)
+        response = self.client2.get(reverse(STATE_SERVICE))
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(os.listdir(self.profile_dir.name), [])
+
+        response = self.client1.get(reverse('profiles'))
+        self.assertEqual(response.status_code, 404)
+        response = self.client2.get(reverse('profile', args=['..passwd']))
+        self.assertEqual(response.status_code, 404)
+
+
 class CounterServiceTests(tests_services.ServiceBaseTest):
     def setUp(self):
         super().setUp()
@@ -458,3 +1326,22 @@ class GameEndTests(tests.BaseModelTest):
 
         self.assertEqual(self.game.status, GameStatus.FINISHED)
         self.assertEqual(self.game.winner, self.game.mouse_user)
+
+
+class CounterShardTests(TestCase):
+    def setUp(self):
+        Counter.objects.all().delete()
+
+    @override_settings(COUNTER_SHARDS=4)
+    def test1(self):
+        """ Increments spread over shards are summed on read """
+        for i in range(1, 41):
+            self.assertEqual(Counter.objects.inc(), i)
+        self.assertLessEqual(Counter.objects.count(), 4)
+        self.assertEqual(Counter.objects.get_current_value(), 40)
+
+    def test2(self):
+        """ Increment without reading the value back """
+        self.assertIsNone(Counter.objects.inc(fetch=False))
+        Counter.objects.inc(fetch=False)
+        self.assertEqual(Counter.objects.get_current_value(), 2)
@@ -12,11 +12,24 @@ urlpatterns = [
     path('signup', views.signup, name='signup'),
     path('counter', views.counter, name='counter'),
     path('create_game', views.create_game, name='create_game'),
+    path('quick_match', views.quick_match, name='quick_match'),
+    path('play_computer', views.play_computer, name='play_computer'),
     path('get_move', views.get_move, name='get_move'),
     path('game_status', views.game_status, name='game_status'),
+    path('state', views.state, name='state'),
+    path('hint', views.hint, name='hint'),
+    path('leaderboard', views.leaderboard, name='leaderboard'),
+    path('events', views.game_events, name='events'),
+    path('replay_log/<int:game_id>', views.replay_log, name='replay_log'),
+    path('board/<int:game_id>/<int:ply>', views.board, name='board'),
     path('select_game/<str:action>', views.select_game, name='select_game'),
     path('select_game/<str:action>/<int:game_id>',
          views.select_game, name='select_game'),
     path('show_game', views.show_game, name='show_game'),
     path('move', views.move, name='move'),
+    path('metrics', views.request_metrics, name='metrics'),
+    path('metrics/prometheus', views.prometheus_metrics,
+         name='prometheus_metrics'),
+    path('profiles', views.profiles, name='profiles'),
+    path('profiles/<str:name>', views.profile, name='profile'),
 ]
@@ -1,11 +1,21 @@
+import base64
+import json
+import os
+import time
+
+from django.db import close_old_connections
 from django.http import HttpResponseForbidden, HttpResponse, JsonResponse
+from django.http import FileResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.crypto import constant_time_compare
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
+from logic import metrics, profiling
 from logic.forms import UserForm, SignupForm, MoveForm
-from datamodel import constants
-from datamodel.models import Counter, Game, GameStatus, Move
+from datamodel import bot, constants, events, game_cache, hints, rules, stats
+from datamodel.models import Counter, Game, GameStatus, Move, UserStats
 from django.db.models import Q
 from ratonGato import settings
 
@@ -66,6 +76,35 @@ def my_login_required(f):
     return wrapped
 
 
+def metrics_access_required(f):
+    """
+    metrics_access_required
+    ----------
+    Input parameters:
+        f: decorated function
+    ----------
+    Returns:
+        function wrapped
+    ----------
+    Raises:
+        None
+    ----------
+    Description:
+        Decorator definition. Only staff users or requests with the bearer
+        token of settings.METRICS_TOKEN (if any) can see the metrics and
+        profiles, the others get a 404 as if the page did not exist.
+    """
+    def wrapped(request, *args, **kwargs):
+        auth = request.META.get('HTTP_AUTHORIZATION', '')
+        token = settings.METRICS_TOKEN
+        if request.user.is_staff or (
+                token and constant_time_compare(auth, 'Bearer ' + token)):
+            return f(request, *args, **kwargs)
+        counter_inc(request)
+        return HttpResponse('Page not found', status=404)
+    return wrapped
+
+
 def errorHTTP(request, exception=None):
     """
     errorHTTP (main author: Rafael Sanchez)
@@ -138,7 +177,7 @@ def user_login(request):
         user = authenticate(username=username, password=password)
         if user:
             login(request, user)
-            request.session[constants.COUNTER_SESSION_ID] = 0
+            request.ephemeral[constants.COUNTER_SESSION_ID] = 0
             if next != 'None' and next is not None:
                 return redirect(next)
             return render(request, "mouse_cat/index.html")
@@ -176,7 +215,7 @@ def user_logout(request):
     if not request.user.is_authenticated:
         return redirect(reverse('index'))
 
-    request.session.pop(constants.COUNTER_SESSION_ID, None)
+    request.ephemeral.pop(constants.COUNTER_SESSION_ID, None)
     request.session.pop(constants.GAME_SELECTED_SESSION_ID, None)
     logout(request)
     return redirect(reverse('index'))
@@ -260,12 +299,10 @@ def counter_inc(request):
             Increase global and session counter whenever this function is
             invoked
     """
-    Counter.objects.inc()
+    Counter.objects.inc(fetch=False)
 
-    if not request.session.get(constants.COUNTER_SESSION_ID):
-        request.session[constants.COUNTER_SESSION_ID] = 1
-    else:
-        request.session[constants.COUNTER_SESSION_ID] += 1
+    counter_session = request.ephemeral.get(constants.COUNTER_SESSION_ID, 0)
+    request.ephemeral[constants.COUNTER_SESSION_ID] = counter_session + 1
 
 
 def counter(request):
@@ -286,10 +323,7 @@ def counter(request):
     """
 
     counter_global = Counter.objects.get_current_value()
-    if request.session.get(constants.COUNTER_SESSION_ID):
-        counter_session = request.session[constants.COUNTER_SESSION_ID]
-    else:
-        counter_session = request.session[constants.COUNTER_SESSION_ID] = 0
+    counter_session = request.ephemeral.get(constants.COUNTER_SESSION_ID, 0)
 
     context_dict = {'counter_session': counter_session,
                     'counter_global': counter_global}
@@ -319,6 +353,159 @@ def create_game(request):
     return render(request, "mouse_cat/new_game.html", {'game': game})
 
 
+@my_login_required
+def quick_match(request):
+    """
+    quick_match
+    ----------
+    Input parameters:
+        request: received request. It contains logged user information.
+    ----------
+    Returns:
+            It redirects to "show_game" once the user is paired or renders
+        "mouse_cat/new_game.html" while the user waits as the cat
+    ----------
+    Raises:
+        None
+    ----------
+    Description:
+            It pairs the user with the oldest open game of another player,
+        or leaves the user waiting in an open game of its own if there is
+        none (see GameManager.quick_match).
+        User is required to be logged.
+    """
+    game = Game.objects.quick_match(request.user)
+    if game.mouse_user_id is None:
+        return render(request, "mouse_cat/new_game.html", {'game': game})
+    request.session[constants.GAME_SELECTED_SESSION_ID] = game.id
+    request.session['from'] = 'join_game'
+    return redirect(reverse('show_game'))
+
+
+@my_login_required
+def play_computer(request):
+    """
+    play_computer
+    ----------
+    Input parameters:
+        request: received request. Its GET parameter 'role' ('cat', the
+            default, or 'mouse') is the side the user plays.
+    ----------
+    Returns:
+        It redirects to "show_game"
+    ----------
+    Raises:
+        None
+    ----------
+    Description:
+        It starts a game of the user against the computer (see
+        datamodel/bot.py), which takes the other side. If the user is the
+        mouse the computer plays the first move of the cats right away.
+        User is required to be logged. Error 404 if there is no computer
+        opponent, because a person has its username.
+    """
+    computer = bot.get_user()
+    if computer is None:
+        counter_inc(request)
+        return HttpResponse('The computer cannot play.', status=404)
+    if request.GET.get('role') == rules.MOUSE:
+        game = Game.objects.create(cat_user=computer, mouse_user=request.user)
+        bot.play(game)
+    else:
+        game = Game.objects.create(cat_user=request.user, mouse_user=computer)
+    request.session[constants.GAME_SELECTED_SESSION_ID] = game.id
+    request.session['from'] = 'play_game'
+    return redirect(reverse('show_game'))
+
+
+def paginate_games(request, games):
+    """
+    paginate_games
+    ----------
+    Input parameters:
+        request: received request. Its GET parameters 'before' or 'after'
+            (game IDs) select the page
+        games: queryset of the games to list
+    ----------
+    Returns:
+        Tuple (page, prev_after, next_before): list with the games of the
+        page, newest first, and the 'after'/'before' values of the previous
+        and next pages (None if there are no more games that way)
+    ----------
+    Raises:
+        None
+    ----------
+    Description:
+        Keyset pagination by game ID: every page is a single indexed query
+        whatever the number of games, and the users of every game are
+        loaded in the same query.
+    """
+    games = games.select_related('cat_user', 'mouse_user')
+    n_games = settings.GAMES_PER_PAGE
+    try:
+        before = int(request.GET.get('before', 0))
+        after = int(request.GET.get('after', 0))
+    except ValueError:
+        before = after = 0
+
+    if after:
+        page = list(games.filter(id__gt=after).order_by('id')[:n_games + 1])
+        has_prev, has_next = len(page) > n_games, True
+        page = page[:n_games][::-1]
+    else:
+        if before:
+            games = games.filter(id__lt=before)
+        page = list(games.order_by('-id')[:n_games + 1])
+        has_prev, has_next = bool(before), len(page) > n_games
+        page = page[:n_games]
+
+    prev_after = page[0].id if page and has_prev else None
+    next_before = page[-1].id if page and has_next else None
+    return page, prev_after, next_before
+
+
+def render_game_list(request, games, action, error_msg):
+    """
+    render_game_list
+    ----------
+    Input parameters:
+        request: received request. Its GET parameters 'filter', 'cat' and
+            'mouse' select the games played as cat and/or as mouse
+        games: queryset of the games to list
+        action: join_game, play_game or replay_game
+        error_msg: message shown if there are no games at all
+    ----------
+    Returns:
+        It renders "mouse_cat/select_game.html" or "mouse_cat/error.html"
+    """
+    show_cat = 'filter' not in request.GET or 'cat' in request.GET
+    show_mouse = 'filter' not in request.GET or 'mouse' in request.GET
+    if action != 'join_game':
+        if not show_cat:
+            games = games.exclude(cat_user=request.user)
+        if not show_mouse:
+            games = games.exclude(mouse_user=request.user)
+
+    page, prev_after, next_before = paginate_games(request, games)
+    paginated = 'before' in request.GET or 'after' in request.GET
+    if not page and not paginated and show_cat and show_mouse:
+        context_dict = {}
+        context_dict[constants.ERROR_MESSAGE_ID] = error_msg
+        return render(request, "mouse_cat/error.html", context_dict)
+
+    filter_query = 'filter=1'
+    if show_cat:
+        filter_query += '&cat=on'
+    if show_mouse:
+        filter_query += '&mouse=on'
+    request.session['from'] = action
+    return render(request, "mouse_cat/select_game.html",
+                  {'games': page, 'action': action,
+                   'show_cat': show_cat, 'show_mouse': show_mouse,
+                   'filter_query': filter_query,
+                   'prev_after': prev_after, 'next_before': next_before})
+
+
 @my_login_required
 def join_game(request):
     """
@@ -338,15 +525,8 @@ def join_game(request):
     """
     pending_games = Game.objects.filter(mouse_user=None)
     pending_games = pending_games.exclude(cat_user=request.user)
-    pending_games = pending_games.order_by('-id')
-    if len(pending_games) == 0:
-        context_dict = {}
-        context_dict[constants.ERROR_MESSAGE_ID] = "There are no games to join"
-        return render(request, "mouse_cat/error.html", context_dict)
-
-    request.session['from'] = 'join_game'
-    return render(request, "mouse_cat/select_game.html",
-                  {'games': pending_games, 'action': 'join_game'})
+    return render_game_list(request, pending_games, 'join_game',
+                            "There are no games to join")
 
 
 @my_login_required
@@ -368,15 +548,9 @@ def play_game(request):
     """
     my_games = Game.objects.filter(Q(cat_user=request.user) |
                                    Q(mouse_user=request.user))
-    my_games = list(my_games.filter(status=GameStatus.ACTIVE))
-    if len(my_games) == 0:
-        context_dict = {}
-        context_dict[constants.ERROR_MESSAGE_ID] = "There are no games to play"
-        return render(request, "mouse_cat/error.html", context_dict)
-
-    request.session['from'] = 'play_game'
-    return render(request, "mouse_cat/select_game.html",
-                  {'games': my_games, 'action': 'play_game'})
+    my_games = my_games.filter(status=GameStatus.ACTIVE)
+    return render_game_list(request, my_games, 'play_game',
+                            "There are no games to play")
 
 
 @my_login_required
@@ -398,15 +572,9 @@ def replay_game(request):
     """
     my_games = Game.objects.filter(Q(cat_user=request.user) |
                                    Q(mouse_user=request.user))
-    my_games = list(my_games.filter(status=GameStatus.FINISHED))
-    if len(my_games) == 0:
-        context_dict = {}
-        context_dict[constants.ERROR_MESSAGE_ID] = "No games to replay"
-        return render(request, "mouse_cat/error.html", context_dict)
-
-    request.session['from'] = 'replay_game'
-    return render(request, "mouse_cat/select_game.html",
-                  {'games': my_games, 'action': 'replay_game'})
+    my_games = my_games.filter(status=GameStatus.FINISHED)
+    return render_game_list(request, my_games, 'replay_game',
+                            "No games to replay")
 
 
 @my_login_required
@@ -441,14 +609,13 @@ def select_game(request, action, game_id=None):
         else:
             counter_inc(request)
             return HttpResponse('Selected game does not exist.', status=404)
-        game = Game.objects.filter(id=game_id, status=status)
-        if len(game):
-            game = game[0]
-            if action == 'join_game':
-                game.mouse_user = request.user
-                game.save()
+        if action == 'join_game':
+            game = Game.objects.claim(game_id, request.user)
+        else:
+            game = Game.objects.filter(id=game_id, status=status).first()
+        if game is not None:
             if action == 'replay_game':
-                request.session['move_counter'] = -1
+                request.ephemeral['move_counter'] = -1
 
             return redirect(reverse('show_game'))
     else:
@@ -490,24 +657,60 @@ def show_game(request):
 
     try:
         game_id = request.session.get(constants.GAME_SELECTED_SESSION_ID)
-        game = Game.objects.get(id=game_id)
+        game = game_cache.get_game(game_id)
     except Game.DoesNotExist:
         return redirect(reverse('index'))
 
     if request.session.get('from') == 'replay_game':
-        request.session['move_counter'] = -1
-        board = [0]*constants.BOARD_SIZE
-        board[0] = board[2] = board[4] = board[6] = 1
-        board[59] = -1
+        request.ephemeral['move_counter'] = -1
+        position = rules.INITIAL_POSITION
     else:
-        board = [0]*constants.BOARD_SIZE
-        board[game.mouse] = -1
-        for i in game._get_cat_places():
-            board[i] = 1
-    context_dict = {'board': board, 'game': game, 'move_form': MoveForm()}
+        position = game.position
+    context_dict = board_context(position)
+    context_dict.update({'game': game, 'move_form': MoveForm()})
     return render(request, "mouse_cat/game.html", context_dict)
 
 
+def board_cells(position):
+    """
+    board_cells
+    ----------
+    Input parameters:
+        position: rules.Position
+    ----------
+    Returns:
+        List with the 64 cells of the board: 1 for a cat, -1 for the mouse
+        and 0 if empty
+    """
+    board = [0]*constants.BOARD_SIZE
+    board[position.mouse] = -1
+    for cell in position.cats:
+        board[cell] = 1
+    return board
+
+
+def board_context(position):
+    """
+    board_context
+    ----------
+    Input parameters:
+        position: rules.Position drawn on the board
+    ----------
+    Returns:
+        Context of the board fragment of "mouse_cat/game.html"
+    ----------
+    Description:
+        The rendered board is cached by position, so the cells are only
+        built (the 'board' callable) when a position is drawn for the first
+        time. The cells are the same whatever the order of the cats and
+        whoever looks at them, so the key is the sorted cats and the mouse.
+    """
+    board_key = '%s-%d' % ('.'.join(map(str, sorted(position.cats))),
+                           position.mouse)
+    return {'board': lambda: board_cells(position), 'board_key': board_key,
+            'board_cache_seconds': settings.BOARD_CACHE_SECONDS}
+
+
 @my_login_required
 def move(request):
     """
@@ -538,7 +741,7 @@ def move(request):
         counter_inc(request)
         return HttpResponse('Invalid method.', status=404)
     game_id = request.session.get(constants.GAME_SELECTED_SESSION_ID)
-    game = Game.objects.get(id=game_id)
+    game = game_cache.get_game(game_id)
 
     origin = int(request.POST.get('origin'))
     target = int(request.POST.get('target'))
@@ -548,12 +751,14 @@ def move(request):
         move.save()
     except ValidationError as err:
         move_form.add_error('origin', err.messages[0])
-        board = [0]*constants.BOARD_SIZE
-        board[game.mouse] = -1
-        for i in game._get_cat_places():
-            board[i] = 1
-        context_dict = {'board': board, 'game': game, 'move_form': move_form}
+        context_dict = board_context(game.position)
+        context_dict.update({'game': game, 'move_form': move_form})
         return render(request, "mouse_cat/game.html", context_dict)
+    try:
+        # Answer of the computer, in games against it
+        bot.play(game)
+    except ValidationError:
+        pass
     return redirect(reverse('show_game'))
 
 
@@ -589,31 +794,333 @@ def get_move(request):
         return HttpResponse('No game selected.', status=404)
     shift = int(request.POST.get('shift'))
     game_id = request.session.get(constants.GAME_SELECTED_SESSION_ID)
-    game = Game.objects.get(id=game_id)
+    game = game_cache.get_game(game_id)
 
-    if request.session.get('move_counter') is not None:
-        move_idx = int(request.session.get('move_counter'))
-    else:
-        request.session['move_counter'] = move_idx = -1
-
-    move_list = list(game.moves)
-    n_moves = len(move_list)
-    if shift > 0:
-        move_idx += shift
-        move = move_list[move_idx]
-        request.session['move_counter'] = move_idx
-        resp = {'origin': move.origin, 'target': move.target, 'previous': True,
-                'next': move_idx < n_moves - 1}
-    else:
-        move = move_list[move_idx]
-        move_idx += shift
-        request.session['move_counter'] = move_idx
-        resp = {'origin': move.target, 'target': move.origin,
-                'previous': move_idx >= 0, 'next': True}
+    move_idx = int(request.ephemeral.get('move_counter', -1))
+
+    n_moves = game.ply
+    try:
+        if shift > 0:
+            move_idx += shift
+            move = game.get_move(move_idx + 1)
+            request.ephemeral['move_counter'] = move_idx
+            resp = {'origin': move.origin, 'target': move.target,
+                    'previous': True, 'next': move_idx < n_moves - 1}
+        else:
+            move = game.get_move(move_idx + 1)
+            move_idx += shift
+            request.ephemeral['move_counter'] = move_idx
+            resp = {'origin': move.target, 'target': move.origin,
+                    'previous': move_idx >= 0, 'next': True}
+    except Move.DoesNotExist:
+        counter_inc(request)
+        return HttpResponse('Move does not exist.', status=404)
 
     return JsonResponse(resp, status=200)
 
 
+@my_login_required
+def state(request):
+    """
+    state
+    ----------
+    Input parameters:
+        request: received request. It cointains the logged user and the
+            selected game
+    ----------
+    Returns:
+        A response containing a json with fields:
+            id
+            version
+            cats
+            mouse
+            cat_turn
+            status
+            winner
+            cat_user
+            mouse_user
+        or an empty 304 response if the game has not changed since the
+        version in the If-None-Match header.
+    ----------
+    Raises:
+        None
+    ----------
+    Description:
+        Lightweight endpoint for clients waiting for their turn. The ETag
+        of the response is derived from the game version, so polling an
+        unchanged game only costs a 304.
+    """
+    if not request.session.get(constants.GAME_SELECTED_SESSION_ID):
+        counter_inc(request)
+        return HttpResponse('No game selected.', status=404)
+    game_id = request.session.get(constants.GAME_SELECTED_SESSION_ID)
+    try:
+        game = game_cache.get_game(game_id)
+    except Game.DoesNotExist:
+        counter_inc(request)
+        return HttpResponse('Selected game does not exist', status=404)
+
+    etag = '"%d-%d"' % (game.id, game.version)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(game_state(game), status=200)
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@my_login_required
+def hint(request):
+    """
+    hint
+    ----------
+    Input parameters:
+        request: received request. It cointains the logged user and the
+            selected game
+    ----------
+    Returns:
+        A response containing a json with fields:
+            origin
+            target
+            winner
+            plies
+            score
+            source
+        or Error 404 if there is no game selected or it is not the turn of
+        the user in an active game.
+    ----------
+    Raises:
+        None
+    ----------
+    Description:
+        Best move for the player to move and the evaluation of the position
+        (see datamodel/hints.py). The game is read from the game cache and
+        the hints of positions already asked for are cached, so it does not
+        query the database.
+    """
+    if not request.session.get(constants.GAME_SELECTED_SESSION_ID):
+        counter_inc(request)
+        return HttpResponse('No game selected.', status=404)
+    game_id = request.session.get(constants.GAME_SELECTED_SESSION_ID)
+    try:
+        game = game_cache.get_game(game_id)
+    except Game.DoesNotExist:
+        counter_inc(request)
+        return HttpResponse('Selected game does not exist', status=404)
+
+    position = game.position
+    if position.side_to_move == rules.CAT:
+        player = game.cat_user
+    else:
+        player = game.mouse_user
+    if game.status != GameStatus.ACTIVE or player != request.user:
+        counter_inc(request)
+        return HttpResponse('It is not your turn.', status=404)
+    return JsonResponse(hints.hint(position), status=200)
+
+
+def game_state(game):
+    """
+    game_state
+    ----------
+    Input parameters:
+        game: Game, with its users already loaded
+    ----------
+    Returns:
+        Dictionary with the public state of the game, as sent to clients
+    """
+    return {'id': game.id,
+            'version': game.version,
+            'cats': game._get_cat_places(),
+            'mouse': game.mouse,
+            'cat_turn': game.cat_turn,
+            'status': game.status,
+            'winner': game.winner.username if game.winner else None,
+            'cat_user': game.cat_user.username,
+            'mouse_user': (game.mouse_user.username if game.mouse_user
+                           else None)}
+
+
+@my_login_required
+def game_events(request):
+    """
+    game_events
+    ----------
+    Input parameters:
+        request: received request. It cointains the logged user and the
+            selected game
+    ----------
+    Returns:
+        A text/event-stream response
+    ----------
+    Raises:
+        None
+    ----------
+    Description:
+        Server-sent events stream of the selected game, for the player
+        waiting for the move of the other one. It sends a 'state' event
+        (same data as the state endpoint) on connection and then every
+        time a move is committed, and ends when it is the turn of the user
+        or the game finishes, so no worker is held meanwhile. The stream
+        waits on the events broker, so an idle game costs no queries.
+    """
+    if not request.session.get(constants.GAME_SELECTED_SESSION_ID):
+        counter_inc(request)
+        return HttpResponse('No game selected.', status=404)
+    game_id = request.session.get(constants.GAME_SELECTED_SESSION_ID)
+    if not Game.objects.filter(id=game_id).exists():
+        counter_inc(request)
+        return HttpResponse('Selected game does not exist', status=404)
+    try:
+        last_version = int(request.META.get('HTTP_LAST_EVENT_ID'))
+    except (TypeError, ValueError):
+        last_version = -1
+
+    response = StreamingHttpResponse(
+        game_event_stream(game_id, last_version, request.user.id),
+        content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def game_event_stream(game_id, version, user_id=None):
+    """
+    game_event_stream
+    ----------
+    Input parameters:
+        game_id: ID of the game
+        version: last version the client has seen (-1 if none)
+        user_id: ID of the user streaming, whose turn ends the stream
+    ----------
+    Returns:
+        Generator of server-sent events
+    """
+    deadline = time.time() + settings.GAME_EVENTS_MAX_SECONDS
+    broker = events.get_broker()
+    check_db = True
+    while time.time() < deadline:
+        if check_db:
+            game = game_cache.get_game(game_id)
+            # Do not hold a database connection while idle
+            close_old_connections()
+            finished = game.status == GameStatus.FINISHED
+            if game.cat_turn:
+                player = game.cat_user
+            else:
+                player = game.mouse_user
+            user_turn = player is not None and player.id == user_id
+            # The final state is always sent, it tells the client to stop
+            if game.version > version or finished or user_turn:
+                version = game.version
+                yield 'id: %d\nevent: state\ndata: %s\n\n' % (
+                    version, json.dumps(game_state(game)))
+            if finished or user_turn:
+                return
+        new_version = events.wait(game_id, version)
+        if new_version is None:
+            yield ': keep-alive\n\n'
+        check_db = new_version is not None or not broker.cross_process
+
+
+@my_login_required
+def replay_log(request, game_id):
+    """
+    replay_log
+    ----------
+    Input parameters:
+        request: received request. It cointains the logged user
+        game_id: ID of a finished game of the user
+    ----------
+    Returns:
+        A response containing a json with fields:
+            initial: cats and mouse cells before the first move
+            moves: base64 string with one byte per move (see
+                rules.pack_move)
+            winner
+    ----------
+    Raises:
+        None
+    ----------
+    Description:
+        Provides the whole move log of a finished game of the user in one
+        request, so the client can replay it locally. Finished games never
+        change, so the response can be cached by the browser. Games of
+        other players do not exist for the user.
+    """
+    if request.method != 'GET':
+        counter_inc(request)
+        return HttpResponse('Invalid method.', status=404)
+    try:
+        game = Game.objects.select_related('winner').filter(
+            Q(cat_user=request.user) | Q(mouse_user=request.user)).get(
+                id=game_id, status=GameStatus.FINISHED)
+    except Game.DoesNotExist:
+        counter_inc(request)
+        return HttpResponse('Selected game does not exist', status=404)
+
+    moves = list(game.moves.values_list('origin', 'target'))
+    initial = game.position
+    for origin, target in reversed(moves):
+        initial = rules.undo_move(initial, origin, target)
+    packed = base64.b64encode(rules.pack_moves(moves)).decode('ascii')
+    resp = {'initial': {'cats': initial.cats, 'mouse': initial.mouse},
+            'moves': packed,
+            'winner': game.winner.username if game.winner else None}
+    response = JsonResponse(resp, status=200)
+    patch_cache_control(response, private=True,
+                        max_age=settings.REPLAY_CACHE_SECONDS)
+    return response
+
+
+@my_login_required
+def board(request, game_id, ply):
+    """
+    board
+    ----------
+    Input parameters:
+        request: received request. It cointains the logged user
+        game_id: ID of a game of the user
+        ply: number of moves played (0 is the initial board)
+    ----------
+    Returns:
+        A response containing a json with fields:
+            ply
+            n_plies: moves played in the whole game
+            cats
+            mouse
+            cat_turn
+    ----------
+    Raises:
+        None
+    ----------
+    Description:
+        Provides the board of a game of the user at any point of its
+        history. It is rebuilt from the closest keyframe, so jumping to any
+        ply of a long game only replays a few moves. Games of other players
+        do not exist for the user.
+    """
+    if request.method != 'GET':
+        counter_inc(request)
+        return HttpResponse('Invalid method.', status=404)
+    try:
+        game = Game.objects.filter(
+            Q(cat_user=request.user) | Q(mouse_user=request.user)).get(
+                id=game_id)
+        position = game.position_at(ply)
+    except (Game.DoesNotExist, ValueError):
+        counter_inc(request)
+        return HttpResponse('Selected board does not exist', status=404)
+
+    resp = {'ply': ply, 'n_plies': game.ply, 'cats': position.cats,
+            'mouse': position.mouse, 'cat_turn': position.cat_turn}
+    response = JsonResponse(resp, status=200)
+    if game.status == GameStatus.FINISHED:
+        patch_cache_control(response, private=True,
+                            max_age=settings.REPLAY_CACHE_SECONDS)
+    return response
+
+
 @my_login_required
 def game_status(request):
     """
@@ -637,7 +1144,7 @@ def game_status(request):
     """
     if request.session.get(constants.GAME_SELECTED_SESSION_ID):
         game_id = request.session.get(constants.GAME_SELECTED_SESSION_ID)
-        game = Game.objects.get(id=game_id)
+        game = game_cache.get_game(game_id)
         if game.winner:
             winner = game.winner.username
         else:
@@ -645,3 +1152,170 @@ def game_status(request):
         return JsonResponse({'status': game.status, 'winner': winner},
                             status=200)
     return HttpResponse('Selected game does not exist', status=404)
+
+
+def player_stats(user_stats):
+    """
+    player_stats
+    ----------
+    Input parameters:
+        user_stats: UserStats, with its user already loaded
+    ----------
+    Returns:
+        Dictionary with the stats of the player, as sent to clients
+    """
+    return {'username': user_stats.user.username,
+            'games': user_stats.games,
+            'wins': user_stats.wins,
+            'cat_wins': user_stats.cat_wins,
+            'mouse_wins': user_stats.mouse_wins,
+            'average_length': round(user_stats.average_length, 1),
+            'streak': user_stats.streak,
+            'best_streak': user_stats.best_streak}
+
+
+@my_login_required
+def leaderboard(request):
+    """
+    leaderboard
+    ----------
+    Input parameters:
+        request: received request. It cointains the logged user and may
+            have the GET parameter 'limit', the number of players (at most
+            settings.LEADERBOARD_SIZE, the default)
+    ----------
+    Returns:
+        A response containing a json with fields:
+            players: list of the stats of the best players, with fields
+                rank, username, games, wins, cat_wins, mouse_wins,
+                average_length, streak and best_streak
+            user: stats of the logged user, or null if it has not finished
+                any game
+        or Error 404 if the limit is not valid.
+    ----------
+    Raises:
+        None
+    ----------
+    Description:
+        Players with the most wins, then with the fewest games. The stats
+        are updated as games finish (see datamodel/stats.py), so this reads
+        the first rows of their leaderboard index and the row of the user.
+    """
+    try:
+        limit = int(request.GET.get('limit', settings.LEADERBOARD_SIZE))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= settings.LEADERBOARD_SIZE:
+        counter_inc(request)
+        return HttpResponse('Invalid limit.', status=404)
+    players = []
+    for rank, user_stats in enumerate(stats.leaderboard(limit), 1):
+        players.append(dict(player_stats(user_stats), rank=rank))
+    try:
+        user = player_stats(UserStats.objects.select_related('user').get(
+            user=request.user))
+    except UserStats.DoesNotExist:
+        user = None
+    return JsonResponse({'players': players, 'user': user}, status=200)
+
+
+@metrics_access_required
+def request_metrics(request):
+    """
+    request_metrics
+    ----------
+    Input parameters:
+        request: received request
+    ----------
+    Returns:
+        A response containing a json with the seconds the metrics cover and,
+        for every view, its requests, errors, latency (mean, p50, p95 and
+        p99 in ms), mean queries and mean database time (ms)
+    ----------
+    Raises:
+        None
+    ----------
+    Description:
+        Request metrics of this process, recorded by
+        logic.middleware.MetricsMiddleware. Staff only.
+    """
+    return JsonResponse(metrics.registry.as_dict(), status=200)
+
+
+@metrics_access_required
+def prometheus_metrics(request):
+    """
+    prometheus_metrics
+    ----------
+    Input parameters:
+        request: received request
+    ----------
+    Returns:
+        The request metrics of this process in the Prometheus text format
+    ----------
+    Raises:
+        None
+    ----------
+    Description:
+        Scrape endpoint for Prometheus. Staff only, or with the token of
+        settings.METRICS_TOKEN.
+    """
+    return HttpResponse(metrics.registry.prometheus(),
+                        content_type='text/plain; version=0.0.4')
+
+
+@metrics_access_required
+def profiles(request):
+    """
+    profiles
+    ----------
+    Input parameters:
+        request: received request
+    ----------
+    Returns:
+        A response containing a json with the list 'profiles' of the stored
+        request profiles, newest first, with fields:
+            name
+            view
+            ms
+            created
+            size
+    ----------
+    Raises:
+        None
+    ----------
+    Description:
+        Lists the profiles taken by logic.middleware.ProfilingMiddleware.
+        Staff only.
+    """
+    return JsonResponse({'profiles': profiling.list_profiles()}, status=200)
+
+
+@metrics_access_required
+def profile(request, name):
+    """
+    profile
+    ----------
+    Input parameters:
+        request: received request. With the GET parameter 'format=text' the
+            profile is returned as a pstats report
+        name: name of the profile
+    ----------
+    Returns:
+        The pstats file of the profile or its report as text
+    ----------
+    Raises:
+        None
+    ----------
+    Description:
+        Downloads a profile taken by logic.middleware.ProfilingMiddleware.
+        Staff only.
+    """
+    path = profiling.path_of(name)
+    if path is None or not os.path.exists(path):
+        counter_inc(request)
+        return HttpResponse('Profile does not exist', status=404)
+    if request.GET.get('format') == 'text':
+        return HttpResponse(profiling.as_text(name),
+                            content_type='text/plain')
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=name)
@@ -1,40 +1,123 @@
 $( function() {
-    var reload_id;
+    var reload_id, source;
+    var role = $('#turn-info').data('role');
+    var cat_token = $('#cat-drag').first().clone();
+    var mouse_token = $('#mouse-drag').first().clone();
+
+    function render(state) {
+        // Board
+        $('[id^=cell_]').children().remove();
+        for (c of state.cats) {
+            $('#cell_'+c).html(cat_token.clone());
+        }
+        $('#cell_'+state.mouse).html(mouse_token.clone());
+
+        // Turn
+        $('#draggable').remove();
+        $('.hint-cell').removeClass('hint-cell');
+        $('#hint').hide();
+        if (state.status == 2) {
+            $('#user-turn').html('');
+            $('#winner-title').html(state.winner + ' won the game!');
+            $(".alert-winner").attr('style', false);
+            return false;
+        }
+        turn = state.cat_turn ? 'cat' : 'mouse';
+        if (turn == role) {
+            $('#turn-info').append('<div id="draggable">' + role + '</div>');
+            $('#user-turn').html('Your turn');
+            $('#hint').show();
+            enableDrag();
+            return false;
+        }
+        turn_user = state.cat_turn ? state.cat_user : state.mouse_user;
+        $('#user-turn').html(turn_user + "'s turn");
+        return true;
+    }
 
-    function reload() {
+    function wait() {
+        // Waiting for the other player: the server pushes the next state,
+        // or it is polled every second without streams
+        if (window.EventSource) {
+            if (!source) {
+                listen();
+            }
+        } else {
+            reload_id = setTimeout(reload, 1000);
+        }
+    }
 
-        $('#turn-info').load('/mouse_cat/show_game #turn-info', function () {
-            $('#chess_board').load('/mouse_cat/show_game #chess_board', function () {
-                user = $('#draggable').html()
-                if (user) {
+    function stopWaiting() {
+        clearTimeout(reload_id);
+        if (source) {
+            source.close();
+            source = null;
+        }
+    }
 
-                    $("[id^="+user+"-drag]").draggable(
-                            {
-                                revert: "invalid",
-                                start: calcDrop,
-                                stop: removeDrop
-                            }
-                        );
-                    clearTimeout(reload_id);
+    function listen() {
+        // The server pushes the game state on every change, and ends the
+        // stream on the turn of the user
+        source = new EventSource("/mouse_cat/events");
+        source.addEventListener('state', function (event) {
+            if (!render(JSON.parse(event.data))) {
+                stopWaiting();
+            }
+        });
+        source.onerror = function () {
+            // Closed by the server or broken: poll, which opens a new
+            // stream if the user is still waiting
+            stopWaiting();
+            reload_id = setTimeout(reload, 1000);
+        };
+    }
 
+    function reload(force) {
+        clearTimeout(reload_id);
+        // Unless forced, the server answers 304 while the game version
+        // does not change
+        $.ajax({
+            type: 'GET',
+            url: "/mouse_cat/state",
+            ifModified: !force,
+            success: function (result, status) {
+                waiting = true;
+                if (status != 'notmodified') {
+                    waiting = render(result);
+                }
+                if (waiting) {
+                    wait();
                 } else {
-                    reload_id = setTimeout(reload, 1000);
-
+                    stopWaiting();
                 }
-            });
+            }
         });
+    };
 
+    function showHint() {
+        // Best move for the player, lit on the board
         $.ajax({
             type: 'GET',
-            url: "/mouse_cat/game_status",
-            success: function (result) {
-                if (result.status == 2){
-                    $('#winner-title').html(result.winner + ' won the game!');
-                    $(".alert-winner").attr('style', false);
+            url: "/mouse_cat/hint",
+            success: function (hint) {
+                $('.hint-cell').removeClass('hint-cell');
+                if (hint.origin !== null) {
+                    $('#cell_'+hint.origin).addClass('hint-cell');
+                    $('#cell_'+hint.target).addClass('hint-cell');
                 }
             }
         });
-    };
+    }
+
+    function enableDrag() {
+        $("[id^="+role+"-drag]").draggable(
+                {
+                    revert: "invalid",
+                    start: calcDrop,
+                    stop: removeDrop
+                }
+            );
+    }
 
     function targetPos(x, y, inc_x, inc_y) {
         tg_x = x + inc_x;
@@ -52,15 +135,7 @@ $( function() {
         target = $(this).attr('id').split('_')[1];
         ui.draggable.remove();
 
-        user = $('#draggable').html()
-
-        $("[id^="+user+"-drag]").draggable(
-                {
-                    revert: "invalid",
-                    start: calcDrop,
-                    stop: removeDrop
-                }
-            );
+        enableDrag();
 
         //Send AJAX petition
         csfrVal = $('[name=csrfmiddlewaretoken]').attr('value');
@@ -73,7 +148,7 @@ $( function() {
                 'csrfmiddlewaretoken': csfrVal
                 },
             complete: function () {
-                reload();
+                reload(true);
             }
             });
     }
@@ -118,17 +193,11 @@ $( function() {
 
 
     // INITIALIZATIONS
-    user = $('#draggable').html()
-    if (user) {
-
-        $("[id^="+user+"-drag]").draggable(
-                {
-                    revert: "invalid",
-                    start: calcDrop,
-                    stop: removeDrop
-                }
-            );
+    $('#hint').click(showHint);
+    if ($('#draggable').html()) {
+        $('#hint').show();
+        enableDrag();
     } else {
-        reload();
+        reload(true);
     }
 });
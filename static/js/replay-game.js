@@ -1,35 +1,55 @@
 $( function () {
-    var next=true, prev=false, pause=true, interval_id;
+    // Whole move log, downloaded once: [[origin, target], ...]
+    var moves = [];
+    var ply = 0, winner = null;
+    var pause = true, interval_id;
+    // Directions of the low 2 bits of every packed move: SE, SW, NW, NE
+    var steps = [9, 7, -9, -7];
 
-    function nextMove(csfrVal) {
-        csfrVal = $('[name=csrfmiddlewaretoken]').attr('value');
-        if (next){
-            $.ajax({
-                type: 'POST',
-                url: "/mouse_cat/get_move",
-                data: {
-                    'shift': 1,
-                    'csrfmiddlewaretoken': csfrVal
-                },
-                success: function (result) {
-                    og = result.origin;
-                    tg = result.target;
-                    next = result.next;
-                    prev = result.previous
+    function unpack(packed) {
+        var bytes = atob(packed);
+        var log = [];
+        for (var i = 0; i < bytes.length; i++) {
+            var code = bytes.charCodeAt(i);
+            var origin = code >> 2;
+            log.push([origin, origin + steps[code & 3]]);
+        }
+        return log;
+    }
+
+    function drawInitial(initial) {
+        cat = $('#cat-drag').first().clone();
+        mouse = $('#mouse-drag').first().clone();
+        $('[id^=cell_]').children().remove();
+        for (c of initial.cats) {
+            $('#cell_'+c).html(cat.clone());
+        }
+        $('#cell_'+initial.mouse).html(mouse);
+    }
+
+    function moveToken(og, tg) {
+        token = $('#cell_'+og).children()[0];
+        $('#cell_'+og).children().remove();
+        $('#cell_'+tg).html(token);
+    }
 
+    function updateButtons() {
+        $('[name=next]').attr('disabled', ply >= moves.length);
+        $('[name=prev]').attr('disabled', ply <= 0);
+    }
 
-                    token = $('#cell_'+og).children()[0];
-                    $('#cell_'+og).children().remove();
-                    $('#cell_'+tg).html(token);
-                    $('[name=next]').attr('disabled', !next);
-                    $('[name=prev]').attr('disabled', !prev);
-                    if (!next) {
-                        $("#winner-title").html($('#game-finished').attr('value') + ' won the game!');
-                        $(".alert-winner").attr('style', false);
-                        $('[name=play-pause]').html("▶️");
-                    }
-                }
-            });
+    function nextMove() {
+        if (ply < moves.length) {
+            moveToken(moves[ply][0], moves[ply][1]);
+            ply++;
+            updateButtons();
+            if (ply == moves.length) {
+                $("#winner-title").html(winner + ' won the game!');
+                $(".alert-winner").attr('style', false);
+                pause = true;
+                $('[name=play-pause]').html("▶️");
+                clearInterval(interval_id);
+            }
         } else {
             pause = true;
             $('[name=play-pause]').html("▶️");
@@ -37,44 +57,31 @@ $( function () {
         }
     };
 
-    $('[name=next]').click(
-        function () {
-            csfrVal = $('[name=csrfmiddlewaretoken]').attr('value');
-            nextMove(csfrVal);
+    function prevMove() {
+        if (ply > 0) {
+            ply--;
+            moveToken(moves[ply][1], moves[ply][0]);
+            updateButtons();
         }
-    );
-    $('[name=prev]').click(
-        function () {
-            csfrVal = $('[name=csrfmiddlewaretoken]').attr('value');
-            if (prev){
-                $.ajax({
-                    type: 'POST',
-                    url: "/mouse_cat/get_move",
-                    data: {
-                        'shift': -1,
-                        'csrfmiddlewaretoken': csfrVal
-                    },
-                    success: function (result) {
-                        og = result.origin;
-                        tg = result.target;
-                        next = result.next;
-                        prev = result.previous;
-
+    };
 
-                        token = $('#cell_'+og).children()[0];
-                        $('#cell_'+og).children().remove();
-                        $('#cell_'+tg).html(token);
-                        $('[name=next]').attr('disabled', !next);
-                        $('[name=prev]').attr('disabled', !prev);
-                    }
-                });
-            }
+    $('[name=next]').attr('disabled', true);
+    $.ajax({
+        type: 'GET',
+        url: "/mouse_cat/replay_log/" + $('#turn-info').data('game-id'),
+        success: function (result) {
+            moves = unpack(result.moves);
+            winner = result.winner;
+            drawInitial(result.initial);
+            updateButtons();
         }
-    );
+    });
+
+    $('[name=next]').click(nextMove);
+    $('[name=prev]').click(prevMove);
 
     $('[name=play-pause]').click(
         function () {
-            csfrVal = $('[name=csrfmiddlewaretoken]').attr('value');
             if (pause){
                 pause = !pause;
                 $(this).html("⏸️");